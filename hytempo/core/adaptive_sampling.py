@@ -0,0 +1,192 @@
+import numpy as np
+
+from hytempo.core.surrogate import Surrogate
+from hytempo.core.swarm_table import SwarmTable
+from hytempo.core.trajectory_estimator import run_swarm
+
+
+class AdaptiveSweep:
+    """! Adaptive sweep of the design space of a rocket factory.
+    An initial Sobol sample of the swarm is simulated, then a surrogate of the metrics is fitted to the results and
+    every further batch is chosen from candidate points of the same Sobol sequence where the surrogate predicts the
+    largest change of the metrics. The sweep stops when the simulation budget is spent or the cross validated error of
+    the surrogate drops below a tolerance. The metrics are compared relative to their standard deviation, so several
+    metrics can be refined together.
+    Two criteria are available:
+    - "gradient": magnitude of the surrogate gradient times the distance to the nearest simulated design, i.e. the
+      expected change of the metrics between the candidate and the known designs
+    - "uncertainty": predicted standard deviation of a Gaussian process surrogate, or for RBF surrogates the cross
+      validation error of the nearest simulated design, times the distance to the nearest simulated design
+    """
+
+    def __init__(self,
+                 factory,
+                 hdf_file,
+                 metrics: tuple = ("apogee", "max_velocity", "max_ma"),
+                 criterion: str = "gradient",
+                 nCandidates: int = 1024,
+                 surrogateKind: str = "rbf",
+                 folds: int = 5,
+                 workers: int = None,
+                 batch: bool = False,
+                 estimator_kwargs: dict = None,
+                 mode: str = "ascent"):
+        """! Constructor of the adaptive sweep.
+        @param factory: Rocket factory with sample_swarm, e.g. Liquid_CEA_TypeVTank_RegNitrous
+        @param hdf_file: Open HDF5 results file, the simulated rockets and the swarm table are written to it
+        @param metrics: Names of the metrics in the metrics dataset the surrogate is fitted to
+        @param criterion: Criterion the candidates are ranked with, "gradient" or "uncertainty"
+        @param nCandidates: Number of candidate points drawn from the sequence for every batch
+        @param surrogateKind: Kind of the surrogate, "rbf" or "gp", see Surrogate
+        @param folds: Number of folds of the cross validation
+        @param workers: Number of worker processes of run_swarm, defaults to the number of CPUs
+        @param batch: If True, the batches are integrated with the BatchTrajectoryEstimator
+        @param estimator_kwargs: Keyword arguments passed on to the estimators
+        @param mode: Integration mode, "full" or "ascent", defaults to ascent as all metrics are reached in the ascent
+        """
+        if criterion not in ("gradient", "uncertainty"):
+            raise ValueError(f"Error: Unknown criterion '{criterion}', use 'gradient' or 'uncertainty'")
+        self.factory = factory
+        self.file = hdf_file
+        self.metrics = tuple(metrics)
+        self.criterion = criterion
+        self.n_candidates = nCandidates
+        self.surrogate_kind = surrogateKind
+        self.folds = folds
+        self.workers = workers
+        self.batch = batch
+        self.estimator_kwargs = estimator_kwargs
+        self.mode = mode
+        self.table = None
+        self.results = np.empty((0, len(self.metrics)))
+        self.group_names = []
+        self.history = []
+        self.surrogate = None
+
+    def run(self, initialSize: int, batchSize: int, budget: int, tolerance: float = 0.0, seed: int = -1,
+            **swarmKwargs):
+        """! Runs the adaptive sweep.
+        @param initialSize: Number of rockets of the initial sample
+        @param batchSize: Number of rockets added per iteration
+        @param budget: Maximum total number of simulated rockets
+        @param tolerance: Relative cross validation error of the surrogate the sweep stops at, defaults to 0 (budget only)
+        @param seed: Seed of the Sobol sequence, a random seed is drawn if negative
+        @param swarmKwargs: Parameters of the swarm as for sample_swarm, e.g. the bounds and the component list
+        @return: SwarmTable of all simulated designs with a column per metric
+        """
+        self.table = self.factory.sample_swarm(hdf_file=self.file, nRockets=min(initialSize, budget),
+                                               sampler="sobol", seed=seed, **swarmKwargs)
+        self.simulate(self.table)
+        parameterList = self.factory.get_parameter_list(self.table)
+        bounds = np.array([param for param in parameterList if isinstance(param, list)], dtype="float64")
+
+        while True:
+            self.surrogate = self.fit()
+            error = max(self.surrogate.cv_error.values())
+            self.history.append({"simulations": len(self.table), "error": dict(self.surrogate.cv_error)})
+            print(f"Adaptive sweep: {len(self.table)} rockets, cross validation error {error:.4f}")
+            if len(self.table) >= budget or error <= tolerance:
+                break
+            # candidates are the next points of the sequence of the swarm
+            start = int(self.table.settings["sequencePosition"])
+            candidates = self.factory.draw_samples("sobol", len(bounds), self.n_candidates,
+                                                   int(self.table.settings["seed"]), start)
+            self.table.settings["sequencePosition"] = start + self.n_candidates
+            chosen = self.select(candidates, self.surrogate, min(batchSize, budget - len(self.table)))
+            newTable = self.factory.size_table(parameterList, candidates[chosen], start, self.table.settings)
+            newTable.set_column("sample", start + chosen)
+            self.table = self.table.concatenate(newTable)
+            self.simulate(newTable)
+
+        self.table.to_hdf5(self.file)
+        result = SwarmTable(dict(self.table.columns), self.table.settings)
+        for i, metric in enumerate(self.metrics):
+            result.set_column(metric, self.results[:, i])
+        return result
+
+    def simulate(self, table: SwarmTable):
+        """! Simulates the rockets of a table and appends their metrics to the results.
+        @param table: SwarmTable of the designs to simulate
+        """
+        names = run_swarm(self.factory.iter_table(table), self.file, workers=self.workers, batch=self.batch,
+                          estimator_kwargs=self.estimator_kwargs, mode=self.mode)
+        self.group_names.extend(names)
+        self.results = np.vstack([self.results, self.read_metrics(names)])
+
+    def read_metrics(self, names: list):
+        """! Reads the metrics of simulated rockets from the results file.
+        @param names: Names of the rocket groups
+        @return: Array of shape (number of rockets, number of metrics), NaN for failed simulations without metrics
+        """
+        values = np.full((len(names), len(self.metrics)), np.nan)
+        for i, name in enumerate(names):
+            if "metrics" not in self.file[name]:
+                continue
+            dataset = self.file[name]["metrics"]
+            columns = [col.decode() if isinstance(col, bytes) else col for col in dataset.attrs["columns"]]
+            values[i] = [dataset[columns.index(metric)] for metric in self.metrics]
+        return values
+
+    def valid(self):
+        """! Returns the mask of the simulated designs with finite metrics, failed simulations are left out of the fit.
+        @return: Boolean array of shape (number of designs,)
+        """
+        return np.isfinite(self.results).all(axis=1)
+
+    def unit_coordinates(self, validOnly: bool = True):
+        """! Returns the variable parameters of the simulated designs scaled to the unit hypercube.
+        @param validOnly: Only return the designs with finite metrics, defaults to True
+        @return: Array of shape (number of designs, number of variable parameters)
+        """
+        parameterList = self.factory.get_parameter_list(self.table)
+        coordinates = [(self.table[name] - param[0]) / (param[1] - param[0])
+                       for name, param in zip(self.factory.PARAMETER_NAMES, parameterList) if isinstance(param, list)]
+        coordinates = np.column_stack(coordinates)
+        return coordinates[self.valid()] if validOnly else coordinates
+
+    def fit(self):
+        """! Fits the surrogate of the metrics to the simulated designs, in the unit hypercube of the parameter bounds.
+        @return: Fitted Surrogate with cross validation error
+        """
+        names = [name for name, param in zip(self.factory.PARAMETER_NAMES, self.factory.get_parameter_list(self.table))
+                 if isinstance(param, list)]
+        return Surrogate(names, self.metrics, kind=self.surrogate_kind, folds=self.folds).fit(self.unit_coordinates(),
+                                                                                              self.results[self.valid()])
+
+    def select(self, candidates: np.ndarray, surrogate: Surrogate, batchSize: int):
+        """! Chooses the next batch from the candidates.
+        The candidates are ranked by the criterion times the distance to the nearest simulated or already chosen
+        design, so the batch spreads over the regions of interest instead of clustering at the best candidate.
+        @param candidates: Candidate points in the unit hypercube
+        @param surrogate: Surrogate fitted by fit
+        @param batchSize: Number of candidates to choose
+        @return: Indices of the chosen candidates
+        """
+        # failed designs keep the batch away from their region, the residuals are those of the valid designs
+        points = self.unit_coordinates(validOnly=False)
+        distances = np.linalg.norm(candidates[:, None, :] - points[None, :, :], axis=2)
+        minDistance = distances.min(axis=1)
+        nearest = np.argmin(distances[:, self.valid()], axis=1)
+        if self.criterion == "gradient":
+            # central differences of the surrogate in every direction
+            step = 1e-3
+            gradient = np.zeros((len(candidates), len(self.metrics)))
+            for j in range(candidates.shape[1]):
+                offset = np.zeros(candidates.shape[1])
+                offset[j] = step
+                gradient += ((surrogate.predict(candidates + offset) - surrogate.predict(candidates - offset))
+                             / (2 * step * surrogate.std)) ** 2
+            rate = np.sqrt(gradient).sum(axis=1)
+        elif surrogate.kind == "gp":
+            rate = (surrogate.predict_std(candidates) / surrogate.std).sum(axis=1)
+        else:
+            rate = np.abs(surrogate.cv_residuals[nearest] / surrogate.std).sum(axis=1)
+
+        chosen = []
+        for _ in range(batchSize):
+            score = rate * minDistance
+            score[chosen] = -np.inf
+            best = int(np.argmax(score))
+            chosen.append(best)
+            minDistance = np.minimum(minDistance, np.linalg.norm(candidates - candidates[best], axis=1))
+        return np.array(chosen)
@@ -0,0 +1,72 @@
+import ambiance
+import numpy as np
+
+# Shared atmosphere of the process, created on first use
+_ATMOSPHERE = None
+
+
+class Atmosphere:
+    """! Tabulated ICAO standard atmosphere.
+    Density, pressure and speed of sound are precomputed once with ambiance on a fine altitude grid and evaluated by linear
+    interpolation afterwards. Altitudes below the ground are clamped to the ground, altitudes above the model ceiling
+    are clamped to the ceiling.
+    """
+
+    def __init__(self, resolution: float = 10.0, ceiling: float = ambiance.CONST.h_max):
+        """! Constructor of the tabulated atmosphere.
+        @param resolution: Spacing of the altitude grid in m.
+        @param ceiling: Highest altitude of the table in m, must lie within the range of the ambiance model.
+        """
+        if ceiling > ambiance.CONST.h_max:
+            raise ValueError(f"Error: The ceiling must not exceed the model range of {ambiance.CONST.h_max} m")
+        self.resolution = resolution
+        self.ceiling = ceiling
+        self.altitudes = np.linspace(0, ceiling, int(np.ceil(ceiling / resolution)) + 1)
+        # spacing of the grid after rounding up the number of points
+        self.spacing = self.altitudes[1] - self.altitudes[0]
+        atmosphere = ambiance.Atmosphere(self.altitudes)
+        # columns: density, pressure, speed of sound
+        self.table = np.column_stack((atmosphere.density, atmosphere.pressure, atmosphere.speed_of_sound))
+
+    def evaluate(self, altitude):
+        """! Evaluates density, pressure and speed of sound at the given altitude(s).
+        @param altitude: Altitude in m, a scalar or an array.
+        @return: Density in kg/m^3, pressure in Pa and speed of sound in m/s, as floats or arrays like the input.
+        """
+        if np.ndim(altitude) == 0:
+            # scalar fast path without array allocations
+            position = min(max(float(altitude), 0.0), self.ceiling) / self.spacing
+            index = min(int(position), self.altitudes.size - 2)
+            weight = position - index
+            lower = self.table[index]
+            upper = self.table[index + 1]
+            return (float(lower[0] + (upper[0] - lower[0]) * weight),
+                    float(lower[1] + (upper[1] - lower[1]) * weight),
+                    float(lower[2] + (upper[2] - lower[2]) * weight))
+        position = np.clip(np.asarray(altitude, dtype="float64"), 0, self.ceiling) / self.spacing
+        index = np.minimum(position.astype(int), self.altitudes.size - 2)
+        weight = (position - index)[..., np.newaxis]
+        values = self.table[index] * (1 - weight) + self.table[index + 1] * weight
+        return values[..., 0], values[..., 1], values[..., 2]
+
+    def density(self, altitude):
+        """! Returns the density at the given altitude(s) in kg/m^3."""
+        return self.evaluate(altitude)[0]
+
+    def pressure(self, altitude):
+        """! Returns the pressure at the given altitude(s) in Pa."""
+        return self.evaluate(altitude)[1]
+
+    def speed_of_sound(self, altitude):
+        """! Returns the speed of sound at the given altitude(s) in m/s."""
+        return self.evaluate(altitude)[2]
+
+
+def get_atmosphere():
+    """! Returns the atmosphere shared by all models of the process, the table is built on the first call.
+    @return: Atmosphere object.
+    """
+    global _ATMOSPHERE
+    if _ATMOSPHERE is None:
+        _ATMOSPHERE = Atmosphere()
+    return _ATMOSPHERE
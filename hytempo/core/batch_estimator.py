@@ -0,0 +1,337 @@
+import numpy as np
+
+from hytempo.core import components, engine, models
+from hytempo.core.atmosphere import get_atmosphere
+from hytempo.core.data_handling import Observer, write_states_to_hdf5
+
+# Recorded channels of the rocket, the fluid masses of the tanks are appended behind these
+CHANNELS = ("time", "x", "y", "v_x", "v_y", "a_x", "a_y", "Ma",
+            "mass", "thrust", "drag", "angle", "onRail", "P_amb")
+CHANNEL_INDEX = {name: i for i, name in enumerate(CHANNELS)}
+
+
+class BatchTrajectoryEstimator:
+    """! Integrates the trajectories of a whole swarm of rockets at once.
+    All rockets are advanced together with a fixed step classical Runge-Kutta scheme. The swarm is kept in NumPy arrays,
+    the position and velocity with shape (N,4) and the fluid masses of the tanks with shape (N,T).
+    Rockets that hit the ground are masked out and the active set is compacted, the results are written to the HDF5 file
+    in the same per-rocket layout the Observer produces.
+    @attention All tanks need a constant flow model (models.Fluid_Constant) and each rocket exactly one liquid engine,
+    as built by Liquid_CEA_TypeVTank_RegNitrous.
+    """
+
+    def __init__(self,
+                 rockets: list,
+                 hdf_file,
+                 dt: float = 0.05,
+                 t_bound: float = 400,
+                 chunk_steps: int = 500):
+        """! Constructor for the batch trajectory estimator.
+        @param rockets: List of Rocket objects, e.g. the list returned by build_swarm.
+        @param hdf_file: Open HDF5 file the results are written to.
+        @param dt: Fixed time step of the integration in s.
+        @param t_bound: Maximum flight time in s.
+        @param chunk_steps: Number of recorded steps kept in memory before they are written to the file.
+        """
+        self.rockets = rockets
+        self.file = hdf_file
+        self.filename = hdf_file.filename
+        self.dt = dt
+        self.t_bound = t_bound
+        self.chunk_steps = chunk_steps
+        # create the rocket groups in the file before the components are evaluated
+        self.observers = [Observer(hdf_file, rocket) for rocket in rockets]
+        # the initial states are written before the integrated steps, which bypass the observer buffers
+        for observer in self.observers:
+            observer.flush()
+        self.atmosphere = get_atmosphere()
+        self.static = self._setup_swarm()
+        self.pending = []
+
+    @classmethod
+    def from_table(cls, table, factory, hdf_file, **kwargs):
+        """! Builds the rockets of a swarm table and creates the estimator for them.
+        @param table: SwarmTable returned by sample_swarm, or a selection of it.
+        @param factory: Rocket factory that sized the table.
+        @param hdf_file: Open HDF5 file the results are written to.
+        @param kwargs: Further arguments of the constructor, e.g. dt.
+        @return: BatchTrajectoryEstimator object.
+        """
+        return cls(list(factory.iter_table(table)), hdf_file, **kwargs)
+
+    def _setup_swarm(self):
+        """! Extracts the constant properties of all rockets into arrays.
+        The engines are evaluated once in their burning state, the resulting thrust is tabulated over the ambient pressure.
+        @return: Dict of arrays with one row per rocket.
+        """
+        n_rockets = len(self.rockets)
+        n_tanks = max(len(rocket.tank_list) for rocket in self.rockets)
+        self.pressure_grid = np.linspace(10e-2, 1.05 * 101325, 24)
+
+        static = {"fluid_mass": np.zeros((n_rockets, n_tanks)),
+                  "tank_massflow": np.zeros((n_rockets, n_tanks)),
+                  "thrust_table": np.zeros((n_rockets, self.pressure_grid.size)),
+                  "dry_mass": np.zeros(n_rockets),
+                  "frontal_area": np.zeros(n_rockets),
+                  "launch_angle": np.zeros(n_rockets),
+                  "rail_height": np.zeros(n_rockets),
+                  "fuel_tank": np.zeros(n_rockets, dtype=int),
+                  "ox_tank": np.zeros(n_rockets, dtype=int),
+                  "drag_group": np.zeros(n_rockets, dtype=int),
+                  "drag_y": np.zeros(n_rockets)}
+        self.drag_groups = []
+        self.layouts = []
+
+        for i, rocket in enumerate(self.rockets):
+            if len(rocket.engine_list) != 1 or not isinstance(rocket.engine_list[0], engine.Liquid_engine):
+                raise ValueError(f"Error: {rocket.name} needs exactly one liquid engine for the batch integration")
+            for tank in rocket.tank_list:
+                if not isinstance(tank.tank_model, models.Fluid_Constant):
+                    raise ValueError(f"Error: {tank.parameters['name']} needs a constant flow model for the batch integration")
+            rocket_engine = rocket.engine_list[0]
+
+            # evaluate the feed system once, the flows are constant as long as the tanks are not empty
+            rocket_engine.updateState({"time": 0, "y": 0, "P_amb": self.atmosphere.pressure(0)})
+            static["fuel_tank"][i] = rocket.tank_list.index(get_source_tank(rocket_engine.input_fuel))
+            static["ox_tank"][i] = rocket.tank_list.index(get_source_tank(rocket_engine.input_oxidizer))
+            for k, tank in enumerate(rocket.tank_list):
+                static["fluid_mass"][i, k] = tank.get_fluid_mass()
+                # only the tanks feeding the engine are drained, as in the single rocket simulation
+                if k in (static["fuel_tank"][i], static["ox_tank"][i]):
+                    static["tank_massflow"][i, k] = tank.tank_model.apply_model(tank.state)["massflow"]
+
+            # tabulate the thrust over the ambient pressure
+            for j, pressure in enumerate(self.pressure_grid):
+                engine_state = dict(rocket_engine.state, P_amb=pressure)
+                isp = rocket_engine.isp_model.apply_model(engine_state, rocket_engine.parameters)
+                static["thrust_table"][i, j] = rocket_engine.state["massflow"] * isp * 9.81
+
+            static["dry_mass"][i] = rocket.get_mass() - static["fluid_mass"][i].sum()
+            static["frontal_area"][i] = rocket.parameters["Frontal_area"]
+            static["launch_angle"][i] = rocket.state["angle"]
+            static["rail_height"][i] = rocket.rail_height
+            static["drag_group"][i], static["drag_y"][i] = self._add_drag_model(rocket)
+            self.layouts.append(self._create_layout(rocket, self.observers[i]))
+        return static
+
+    def _add_drag_model(self, rocket):
+        """! Sorts the drag model of a rocket into a group of rockets sharing the same lookup table.
+        @param rocket: Rocket object.
+        @return: Index of the drag group and the value of the second LUT axis of the rocket.
+        """
+        drag_model = rocket.drag_model
+        if not isinstance(drag_model, models.Scalar_LUT2D) or drag_model.x != "Ma":
+            raise ValueError("Error: The batch integration needs a 2D LUT drag model over the Mach number")
+        for g, group_model in enumerate(self.drag_groups):
+            if (group_model.y == drag_model.y
+                    and all(np.array_equal(a, b) for a, b in zip(group_model.LUT.grid, drag_model.LUT.grid))
+                    and np.array_equal(group_model.LUT.values, drag_model.LUT.values)):
+                return g, rocket.parameters[drag_model.y]
+        self.drag_groups.append(drag_model)
+        return len(self.drag_groups) - 1, rocket.parameters[drag_model.y]
+
+    def _create_layout(self, rocket, observer):
+        """! Maps the state columns of every source of an observer onto the recorded channels.
+        Each column is described by (channel, value, gate): recorded channels are copied, all other columns hold the
+        value of the burning state as long as all tanks listed in gate still contain fluid.
+        @param rocket: Rocket object.
+        @param observer: Observer of the rocket.
+        @return: List of (HDF5 group name, column descriptions).
+        """
+        layout = []
+        rocket_engine = rocket.engine_list[0]
+        engine_tanks = (rocket.tank_list.index(get_source_tank(rocket_engine.input_fuel)),
+                        rocket.tank_list.index(get_source_tank(rocket_engine.input_oxidizer)))
+        for source, group_name in observer.sources:
+            columns = []
+            for key, value in source.getState().items():
+                if source is rocket:
+                    columns.append((CHANNEL_INDEX.get(key), value, ()))
+                elif key == "time":
+                    columns.append((CHANNEL_INDEX["time"], 0, ()))
+                elif isinstance(source, components.Tank):
+                    tank_col = rocket.tank_list.index(source)
+                    if key == "fluid_mass":
+                        columns.append((len(CHANNELS) + tank_col, 0, ()))
+                    else:
+                        columns.append((None, value, (tank_col,)))
+                elif isinstance(source, engine.Engine):
+                    if key == "P_amb":
+                        columns.append((CHANNEL_INDEX["P_amb"], 0, ()))
+                    else:
+                        columns.append((None, value, engine_tanks))
+                elif isinstance(source, components.Wetted_part):
+                    columns.append((None, value, (rocket.tank_list.index(get_source_tank(source)),)))
+                else:
+                    columns.append((None, value, ()))
+            layout.append((group_name, columns))
+        return layout
+
+    def compute_right_hand_side(self, time: float, position_and_velocity: np.ndarray, fluid_mass: np.ndarray,
+                                on_rail: np.ndarray, static: dict):
+        """! Computes the right hand side of the ODE for all active rockets.
+        @param time: Time of the simulation.
+        @param position_and_velocity: Array of shape (N,4) with [x,y,v_x,v_y] of the rockets.
+        @param fluid_mass: Array of shape (N,T) with the fluid masses of the tanks.
+        @param on_rail: Boolean array, True for rockets that are still on the rail.
+        @param static: Dict of the constant rocket properties of the active rockets.
+        @return: Derivatives of the position and velocity, derivatives of the fluid masses and the recorded channels.
+        """
+        v_x = position_and_velocity[:, 2]
+        v_y = position_and_velocity[:, 3]
+        velocity = np.sqrt(v_x ** 2 + v_y ** 2)
+        density, pressure, speed_of_sound = self.atmosphere.evaluate(position_and_velocity[:, 1])
+        mach = velocity / speed_of_sound
+        angle = np.where(on_rail, static["launch_angle"], np.degrees(np.arctan2(v_y, v_x)))
+
+        # the engine only burns as long as there is fuel and oxidizer left
+        filled = fluid_mass > 0
+        rows = np.arange(fluid_mass.shape[0])
+        burning = filled[rows, static["fuel_tank"]] & filled[rows, static["ox_tank"]]
+        grid_position = np.interp(pressure, self.pressure_grid, np.arange(self.pressure_grid.size))
+        lower = np.minimum(grid_position.astype(int), self.pressure_grid.size - 2)
+        weight = grid_position - lower
+        thrust = burning * (static["thrust_table"][rows, lower] * (1 - weight)
+                            + static["thrust_table"][rows, lower + 1] * weight)
+
+        # drag coefficient from the LUT of each drag group
+        drag_coefficient = np.empty(rows.size)
+        for g, drag_model in enumerate(self.drag_groups):
+            members = static["drag_group"] == g
+            if members.any():
+                drag_coefficient[members] = drag_model.LUT(np.column_stack((mach[members], static["drag_y"][members])))
+        drag = drag_coefficient * static["frontal_area"] * 0.5 * density * velocity ** 2
+
+        mass = static["dry_mass"] + np.maximum(fluid_mass, 0).sum(axis=1)
+        normal_acceleration = (thrust - drag) / mass
+        a_y = np.sin(np.radians(angle)) * normal_acceleration - 9.81
+        a_x = np.where(on_rail,
+                       a_y / np.tan(np.radians(angle)),
+                       np.cos(np.radians(angle)) * normal_acceleration)
+
+        d_position_and_velocity = np.column_stack((v_x, v_y, a_x, a_y))
+        d_fluid_mass = -static["tank_massflow"] * filled
+        channels = np.column_stack((np.full(rows.size, time), position_and_velocity, a_x, a_y, mach,
+                                    mass, thrust, drag, angle, on_rail, pressure, np.maximum(fluid_mass, 0)))
+        return d_position_and_velocity, d_fluid_mass, channels
+
+    def integrate_trajectories(self, mode: str = "full"):
+        """! Integrate the trajectories of all rockets of the swarm.
+        @param mode: "full" integrates the flights down to the ground, "ascent" stops each rocket at its apogee, the last
+        recorded state is interpolated to the v_y = 0 crossing within the step that passed it.
+        @return: List of the names of the rocket groups in the HDF5 file.
+        """
+        if mode not in ("full", "ascent"):
+            raise ValueError(f"Error: Unknown integration mode '{mode}', use 'full' or 'ascent'")
+        dt = self.dt
+        time = 0.0
+        active = np.arange(len(self.rockets))
+        static = dict(self.static)
+        fluid_mass = static.pop("fluid_mass").copy()
+        position_and_velocity = np.zeros((active.size, 4))
+        on_rail = np.ones(active.size, dtype=bool)
+
+        k1 = self.compute_right_hand_side(time, position_and_velocity, fluid_mass, on_rail, static)
+        # channels of the previous step of the active rockets, used to locate the apogee within a step
+        previous = k1[2]
+        while active.size > 0 and time < self.t_bound:
+            # classical Runge-Kutta step for the whole active set
+            k2 = self.compute_right_hand_side(time + dt / 2, position_and_velocity + dt / 2 * k1[0],
+                                              fluid_mass + dt / 2 * k1[1], on_rail, static)
+            k3 = self.compute_right_hand_side(time + dt / 2, position_and_velocity + dt / 2 * k2[0],
+                                              fluid_mass + dt / 2 * k2[1], on_rail, static)
+            k4 = self.compute_right_hand_side(time + dt, position_and_velocity + dt * k3[0],
+                                              fluid_mass + dt * k3[1], on_rail, static)
+            position_and_velocity = position_and_velocity + dt / 6 * (k1[0] + 2 * k2[0] + 2 * k3[0] + k4[0])
+            fluid_mass = np.maximum(fluid_mass + dt / 6 * (k1[1] + 2 * k2[1] + 2 * k3[1] + k4[1]), 0)
+            time += dt
+
+            # disconnect the rockets that left the rail
+            on_rail &= position_and_velocity[:, 1] <= static["rail_height"]
+
+            # mask out the rockets that hit the ground and compact the active set
+            flying = position_and_velocity[:, 1] >= 0
+            if not flying.all():
+                active, position_and_velocity, fluid_mass, on_rail, static = compact(
+                    flying, active, position_and_velocity, fluid_mass, on_rail, static)
+                previous = previous[flying]
+                if active.size == 0:
+                    break
+
+            k1 = self.compute_right_hand_side(time, position_and_velocity, fluid_mass, on_rail, static)
+            channels = k1[2]
+            ascending = on_rail | (position_and_velocity[:, 3] >= 0)
+            if mode == "ascent" and not ascending.all():
+                # v_y is close to linear within a step, the apogee is at its root and y grows by the area under it
+                channels = channels.copy()
+                passed = ~ascending
+                v_y_before = previous[passed, 4]
+                fraction = (v_y_before / (v_y_before - channels[passed, 4]))[:, None]
+                apex = previous[passed] + fraction * (channels[passed] - previous[passed])
+                apex[:, 2] = previous[passed, 2] + 0.5 * fraction[:, 0] * dt * v_y_before
+                apex[:, 4] = 0.0
+                channels[passed] = apex
+            self.pending.append((active, channels))
+            if len(self.pending) >= self.chunk_steps:
+                self.flush()
+
+            # in ascent mode the rockets are removed after their apogee has been recorded
+            if mode == "ascent" and not ascending.all():
+                active, position_and_velocity, fluid_mass, on_rail, static = compact(
+                    ascending, active, position_and_velocity, fluid_mass, on_rail, static)
+                k1 = tuple(value[ascending] for value in k1)
+            previous = k1[2]
+
+        self.flush()
+        for observer in self.observers:
+            observer.calculateMetrics(fromStates=True)
+        return [observer.rocket_group_name for observer in self.observers]
+
+    def flush(self):
+        """! Writes the recorded steps of all rockets to their groups in the HDF5 file."""
+        if not self.pending:
+            return
+        rocket_ids = np.concatenate([ids for ids, _ in self.pending])
+        data = np.vstack([channels for _, channels in self.pending])
+        self.pending = []
+        order = np.argsort(rocket_ids, kind="stable")
+        rocket_ids = rocket_ids[order]
+        data = data[order]
+        starts = np.flatnonzero(np.r_[True, rocket_ids[1:] != rocket_ids[:-1]])
+        for start, stop in zip(starts, np.r_[starts[1:], rocket_ids.size]):
+            rows = data[start:stop]
+            for group_name, columns in self.layouts[rocket_ids[start]]:
+                block = np.empty((rows.shape[0], len(columns)))
+                for j, (channel, value, gate) in enumerate(columns):
+                    if channel is not None:
+                        block[:, j] = rows[:, channel]
+                    else:
+                        block[:, j] = value
+                        for tank_col in gate:
+                            block[:, j] *= rows[:, len(CHANNELS) + tank_col] > 0
+                write_states_to_hdf5(self.file[group_name], block)
+
+
+def compact(keep: np.ndarray, active: np.ndarray, position_and_velocity: np.ndarray, fluid_mass: np.ndarray,
+            on_rail: np.ndarray, static: dict):
+    """! Removes rockets from the active set of the batch integration.
+    @param keep: Boolean array, True for the rockets that stay active.
+    @param active: Indices of the active rockets in the swarm.
+    @param position_and_velocity: Array of shape (N,4) with [x,y,v_x,v_y] of the active rockets.
+    @param fluid_mass: Array of shape (N,T) with the fluid masses of the tanks.
+    @param on_rail: Boolean array, True for rockets that are still on the rail.
+    @param static: Dict of the constant rocket properties of the active rockets.
+    @return: The compacted arrays in the order of the parameters.
+    """
+    return (active[keep], position_and_velocity[keep], fluid_mass[keep], on_rail[keep],
+            {key: value[keep] for key, value in static.items()})
+
+
+def get_source_tank(part: components.Component):
+    """! Follows the inputs of a feed system part upstream to the tank that supplies it.
+    @param part: Tank or wetted part.
+    @return: Tank at the start of the feed line.
+    """
+    while not isinstance(part, components.Tank):
+        part = part.input
+    return part
@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+
+from pycea import CEA
+
+# held while a CEA instance is created or solving, the CEA library is not thread safe
+LOCK = threading.RLock()
+# CEA instances of the process, keyed by propellant names and units
+_INSTANCES = {}
+# Isp memo of the process, created on first use
+_ISP_MEMO = None
+
+
+def get_cea(oxName: str = "", fuelName: str = "", propName: str = "", units: str = "metric"):
+    """! Returns the CEA instance of the process for a propellant combination, it is created on the first request.
+    @param oxName: CEA name of the oxidizer
+    @param fuelName: CEA name of the fuel
+    @param propName: CEA name of a monopropellant or solid propellant
+    @param units: Unit system of the CEA instance, defaults to metric
+    @return: CEA object.
+    """
+    key = (oxName, fuelName, propName, units)
+    with LOCK:
+        if key not in _INSTANCES:
+            _INSTANCES[key] = CEA(oxName=oxName, fuelName=fuelName, propName=propName, fac_CR=None, units=units)
+        return _INSTANCES[key]
+
+
+class IspMemo:
+    """! Bounded least recently used memo of CEA ambient Isp results.
+    The inputs are quantised to a number of significant digits before the lookup and the CEA solve is run with the
+    quantised inputs, so a result only depends on its key. Lookups and solves are serialised with LOCK, so the memo can
+    be used from several threads.
+    """
+
+    def __init__(self, maxSize: int = 65536, significantDigits: int = 9):
+        """! Constructor of the memo.
+        @param maxSize: Maximum number of stored results, the least recently used result is dropped first
+        @param significantDigits: Significant digits the inputs are quantised to
+        """
+        if maxSize < 1:
+            raise ValueError("Error: The memo must hold at least one result")
+        self.max_size = maxSize
+        self.significant_digits = significantDigits
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def quantise(self, value: float):
+        """! Rounds a value to the significant digits of the memo.
+        @param value: Value to round
+        @return: Rounded value.
+        """
+        return float(f"{value:.{self.significant_digits}g}")
+
+    def estimate_Ambient_Isp(self, cea_key: tuple, Pc: float, MR: float, eps: float, Pamb: float,
+                             frozen: int = 0, frozenAtThroat: int = 0):
+        """! Returns the ambient Isp of a CEA instance, computed only for inputs that are not in the memo yet.
+        @param cea_key: Arguments of get_cea identifying the CEA instance as (oxName, fuelName, propName, units)
+        @param Pc: Chamber pressure in the units of the CEA instance
+        @param MR: Mixture ratio
+        @param eps: Expansion ratio of the nozzle
+        @param Pamb: Ambient pressure in the units of the CEA instance
+        @param frozen: Frozen flow from the chamber on, as in CEA
+        @param frozenAtThroat: Frozen flow from the throat on, as in CEA
+        @return: Isp and flow mode as returned by CEA.
+        """
+        inputs = (self.quantise(Pc), self.quantise(MR), self.quantise(eps), self.quantise(Pamb))
+        key = tuple(cea_key) + inputs + (frozen, frozenAtThroat)
+        with LOCK:
+            if key in self.results:
+                self.hits += 1
+                self.results.move_to_end(key)
+                return self.results[key]
+            self.misses += 1
+            result = get_cea(*cea_key).estimate_Ambient_Isp(Pc=inputs[0], MR=inputs[1], eps=inputs[2], Pamb=inputs[3],
+                                                            frozen=frozen, frozenAtThroat=frozenAtThroat)
+            self.results[key] = result
+            if len(self.results) > self.max_size:
+                self.results.popitem(last=False)
+            return result
+
+    def info(self):
+        """! Returns the usage statistics of the memo.
+        @return: Dict with the hits, misses, current size and maximum size.
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.results), "max_size": self.max_size}
+
+    def clear(self):
+        """! Drops all stored results and resets the statistics."""
+        with LOCK:
+            self.results.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def get_isp_memo():
+    """! Returns the Isp memo shared by all models of the process.
+    @return: IspMemo object.
+    """
+    global _ISP_MEMO
+    if _ISP_MEMO is None:
+        _ISP_MEMO = IspMemo()
+    return _ISP_MEMO
+
+
+def estimate_Ambient_Isp(oxName: str, fuelName: str, Pc: float, MR: float, eps: float, Pamb: float,
+                         frozen: int = 0, frozenAtThroat: int = 0, units: str = "metric"):
+    """! Memoised ambient Isp of a bipropellant combination, using the shared CEA instance and memo of the process.
+    @param oxName: CEA name of the oxidizer
+    @param fuelName: CEA name of the fuel
+    @param Pc: Chamber pressure in the given units
+    @param MR: Mixture ratio
+    @param eps: Expansion ratio of the nozzle
+    @param Pamb: Ambient pressure in the given units
+    @param frozen: Frozen flow from the chamber on, as in CEA
+    @param frozenAtThroat: Frozen flow from the throat on, as in CEA
+    @param units: Unit system of the CEA instance, defaults to metric
+    @return: Isp and flow mode as returned by CEA.
+    """
+    return get_isp_memo().estimate_Ambient_Isp((oxName, fuelName, "", units), Pc=Pc, MR=MR, eps=eps, Pamb=Pamb,
+                                               frozen=frozen, frozenAtThroat=frozenAtThroat)
@@ -1,4 +1,5 @@
 from hytempo.core import models
+from hytempo.core.state import State
 class Component:
     """! Base class for all components in the rocket
     Only models the weight and the name of the component.
@@ -18,7 +19,7 @@ class Component:
                             "name": name,
                             "length": length,
                             "in_hulltube": hulltube}
-        self.state = {"time": 0}
+        self.state = State({"time": 0})
 
     def get_mass(self):
         """! Returns the weight of the component
@@ -43,9 +44,8 @@ class Component:
         return self.parameters["length"]
 
     def getState(self):
-        """! Returns the state of the component as a dict
-        @param hdf5_group: HDF5 group to which the state should be written
-        @return: State of the component as a dict"""
+        """! Returns the state of the component
+        @return: State of the component, read like a dict"""
         return self.state
     
     def getParameters(self):
@@ -83,7 +83,8 @@ class Wetted_part(Component):
                          hulltube=hulltube)
         self.parameters["fluid"] = input.get_fluid() # extend the paramters with the fluid
         self.input_state = {}
-        self.state = {}
+        # the state of the fluid at the output, as provided by the fluid models
+        self.state = State({"massflow": 0, "temperature": 0, "pressure": 0})
 
         # set the model for the wetted part
         if not isinstance(model, models.Model):
@@ -101,16 +102,17 @@ class Wetted_part(Component):
         """! Updates the state of the fluid at the output of the component
         This method is used to get the state of the fluid at the output of the component. 
         It is used to model the state changes of the fluid.
-        @return: Dict containing the state of the fluid at the output of the component
+        @param calling_state: State of the component calling the method, the time is passed on to the input
+        @return: State of the fluid at the output of the component
         """
-        # update time
-        self.state["time"] = calling_state["time"] 
-        
         # get state of the input component 
-        self.input_state = self.input.updateState(self.state)  
+        self.input_state = self.input.updateState(calling_state)  
 
         # apply model to calculate the state of the fluid at the output
-        self.state = self.model.apply_model(self.input_state)  
+        output_state = self.model.apply_model(self.input_state)  
+        self.state["massflow"] = output_state["massflow"]
+        self.state["temperature"] = output_state["temperature"]
+        self.state["pressure"] = output_state["pressure"]
 
         return self.state
 
@@ -161,14 +163,16 @@ class Tank(Component):
                             "init_pressure": pressure,
                             "init_fluid_mass": fluid_mass,
                             "in_hulltube":hulltube}
-        self.state= {"time":0,
+        self.state= State({"time":0,
                     "fluid_mass":fluid_mass,
                     "pressure":pressure,
                     "temperature":temperature,
-                    "massflow":0}
+                    "massflow":0})
         self.output_state = {"massflow":0,
                              "temperature":0,
                              "pressure":0}
+        # set when the fluid mass reaches zero in an accepted solver step
+        self.empty = False
         
         # set the output modell
         self.tank_model = tank_model
@@ -195,52 +199,48 @@ class Tank(Component):
         """
         return self.parameters["mass"]
 
+    def get_massflow(self):
+        """! Returns the mass flow leaving the tank at the last evaluation
+        @return: Mass flow of the fluid leaving the tank in kg/s
+        """
+        return self.output_state["massflow"]
+
     def updateState(self, calling_state: dict):
-        """! Returns the state of the fluid at the output of the tank and updates the state of the tank
+        """! Returns the state of the fluid at the output of the tank
+        The fluid mass is an integrated state of the trajectory and set by the rocket before the tank is evaluated,
+        so the method has no side effects and may be called at arbitrary times by the solver.
         @param calling_state: State of the component calling the method
         @return: Dict containing the state of the fluid at the output of the tank
         """
         #update the time of the tank state
-        dt = calling_state["time"] - self.state["time"] # calculate time step
         self.state["time"] = calling_state["time"] # update time
-        # check if there is an input component 
-        if self.input is not None: 
-            # tank is propellant tank
-            # check if the fluid mass is sufficient
-            if self.state['massflow']*dt < self.state["fluid_mass"]:
-                # enough propellant is available, udate the state of the tank and provide massflow
-                self.output_state = self.tank_model.apply_model(self.state) # apply flow model  
-                self.state["fluid_mass"] = self.state["fluid_mass"] - self.output_state["massflow"]*dt  # update fluid mass
-                #update internal state for dataexport
+        # check if the tank has been emptied in an accepted step
+        if not self.empty:
+            # fluid is available, provide massflow
+            self.output_state = self.tank_model.apply_model(self.state) # apply flow model
+            # check if there is an input component
+            if self.input is not None:
+                # tank is propellant tank, update internal state for dataexport
                 self.state["massflow"] = self.output_state["massflow"]
                 self.state["temperature"] = self.output_state["temperature"]
                 self.state["pressure"] = self.output_state["pressure"]
-            else:
-                # not enough propellant is available, set output state to zero and proceed to empty the pressurant tank
-                self.state["massflow"]=0
-                self.state["fluid_mass"] = 0
-                self.state["pressure"] = 0
-                self.state["temperature"] = 0
-                self.output_state = {"massflow":0,"temperature":0,"pressure":0}
-                #call the get state method of the pressurant tank to empty it
-                #the massflow of the pressurant is not processed further as it produces no thrust
-                #dummy = self.input.updateState(self.state)
         else:
-            # tank is pressurant tank, no input component 
-            #check if there is fluid in the tank
-            if self.state['massflow']*dt < self.state["fluid_mass"]:
-                # enough pressurant is available, update the state of the tank and provide massflow
-                self.output_state = self.tank_model.apply_model(self.state) # apply flow model  
-                self.state["fluid_mass"] = self.state["fluid_mass"] - self.output_state["massflow"]*dt  # update fluid mass
-            else: 
-                # not enough pressurant is available, set output state to zero
-                self.state["massflow"]=0
-                self.state["fluid_mass"] = 0
-                self.state["pressure"] = 0
-                self.state["temperature"] = 0
-                self.output_state = {"massflow":0,"temperature":0,"pressure":0}
-        return self.output_state    
-    
+            # tank is empty, set output state to zero
+            # the massflow of the pressurant is not processed further as it produces no thrust
+            self.state["massflow"]=0
+            self.state["pressure"] = 0
+            self.state["temperature"] = 0
+            self.output_state = {"massflow":0,"temperature":0,"pressure":0}
+        return self.output_state
+
+    def commitState(self):
+        """! Commits the current state of the tank.
+        Called only for accepted solver steps, a tank whose fluid mass has reached zero is marked as empty.
+        """
+        if self.state["fluid_mass"] <= 0:
+            self.state["fluid_mass"] = 0
+            self.empty = True
+
     def get_fluid(self):
         """! Returns the species of the fluid in the tank
         @return: Species of the fluid in the tank"""
@@ -1,11 +1,288 @@
+import copy
 import os
+import queue
+import threading
 import h5py
 import pandas as pd
 import numpy as np
 from collections import defaultdict
 from datetime import datetime
+from operator import itemgetter
 from hytempo.core.components import Component
 
+# Maximum number of rows of a chunk of the state datasets, HDF5 allocates whole chunks
+MAX_CHUNK_ROWS = 128
+
+def speed(state: dict):
+    """ Magnitude of the velocity of a rocket state. """
+    return np.sqrt(state["v_x"] ** 2 + state["v_y"] ** 2)
+
+
+def acceleration(state: dict):
+    """ Magnitude of the acceleration of a rocket state. """
+    return np.sqrt(state["a_x"] ** 2 + state["a_y"] ** 2)
+
+
+def dynamic_pressure(state: dict):
+    """ Dynamic pressure of a rocket state in Pa, 0.5*rho*v^2 = 0.5*kappa*p*Ma^2 for air as an ideal gas. """
+    return 0.7 * state["P_amb"] * state["Ma"] ** 2
+
+
+class MetricReducer:
+    """
+    Streaming reduction of the observed rocket states to one or more scalar metrics.
+    The Observer calls update with the state dict of the rocket for the initial state and every accepted step and
+    writes result once at the end of the integration. Own reductions are registered with Observer.add_metric or the
+    metric_reducers of the TrajectoryEstimator; to be used with run_swarm they need to be picklable, i.e. use module
+    level functions or operator.itemgetter instead of lambdas.
+    """
+    # names of the metrics returned by result
+    names = ()
+
+    def reset(self):
+        """ Resets the reduction before the first state. """
+        pass
+
+    def update(self, state: dict):
+        """ Adds a state to the reduction.
+        @param state: State dict of the rocket.
+        @attention This function is to be treated as an abstract function and is overwritten by the child class.
+        """
+        pass
+
+    def result(self):
+        """ Returns the metrics as dict of name and value.
+        @attention This function is to be treated as an abstract function and is overwritten by the child class.
+        """
+        pass
+
+
+class MaxReducer(MetricReducer):
+    """ Running maximum of a function of the state and optionally the time it is reached. """
+
+    def __init__(self, name: str, function, timeName: str = None):
+        """
+        @param name: Name of the maximum.
+        @param function: Function of the state dict, e.g. itemgetter("y").
+        @param timeName: Name of the time of the maximum, not recorded if None.
+        """
+        self.name = name
+        self.function = function
+        self.time_name = timeName
+        self.names = (name,) if timeName is None else (name, timeName)
+        self.reset()
+
+    def reset(self):
+        self.value = -np.inf
+        self.time = np.nan
+
+    def update(self, state: dict):
+        value = self.function(state)
+        if value > self.value:
+            self.value = value
+            self.time = state["time"]
+
+    def result(self):
+        result = {self.name: float(self.value) if np.isfinite(self.value) else np.nan}
+        if self.time_name is not None:
+            result[self.time_name] = float(self.time)
+        return result
+
+
+class FirstValueReducer(MetricReducer):
+    """ Value of a function of the first state, or of the first state fulfilling a condition. """
+
+    def __init__(self, name: str, function, condition=None):
+        """
+        @param name: Name of the value.
+        @param function: Function of the state dict.
+        @param condition: Function of the state dict, only states it is true for are taken into account. All states are
+        taken into account if None.
+        """
+        self.function = function
+        self.condition = condition
+        self.names = (name,)
+        self.reset()
+
+    def reset(self):
+        self.value = np.nan
+        self.observed = False
+
+    def update(self, state: dict):
+        if not self.observed and (self.condition is None or self.condition(state)):
+            self.value = self.function(state)
+            self.observed = True
+
+    def result(self):
+        return {self.names[0]: float(self.value)}
+
+
+class LastValueReducer(MetricReducer):
+    """ Value of a function of the last state, or of the last state fulfilling a condition. """
+
+    def __init__(self, name: str, function, condition=None):
+        """
+        @param name: Name of the value.
+        @param function: Function of the state dict.
+        @param condition: Function of the state dict, only states it is true for are taken into account. All states are
+        taken into account if None.
+        """
+        self.function = function
+        self.condition = condition
+        self.names = (name,)
+        self.reset()
+
+    def reset(self):
+        self.value = np.nan
+
+    def update(self, state: dict):
+        if self.condition is None or self.condition(state):
+            self.value = self.function(state)
+
+    def result(self):
+        return {self.names[0]: float(self.value)}
+
+
+class BurnoutReducer(MetricReducer):
+    """ Time of the first state without thrust after the engine has produced thrust, NaN without burnout. """
+    names = ("burnout_time",)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.powered = False
+        self.time = np.nan
+
+    def update(self, state: dict):
+        if state["thrust"] > 0:
+            self.powered = True
+        elif self.powered and np.isnan(self.time):
+            self.time = state["time"]
+
+    def result(self):
+        return {"burnout_time": float(self.time)}
+
+
+def off_rail(state: dict):
+    """ True once the rocket has left the rail. """
+    return not state["onRail"]
+
+
+def default_metric_reducers():
+    """
+    Returns new instances of the metric reducers every Observer registers.
+    The rail exit is the first observed state off the rail. The TrajectoryEstimator commits the located rail exit event
+    as this state, the BatchTrajectoryEstimator the first step above the rail height.
+    @return: List of MetricReducers.
+    """
+    return [MaxReducer("max_velocity", speed, "max_velocity_time"),
+            MaxReducer("max_ma", itemgetter("Ma"), "max_ma_time"),
+            MaxReducer("apogee", itemgetter("y"), "apogee_time"),
+            FirstValueReducer("wet_mass", itemgetter("mass")),
+            LastValueReducer("dry_mass", itemgetter("mass")),
+            BurnoutReducer(),
+            MaxReducer("max_dynamic_pressure", dynamic_pressure, "max_dynamic_pressure_time"),
+            MaxReducer("max_acceleration", acceleration, "max_acceleration_time"),
+            FirstValueReducer("rail_exit_time", itemgetter("time"), off_rail),
+            FirstValueReducer("rail_exit_velocity", speed, off_rail)]
+
+
+class OutputPolicy:
+    """
+    Output policy of the Observer, decides which states are written to the state datasets.
+    The base policy records the initial state and every accepted solver step. The metrics are always computed from
+    every accepted step, independent of the policy.
+    """
+    # record the initial state and every accepted step
+    record_initial = True
+    record_steps = True
+    # record the state at the end of the integration
+    record_final = False
+
+    def sample_times(self, t_old: float, t_new: float):
+        """ Times between two accepted steps at which the state is sampled from the dense output of the solver. """
+        return ()
+
+    def thin(self, times: np.ndarray, blocks: list):
+        """ Indices of the buffered rows that are written to the file.
+        @param times: Times of the buffered rows.
+        @param blocks: Buffered rows of every source.
+        """
+        return slice(None)
+
+
+class OutputEveryStep(OutputPolicy):
+    """ Records the initial state and every accepted solver step. """
+
+
+class OutputInterval(OutputPolicy):
+    """ Records the state at a fixed time interval, sampled from the dense output of the solver, and at the end. """
+    record_steps = False
+    record_final = True
+
+    def __init__(self, interval: float):
+        """
+        @param interval: Time between two recorded states in s.
+        """
+        if interval <= 0:
+            raise ValueError("Error: The output interval must be positive")
+        self.interval = interval
+
+    def sample_times(self, t_old: float, t_new: float):
+        """ Multiples of the interval in (t_old, t_new]. """
+        first = int(np.floor(t_old / self.interval)) + 1
+        last = int(np.floor(t_new / self.interval))
+        return [k * self.interval for k in range(first, last + 1)]
+
+
+class OutputThinning(OutputPolicy):
+    """
+    Records every accepted step, but only writes the rows needed to reproduce every channel by linear interpolation
+    within a tolerance (Douglas-Peucker thinning). The tolerance of a channel is rtol times its largest magnitude in
+    the buffer plus atol. The rows are thinned buffer by buffer, the first and last row of every buffer are kept.
+    """
+
+    def __init__(self, rtol: float = 1e-3, atol: float = 1e-9):
+        """
+        @param rtol: Relative tolerance of the channels.
+        @param atol: Absolute tolerance of the channels.
+        """
+        self.rtol = rtol
+        self.atol = atol
+
+    def thin(self, times: np.ndarray, blocks: list):
+        """ Indices of the rows kept by the Douglas-Peucker thinning of all channels of all sources. """
+        values = np.hstack([block for block in blocks if block.shape[1]])
+        if len(times) < 3 or values.size == 0:
+            return slice(None)
+        tolerance = self.rtol * np.max(np.abs(values), axis=0) + self.atol
+        keep = np.zeros(len(times), dtype=bool)
+        keep[[0, -1]] = True
+        segments = [(0, len(times) - 1)]
+        while segments:
+            start, stop = segments.pop()
+            if stop - start < 2:
+                continue
+            # deviation of the inner rows from the line between the segment ends, relative to the tolerance
+            span = times[stop] - times[start]
+            weight = (times[start + 1:stop] - times[start]) / span if span > 0 else np.full(stop - start - 1, 0.5)
+            line = values[start] + weight[:, None] * (values[stop] - values[start])
+            deviation = np.max(np.abs(values[start + 1:stop] - line) / tolerance, axis=1)
+            worst = int(np.argmax(deviation))
+            if deviation[worst] > 1:
+                split = start + 1 + worst
+                keep[split] = True
+                segments += [(start, split), (split, stop)]
+        return np.flatnonzero(keep)
+
+
+class OutputMetricsOnly(OutputPolicy):
+    """ Records no states, only the metrics are written. """
+    record_initial = False
+    record_steps = False
+
+
 class Observer:
     """
     Represents the single recipient (Observer).
@@ -13,13 +290,30 @@ class Observer:
     """
     def __init__(self,
                  safeFile: h5py.File,
-                 rocket: Component):
+                 rocket: Component,
+                 bufferSize: int = 1024,
+                 outputPolicy: OutputPolicy = None,
+                 metricReducers: list = None):
         """
         Initializes the Observer with a name and an empty list of sources.
+        The states are collected in preallocated buffers of bufferSize rows per source and written to the file in
+        blocks of that size. The state datasets are chunked in at most MAX_CHUNK_ROWS rows, a trajectory that fits into
+        one buffer is written at its exact size at the end.
         @param safeFile: The file to save the data to.
+        @param bufferSize: Number of steps buffered in memory before they are written to the file.
+        @param outputPolicy: Policy deciding which states are written, defaults to every step (OutputEveryStep).
+        @param metricReducers: Additional MetricReducers registered behind the default ones (default_metric_reducers).
+        They are copied, so the same list can be passed to several observers.
         """
         self.file = safeFile
         self.rocket = rocket
+        self.buffer_size = bufferSize
+        self.policy = outputPolicy if outputPolicy is not None else OutputEveryStep()
+        # reducers of the metrics, updated with every accepted step
+        self.metric_reducers = []
+        for reducer in default_metric_reducers() + copy.deepcopy(list(metricReducers or [])):
+            self.add_metric(reducer)
+        self.last_recorded_time = None
         self.sources = []
         self.received_updates = {} # To store the latest data from each source
         #add the information sources 
@@ -28,32 +322,38 @@ class Observer:
         self.add_TankNodeSources(self.rocket)
         self.add_EngineNodeSources(self.rocket)
 
-        #init the state datasets
+        #init the state datasets and buffers
+        self.groups = []
+        self.states = []
+        self.buffers = []
+        self.buffered_rows = 0
+        self.buffered_times = np.empty(bufferSize, dtype='float64')
         for source in self.sources:
             #get the state
             data_dict = source[0].getState()
+            self.states.append(data_dict)
 
             #get the hdf_group
             hdf_group = self.file[source[1]]
+            self.groups.append(hdf_group)
 
             # get the keys from the dict
             keys = list(data_dict.keys()) 
             
-            #transform dict into array
-            values = np.array(list(data_dict.values()), dtype='float64') 
-            
-            # Write the received data to the corresponding HDF5 group
+            # Create the state dataset, the chunks are small so short trajectories do not allocate a whole buffer
             dataset = hdf_group.create_dataset(
                 "state",
-                shape=(1, len(values)),
-                maxshape=(None, len(values)),
+                shape=(0, len(keys)),
+                maxshape=(None, len(keys)),
+                chunks=(min(bufferSize, MAX_CHUNK_ROWS), len(keys)) if keys else True,
                 dtype='float64'
             )
-            #dataset.resize((1, len(values)))
-            dataset[0, :] = values
             
             # Store the keys as an attribute for column headers
             dataset.attrs["columns"] = np.array(keys, dtype='S')
+            self.buffers.append(np.empty((bufferSize, len(keys)), dtype='float64'))
+        # the initial state is the first row
+        self.pull_updates()
             
     def add_PrimaryNodeSource(self, rocket: Component):
         """
@@ -138,51 +438,90 @@ class Observer:
 
     def pull_updates(self):
         """
-        This is the 'update' method called by the recipient.
-        It iterates through all registered sources and pulls their latest data.
+        This is the 'update' method called by the recipient for the initial state and every accepted step.
+        It updates the metrics and pulls the latest data of all sources into the buffers if the output policy records the
+        step, full buffers are written to the file.
         """
-        for source in self.sources:
-            current_data = source[0].getState()
-
-            # Write the received data to the corresponding HDF5 group
-            group = self.file[source[1]]
-            write_state_to_hdf5(group, current_data)
+        self.update_metrics()
+        if self.policy.record_steps or (self.policy.record_initial and self.last_recorded_time is None):
+            self.record()
 
-    def calculateMetrics(self):
+    def record(self):
         """
-        This extracts the performance metrics of the trajectory and stores it in a dataset that is added to a rocket group
+        Pulls the latest data of all registered sources into the buffers, independent of the output policy, e.g. for
+        states sampled from the dense output of the solver.
         """
+        row = self.buffered_rows
+        # the states are array views of the state store of the rocket, copied without conversion
+        for state, buffer in zip(self.states, self.buffers):
+            buffer[row] = state.array
+        self.last_recorded_time = self.rocket.state["time"]
+        self.buffered_times[row] = self.last_recorded_time
+        self.buffered_rows += 1
+        if self.buffered_rows == self.buffer_size:
+            self.flush()
+
+    def add_metric(self, reducer: MetricReducer):
+        """
+        Registers a metric reducer, which is updated with every observed step from now on.
+        @param reducer: MetricReducer, its metric names must not be taken by the registered reducers.
+        """
+        taken = {name for registered in self.metric_reducers for name in registered.names}
+        duplicates = taken.intersection(reducer.names)
+        if duplicates:
+            raise ValueError(f"Error: The metrics {sorted(duplicates)} are already registered")
+        self.metric_reducers.append(reducer)
 
-        # max velocity
-        # get the columns for the state dataset
-        columns = [col.decode() if isinstance(col, bytes) else col 
-                   for col in self.file[self.rocket_group_name]["state"].attrs["columns"]]
-        v_x_idx = columns.index("v_x")
-        v_y_idx = columns.index("v_y")
-        v_x = self.file[self.rocket_group_name]["state"][:, v_x_idx]
-        v_y = self.file[self.rocket_group_name]["state"][:, v_y_idx]
-        max_velocity = np.max(np.sqrt(v_x**2 + v_y**2))
-
-        # max mach number
-        ma_idx = columns.index("Ma")
-        max_ma = np.max(self.file[self.rocket_group_name]["state"][:, ma_idx])
-
-        # apogee (max y)
-        y_idx = columns.index("y")
-        y = self.file[self.rocket_group_name]["state"][:, y_idx]
-        max_y = np.max(y)
+    def update_metrics(self):
+        """
+        Updates the metric reducers with the current state of the rocket.
+        """
+        state = self.rocket.state
+        for reducer in self.metric_reducers:
+            reducer.update(state)
 
-        # wet and dry mass
-        mass_idx = columns.index("mass")
-        wet_mass = self.file[self.rocket_group_name]["state"][0, mass_idx]
-        dry_mass = self.file[self.rocket_group_name]["state"][-1, mass_idx]
+    def flush(self, final: bool = False):
+        """
+        Writes the buffered states of all sources to their state datasets and empties the buffers.
+        @param final: No further states follow, datasets that are still empty are written at the exact size of the block.
+        """
+        if self.buffered_rows == 0:
+            return
+        blocks = [buffer[:self.buffered_rows] for buffer in self.buffers]
+        rows = self.policy.thin(self.buffered_times[:self.buffered_rows], blocks)
+        for group, block in zip(self.groups, blocks):
+            write_states_to_hdf5(group, block[rows], exact=final)
+        self.buffered_rows = 0
+
+    def calculateMetrics(self, fromStates: bool = False):
+        """
+        Writes the metrics of the metric reducers to a dataset that is added to the rocket group.
+        The reducers are updated with every step observed by pull_updates, so the metrics do not depend on the output
+        policy and the states are not read back from the file.
+        @param fromStates: Replay the state dataset of the rocket through the reducers instead, for states written
+        without pull_updates, e.g. by the BatchTrajectoryEstimator.
+        """
+        # record the final state and write the remaining buffered states
+        if self.policy.record_final and self.last_recorded_time != self.rocket.state["time"]:
+            self.record()
+        self.flush(final=True)
+        if fromStates:
+            dataset = self.file[self.rocket_group_name]["state"]
+            columns = [col.decode() if isinstance(col, bytes) else col for col in dataset.attrs["columns"]]
+            for reducer in self.metric_reducers:
+                reducer.reset()
+            for row in dataset[...]:
+                state = dict(zip(columns, row))
+                for reducer in self.metric_reducers:
+                    reducer.update(state)
 
         # create a dataset that contains all of the metrics and add it to the rocket node
-        metrics = np.array([max_velocity, max_ma, max_y, wet_mass, dry_mass], dtype='float64')
-        metric_names = np.array(["max_velocity", "max_ma", "apogee", "wet_mass", "dry_mass"], dtype='S')
+        results = {}
+        for reducer in self.metric_reducers:
+            results.update(reducer.result())
+        metrics = np.array(list(results.values()), dtype='float64')
         ds = self.file[self.rocket_group_name].create_dataset("metrics", data=metrics)
-        ds.attrs["columns"] = metric_names
-
+        ds.attrs["columns"] = np.array(list(results.keys()), dtype='S')
 
 
 def create_hdf5_file(name, overwrite=False):
@@ -212,13 +551,137 @@ def create_hdf5_file(name, overwrite=False):
     return h5py.File(file_path, "w")
 
 def close_hdf5_file(file: h5py.File):
-    """ Close an h5py file and return the file path for reading from the file later on. """
+    """ Close an h5py file and return the file path for reading from the file later on. An HDF5Writer is flushed and closed. """
+    if isinstance(file, HDF5Writer):
+        return file.close()
     file_path = file.filename
 
     file.close()
 
     return file_path
 
+class GroupBlock:
+    """
+    In-memory copy of an HDF5 group with its attributes, datasets and subgroups, e.g. the results of one rocket.
+    Blocks can be pickled, so they are passed from worker processes to the process that owns the results file.
+    """
+    def __init__(self, attrs: dict = None, datasets: dict = None, groups: dict = None):
+        """
+        @param attrs: Attributes of the group.
+        @param datasets: Dict of dataset name and (array, attributes).
+        @param groups: Dict of subgroup name and GroupBlock.
+        """
+        self.attrs = attrs if attrs is not None else {}
+        self.datasets = datasets if datasets is not None else {}
+        self.groups = groups if groups is not None else {}
+
+    @classmethod
+    def from_group(cls, group: h5py.Group):
+        """ Copies an open HDF5 group into memory. """
+        block = cls(dict(group.attrs))
+        for name, item in group.items():
+            if isinstance(item, h5py.Group):
+                block.groups[name] = cls.from_group(item)
+            else:
+                block.datasets[name] = (item[...], dict(item.attrs))
+        return block
+
+    def write(self, parent, name: str):
+        """ Writes the block as a new group of the given name below an open HDF5 group or file. """
+        group = parent.create_group(name)
+        for key, value in self.attrs.items():
+            group.attrs[key] = value
+        for key, (data, attrs) in self.datasets.items():
+            dataset = group.create_dataset(key, data=data)
+            for attr_key, attr_val in attrs.items():
+                dataset.attrs[attr_key] = attr_val
+        for key, block in self.groups.items():
+            block.write(group, key)
+        return group
+
+
+class HDF5Writer:
+    """
+    Writer thread that owns a results file and writes the blocks it receives over a bounded queue.
+    Producers only hand over finished rocket blocks and never wait for the disk, unless the queue is full, which
+    throttles them to the speed of the disk. Rocket groups are named in the order they are submitted, continuing the
+    numbering of the groups already in the file. Errors of the writer thread are raised in the producer on the next call.
+    """
+    def __init__(self, file, maxPending: int = 64):
+        """
+        @param file: Open HDF5 file or path of the file, a path is opened in append mode.
+        @param maxPending: Maximum number of blocks waiting in the queue before submit blocks.
+        """
+        self.file = h5py.File(file, "a") if isinstance(file, str) else file
+        self.filename = self.file.filename
+        self.queue = queue.Queue(maxsize=maxPending)
+        self.n_groups = count_top_level_groups(self.file)
+        self.lock = threading.Lock()
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        """ Writes the queued items until the end sentinel arrives. """
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                function, args = item
+                function(self.file, *args)
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _check(self):
+        """ Raises the first error of the writer thread. """
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def submit(self, block: GroupBlock, name: str = None):
+        """
+        Queues a group block to be written at the top level of the file.
+        @param block: GroupBlock, e.g. the results of one rocket.
+        @param name: Name of the group, defaults to the next free "rocket N".
+        @return: Name of the group in the file.
+        """
+        self._check()
+        if name is None:
+            with self.lock:
+                name = f"rocket {self.n_groups}"
+                self.n_groups += 1
+        self.queue.put((lambda file, block, name: block.write(file, name), (block, name)))
+        return name
+
+    def call(self, function, *args):
+        """ Queues a function that is called with the open file and the given arguments on the writer thread. """
+        self._check()
+        self.queue.put((function, args))
+
+    def flush(self):
+        """ Waits until all queued items are written and flushes the file. """
+        self.queue.join()
+        self._check()
+        self.file.flush()
+
+    def close(self):
+        """ Writes all queued items, stops the writer thread and closes the file.
+        @return: Path of the file for reading from the file later on.
+        """
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+            self.file.close()
+            self._check()
+        return self.filename
+
+
 def createStateParameterGroup(hdf_file, rocket_group_name,rocket):
     """!Create a metadata group for the rocket in the HDF5 file.
     @param hdf_file: HDF5 file to create the metadata group in.
@@ -252,6 +715,23 @@ def write_state_to_hdf5(hdf_group, data_dict):
     dataset.resize((dataset.shape[0] + 1), axis=0)
     dataset[-1,:] = values
 
+def write_states_to_hdf5(hdf_group, values, exact=False):
+    """Appends a block of state rows (one row per time step) to the state dataset of an open HDF5 group.
+    With exact, an empty dataset is replaced by one holding the block as its only chunk, so no unused rows are allocated.
+    """
+    dataset = hdf_group["state"]
+    n_rows = dataset.shape[0]
+    if exact and n_rows == 0 and values.size > 0:
+        attrs = dict(dataset.attrs)
+        del hdf_group["state"]
+        dataset = hdf_group.create_dataset("state", data=values, maxshape=(None, values.shape[1]), chunks=values.shape)
+        dataset.attrs.update(attrs)
+        return
+    dataset.resize((n_rows + values.shape[0]), axis=0)
+    # sources without state columns only grow in length
+    if values.size > 0:
+        dataset[n_rows:, :] = values
+
 def write_to_hdf5(hdf_group, data_dict):
     """
     Recursively writes data from a nested dictionary to an open HDF5 group or file.
@@ -351,6 +831,9 @@ def read_hdf_to_dict(*file_paths):
     for path in file_paths:
         with h5py.File(path, 'r') as h5file:
             for grp_name, grp in h5file.items():
+                # skip top-level datasets, e.g. the swarm table
+                if not isinstance(grp, h5py.Group):
+                    continue
                 # Manage duplicate top-level names
                 name_counter[grp_name] += 1
                 unique_name = grp_name if name_counter[grp_name] == 1 else f"{grp_name}_{name_counter[grp_name]}"
@@ -394,7 +877,7 @@ def extract_rocket_metrics(
     with h5py.File(file_path, "r") as hdf:
         for rocket_group in hdf:
             group = hdf[rocket_group]
-            if "metadata" not in group:
+            if not isinstance(group, h5py.Group) or "metadata" not in group:
                 continue
             
             metadata = group["metadata"].attrs
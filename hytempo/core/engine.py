@@ -1,5 +1,6 @@
-import ambiance
 from hytempo.core import components, models
+from hytempo.core.atmosphere import get_atmosphere
+from hytempo.core.state import State
 class Engine(components.Component):
     """! Base class for all engines in the rocket"""
     def get_length(self):
@@ -59,7 +60,7 @@ class Liquid_engine(Engine):
             "in_hulltube": hulltube,
             "fuel": input_fuel.get_fluid(),
             "oxidizer": input_oxidizer.get_fluid()}
-        self.state = {
+        self.state = State({
             "time": 0,
             "massflow_fuel": 0,
             "temperature_fuel": 0,
@@ -70,7 +71,7 @@ class Liquid_engine(Engine):
             "massflow": 0,
             "O/F": 0,
             "P_cc": 0,
-            "P_amb": 0}
+            "P_amb": 0})
         self.input_fuel = input_fuel
         self.input_oxidizer = input_oxidizer
         self.isp_model = isp_model
@@ -89,29 +90,35 @@ class Liquid_engine(Engine):
         @return state of the engine
         """
         # update the time
-        self.state["time"] = calling_state["time"]  
+        state = self.state
+        state["time"] = calling_state["time"]  
         # get the state of the inputs
-        fuel_state = self.input_fuel.updateState(self.state)  
-        ox_state = self.input_oxidizer.updateState(self.state)
-        self.state["massflow_fuel"] = fuel_state["massflow"]
-        self.state["temperature_fuel"] = fuel_state["temperature"]
-        self.state["pressure_fuel"] = fuel_state["pressure"]
-        self.state["massflow_ox"] = ox_state["massflow"]
-        self.state["temperature_ox"] = ox_state["temperature"]
-        self.state["pressure_ox"] = ox_state["pressure"]
+        fuel_state = self.input_fuel.updateState(state)  
+        ox_state = self.input_oxidizer.updateState(state)
+        massflow_fuel = fuel_state["massflow"]
+        massflow_ox = ox_state["massflow"]
+        pressure_fuel = fuel_state["pressure"]
+        pressure_ox = ox_state["pressure"]
+        state["massflow_fuel"] = massflow_fuel
+        state["temperature_fuel"] = fuel_state["temperature"]
+        state["pressure_fuel"] = pressure_fuel
+        state["massflow_ox"] = massflow_ox
+        state["temperature_ox"] = ox_state["temperature"]
+        state["pressure_ox"] = pressure_ox
         #calculate the overall mass flow rates and other parameters
-        self.state["massflow"] = ( self.state["massflow_fuel"] + self.state["massflow_ox"])
+        state["massflow"] = massflow_fuel + massflow_ox
         try:
-            self.state["O/F"] = (self.state["massflow_ox"] / self.state["massflow_fuel"]) 
+            state["O/F"] = massflow_ox / massflow_fuel
         except ZeroDivisionError:  # prevent div by zero if the fuel mass flow rate is zero
-            self.state["O/F"] = 0
+            state["O/F"] = 0
         # set the chamber pressure to the minimum of the fuel and oxidizer pressure
-        self.state["P_cc"] = min(self.state["pressure_ox"], self.state["pressure_fuel"])  
+        state["P_cc"] = min(pressure_ox, pressure_fuel)  
 
-        try:
-            self.state["P_amb"] = ambiance.Atmosphere(calling_state["y"]).pressure[0]  # get the ambient pressure
-        except:
-            self.state["P_amb"] = 10e-2
+        # get the ambient pressure, the rocket provides it from its atmosphere lookup
+        if "P_amb" in calling_state:
+            state["P_amb"] = calling_state["P_amb"]
+        else:
+            state["P_amb"] = get_atmosphere().pressure(calling_state["y"])
 
 
 class Solid_engine(Engine):
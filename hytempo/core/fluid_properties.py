@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+
+import CoolProp
+import CoolProp.CoolProp as CP
+
+# property services of the process, keyed by backend
+_SERVICES = {}
+
+
+class FluidProperties:
+    """! Fluid property service built on the low level CoolProp interface.
+    One AbstractState is kept per fluid and reused for every request, which avoids the string parsing and backend
+    lookup of PropsSI. Tabular backends (TTSE, BICUBIC) can be selected for speed; input pairs they do not support are
+    evaluated with the HEOS backend instead. Results are memoised in a bounded least recently used memo. Requests are
+    serialised with a lock, so the service can be shared by several threads.
+    """
+
+    def __init__(self, backend: str = "HEOS", maxSize: int = 65536):
+        """! Constructor of the property service.
+        @param backend: CoolProp backend, e.g. "HEOS", "TTSE&HEOS" or "BICUBIC&HEOS", defaults to HEOS
+        @param maxSize: Maximum number of memoised results, defaults to 65536
+        """
+        self.backend = backend
+        self.max_size = maxSize
+        self.states = {}
+        self.parameters = {}
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _get_state(self, fluid: str, backend: str):
+        """! Returns the AbstractState of a fluid, it is created on the first request.
+        @param fluid: CoolProp name of the fluid
+        @param backend: CoolProp backend of the state
+        @return: AbstractState object.
+        """
+        key = (backend, fluid)
+        if key not in self.states:
+            self.states[key] = CoolProp.AbstractState(backend, fluid)
+        return self.states[key]
+
+    def _get_parameter(self, name: str):
+        """! Returns the CoolProp index of a parameter name.
+        @param name: Name of the parameter as used by PropsSI, e.g. "DMASS"
+        @return: Parameter index.
+        """
+        if name not in self.parameters:
+            self.parameters[name] = CP.get_parameter_index(name)
+        return self.parameters[name]
+
+    def PropsSI(self, output: str, name1: str, prop1: float, name2: str, prop2: float, fluid: str):
+        """! Drop in replacement of CoolProp's PropsSI for a single state.
+        @param output: Name of the output parameter, e.g. "DMASS"
+        @param name1: Name of the first input parameter, e.g. "T"
+        @param prop1: Value of the first input parameter in SI units
+        @param name2: Name of the second input parameter, e.g. "P"
+        @param prop2: Value of the second input parameter in SI units
+        @param fluid: CoolProp name of the fluid
+        @return: Value of the output parameter in SI units.
+        """
+        with self.lock:
+            return self._props(output, name1, prop1, name2, prop2, fluid)
+
+    def _props(self, output: str, name1: str, prop1: float, name2: str, prop2: float, fluid: str):
+        """! Evaluates a property like PropsSI without locking, see PropsSI for the parameters."""
+        key = (fluid, output, name1, prop1, name2, prop2)
+        if key in self.results:
+            self.hits += 1
+            self.results.move_to_end(key)
+            return self.results[key]
+        self.misses += 1
+        pair, value1, value2 = CP.generate_update_pair(self._get_parameter(name1), prop1,
+                                                       self._get_parameter(name2), prop2)
+        state = self._get_state(fluid, self.backend)
+        try:
+            state.update(pair, value1, value2)
+        except ValueError:
+            if self.backend == "HEOS":
+                raise
+            # input pair not supported by the tabular backend
+            state = self._get_state(fluid, "HEOS")
+            state.update(pair, value1, value2)
+        result = state.keyed_output(self._get_parameter(output))
+        self.results[key] = result
+        if len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+        return result
+
+    def density(self, temperature: float, pressure: float, fluid: str):
+        """! Returns the density of a fluid.
+        @param temperature: Temperature in K
+        @param pressure: Pressure in Pa
+        @param fluid: CoolProp name of the fluid
+        @return: Density in kg/m^3.
+        """
+        return self.PropsSI("DMASS", "T", temperature, "P", pressure, fluid)
+
+    def info(self):
+        """! Returns the usage statistics of the memo.
+        @return: Dict with the hits, misses, current size and maximum size.
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.results), "max_size": self.max_size}
+
+    def clear(self):
+        """! Drops all memoised results and resets the statistics."""
+        with self.lock:
+            self.results.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def get_fluid_properties(backend: str = "HEOS"):
+    """! Returns the property service of the process for a CoolProp backend.
+    @param backend: CoolProp backend, defaults to HEOS
+    @return: FluidProperties object.
+    """
+    if backend not in _SERVICES:
+        _SERVICES[backend] = FluidProperties(backend)
+    return _SERVICES[backend]
@@ -1,7 +1,11 @@
+import bisect
+import os
+
 import numpy as np
-from pycea import CEA
 from scipy.interpolate import RegularGridInterpolator, interp1d
 
+from hytempo.core import cea_pool
+
 
 class Model:
     """!Abstract base class for all components in the model.
@@ -283,9 +287,8 @@ class ISP_CEA_Biprop(Model):
     """! This class models the ISP of a bipropellant engine using the CEA library."""
     def __init__(self,engineEfficiency:float):
         """! Constructor of the CEA bipropellant ISP model.
-        Initializes the CEA library and the engine efficiency.
+        Sets the engine efficiency, the CEA instance and the results are shared by all models of the process.
         """
-        self.cea = None
         self.engine_efficiency = engineEfficiency # set the engine efficiency
 
     def apply_model(self,input_state:dict,input_parameters:dict):
@@ -294,14 +297,10 @@ class ISP_CEA_Biprop(Model):
         @param input_state: The input state of the engine
         @return The ISP of the engine.
         """
-        if self.cea == None:                        # check if the CEA object is initialized
-                self.cea = CEA(                     #initialize CEA object with the given propellants
-                    oxName=input_parameters["oxidizer"],
-                    fuelName=input_parameters["fuel"],
-                    fac_CR=None, units="metric")
-                
         if input_state["P_cc"] > 0:                 # check if the chamber pressure is greater than 0
-            isp = self.engine_efficiency * self.cea.estimate_Ambient_Isp(Pc=input_state["P_cc"],
+            isp = self.engine_efficiency * cea_pool.estimate_Ambient_Isp(oxName=input_parameters["oxidizer"],
+                                                                         fuelName=input_parameters["fuel"],
+                                                                         Pc=input_state["P_cc"],
                                                                          MR=input_state["O/F"] , 
                                                                          eps=input_parameters["expansion_ratio_nozzle"],
                                                                          Pamb=input_state["P_amb"],
@@ -311,11 +310,228 @@ class ISP_CEA_Biprop(Model):
             isp = 0        
         return isp
     
+class ISP_Table_Biprop(Model):
+    """! This class models the ISP of a bipropellant engine using a table precomputed with the CEA library.
+    CEA is sampled once on a grid of chamber pressures, mixture ratios, expansion ratios and ambient pressures. The table
+    is stored on disk and interpolated multilinearly at runtime, which replaces the equilibrium solve per thrust
+    evaluation by a lookup of the enclosing grid cell. The interface is the same as the one of ISP_CEA_Biprop.
+    """
+
+    def __init__(self, engineEfficiency: float, oxidizer: str, fuel: str,
+                 chamberPressures: list, mixtureRatios: list, expansionRatios: list, ambientPressures: list,
+                 tableFile: str = None, errorBound: float = None):
+        """! Constructor of the tabulated bipropellant ISP model.
+        Loads the table from the given file if it was sampled for the same propellants and grid, otherwise samples CEA
+        and saves the table to the file.
+        @param engineEfficiency: Efficiency of the engine, applied to the tabulated ISP
+        @param oxidizer: CEA name of the oxidizer
+        @param fuel: CEA name of the fuel
+        @param chamberPressures: Ascending grid of chamber pressures in Pa
+        @param mixtureRatios: Ascending grid of oxidizer to fuel ratios
+        @param expansionRatios: Ascending grid of nozzle expansion ratios
+        @param ambientPressures: Ascending grid of ambient pressures in Pa, must be greater than 0
+        @param tableFile: Path of the .npz file the table is loaded from and saved to, defaults to None (not stored)
+        @param errorBound: Maximum relative error of the table against live CEA, checked after loading or sampling, defaults to None (not checked)
+        """
+        self.engine_efficiency = engineEfficiency
+        self.propellants = (oxidizer, fuel)
+        # axes as lists for the bisection in the lookup
+        self.axes = [list(np.asarray(axis, dtype="float64"))
+                     for axis in (chamberPressures, mixtureRatios, expansionRatios, ambientPressures)]
+        for axis in self.axes:
+            if len(axis) < 2 or np.any(np.diff(axis) <= 0):
+                raise ValueError("Error: The grid axes must be strictly ascending and contain at least two values")
+        if self.axes[3][0] <= 0:
+            raise ValueError("Error: The ambient pressures must be greater than 0")
+        self.table = None
+        if tableFile is not None and os.path.exists(tableFile):
+            self.load_table(tableFile)
+        if self.table is None:
+            self.sample_table()
+            if tableFile is not None:
+                self.save_table(tableFile)
+        if errorBound is not None:
+            error = self.check_error()
+            if error > errorBound:
+                raise ValueError(f"Error: The relative error of the ISP table ({error:.2e}) exceeds the bound of {errorBound:.2e}")
+
+    def _evaluate_cea(self, chamberPressure: float, mixtureRatio: float, expansionRatio: float, ambientPressure: float):
+        """! Evaluates the ideal ISP of the engine with CEA, with the same settings as ISP_CEA_Biprop.
+        @return ISP in s without the engine efficiency.
+        """
+        cea = cea_pool.get_cea(*self.propellants)
+        with cea_pool.LOCK:
+            return cea.estimate_Ambient_Isp(Pc=chamberPressure, MR=mixtureRatio, eps=expansionRatio,
+                                            Pamb=ambientPressure, frozen=0, frozenAtThroat=1)[0]
+
+    def sample_table(self):
+        """! Samples CEA on every point of the grid."""
+        shape = tuple(len(axis) for axis in self.axes)
+        self.table = np.empty(shape)
+        for index in np.ndindex(*shape):
+            self.table[index] = self._evaluate_cea(*(axis[i] for axis, i in zip(self.axes, index)))
+
+    def save_table(self, tableFile: str):
+        """! Saves the table together with its grid and propellants.
+        @param tableFile: Path of the .npz file
+        """
+        np.savez(tableFile, table=self.table, oxidizer=self.propellants[0], fuel=self.propellants[1],
+                 chamberPressures=self.axes[0], mixtureRatios=self.axes[1],
+                 expansionRatios=self.axes[2], ambientPressures=self.axes[3])
+
+    def load_table(self, tableFile: str):
+        """! Loads a table from disk if it was sampled for the propellants and grid of the model.
+        @param tableFile: Path of the .npz file
+        @return True if the table was loaded, False if the file belongs to another propellant pair or grid.
+        """
+        with np.load(tableFile) as data:
+            if (str(data["oxidizer"]), str(data["fuel"])) != self.propellants:
+                return False
+            for axis, name in zip(self.axes, ("chamberPressures", "mixtureRatios", "expansionRatios", "ambientPressures")):
+                if data[name].shape != (len(axis),) or not np.allclose(data[name], axis, rtol=1e-12, atol=0):
+                    return False
+            self.table = data["table"]
+        return True
+
+    def check_error(self, nSamples: int = 20, seed: int = 0):
+        """! Compares the table against live CEA in random points inside the grid.
+        @param nSamples: Number of sample points, defaults to 20
+        @param seed: Seed of the random sample points, defaults to 0
+        @return Maximum relative error of the ISP.
+        """
+        generator = np.random.default_rng(seed)
+        error = 0.0
+        for _ in range(nSamples):
+            point = [generator.uniform(axis[0], axis[-1]) for axis in self.axes]
+            reference = self._evaluate_cea(*point)
+            error = max(error, abs(self.interpolate(*point) - reference) / reference)
+        return error
+
+    def interpolate(self, chamberPressure: float, mixtureRatio: float, expansionRatio: float, ambientPressure: float):
+        """! Interpolates the ideal ISP of the engine from the table.
+        Ambient pressures outside of the grid are clamped to the grid, the other inputs must lie inside the grid.
+        @return ISP in s without the engine efficiency.
+        """
+        ambientPressure = min(max(ambientPressure, self.axes[3][0]), self.axes[3][-1])
+        point = (chamberPressure, mixtureRatio, expansionRatio, ambientPressure)
+        cell = []
+        weights = []
+        for axis, value in zip(self.axes, point):
+            if not axis[0] <= value <= axis[-1]:
+                raise ValueError(f"Error: The value {value} is outside of the ISP table range [{axis[0]}, {axis[-1]}]")
+            index = min(bisect.bisect_right(axis, value) - 1, len(axis) - 2)
+            cell.append(slice(index, index + 2))
+            weights.append((value - axis[index]) / (axis[index + 1] - axis[index]))
+        # multilinear interpolation, reducing one axis of the enclosing cell at a time
+        values = self.table[tuple(cell)]
+        for weight in weights:
+            values = values[0] + (values[1] - values[0]) * weight
+        return float(values)
+
+    def interpolate_array(self, chamberPressures: np.ndarray, mixtureRatios: np.ndarray, expansionRatios: np.ndarray,
+                          ambientPressures: np.ndarray):
+        """! Interpolates the ideal ISP of the engine from the table for many operating points at once.
+        The arguments are broadcast against each other, the limits are the same as for interpolate.
+        @return Array of the ISP in s without the engine efficiency.
+        """
+        points = [np.asarray(value, dtype="float64") for value in
+                  np.broadcast_arrays(chamberPressures, mixtureRatios, expansionRatios, ambientPressures)]
+        points[3] = np.clip(points[3], self.axes[3][0], self.axes[3][-1])
+        for axis, values in zip(self.axes, points):
+            outside = (values < axis[0]) | (values > axis[-1])
+            if np.any(outside):
+                raise ValueError(f"Error: The value {values[outside][0]} is outside of the ISP table range "
+                                 f"[{axis[0]}, {axis[-1]}]")
+        interpolator = RegularGridInterpolator(self.axes, self.table, method="linear")
+        return interpolator(np.stack(points, axis=-1))
+
+    def apply_model(self, input_state: dict, input_parameters: dict):
+        """! Function to calculate the ISP of the engine.
+        Interpolates the ISP of the engine from the precomputed table.
+        @param input_state: The input state of the engine
+        @param input_parameters: The parameters of the engine
+        @return The ISP of the engine.
+        """
+        if (input_parameters["oxidizer"], input_parameters["fuel"]) != self.propellants:
+            raise ValueError(f"Error: The ISP table was sampled for {self.propellants}, "
+                             f"not for {(input_parameters['oxidizer'], input_parameters['fuel'])}")
+        if input_state["P_cc"] > 0:  # check if the chamber pressure is greater than 0
+            isp = self.engine_efficiency * self.interpolate(input_state["P_cc"],
+                                                            input_state["O/F"],
+                                                            input_parameters["expansion_ratio_nozzle"],
+                                                            input_state["P_amb"])
+        else:  # if the chamber pressure is 0, the ISP is set to 0
+            isp = 0
+        return isp
+
+
+class ISP_Curve_Biprop(Model):
+    """! This class models the ISP of a bipropellant engine running at a fixed operating point.
+    With constant chamber pressure, mixture ratio and expansion ratio the ISP only depends on the ambient pressure, so
+    CEA is sampled once along an ambient pressure grid and the curve is interpolated at runtime. Whenever the engine
+    leaves the operating point the ISP is computed with the fallback model instead.
+    """
+
+    def __init__(self, engineEfficiency: float, oxidizer: str, fuel: str,
+                 chamberPressure: float, mixtureRatio: float, expansionRatio: float,
+                 ambientPressures: list = None, tolerance: float = 1e-6, fallbackModel: Model = None):
+        """! Constructor of the ISP curve model.
+        @param engineEfficiency: Efficiency of the engine, applied to the sampled ISP
+        @param oxidizer: CEA name of the oxidizer
+        @param fuel: CEA name of the fuel
+        @param chamberPressure: Chamber pressure of the operating point in Pa
+        @param mixtureRatio: Oxidizer to fuel ratio of the operating point
+        @param expansionRatio: Expansion ratio of the nozzle
+        @param ambientPressures: Ascending grid of ambient pressures in Pa, defaults to 32 points from 0.1 Pa to 1.05 atm
+        @param tolerance: Relative deviation from the operating point up to which the curve is used, defaults to 1e-6
+        @param fallbackModel: Model used outside of the operating point, defaults to ISP_CEA_Biprop
+        """
+        if ambientPressures is None:
+            ambientPressures = np.linspace(10e-2, 1.05 * 101325, 32)
+        self.engine_efficiency = engineEfficiency
+        self.propellants = (oxidizer, fuel)
+        self.operating_point = (chamberPressure, mixtureRatio, expansionRatio)
+        self.tolerance = tolerance
+        if fallbackModel is None:
+            fallbackModel = ISP_CEA_Biprop(engineEfficiency=engineEfficiency)
+        self.fallback_model = fallbackModel
+        self.ambient_pressures = np.asarray(ambientPressures, dtype="float64")
+        if self.ambient_pressures[0] <= 0 or np.any(np.diff(self.ambient_pressures) <= 0):
+            raise ValueError("Error: The ambient pressures must be strictly ascending and greater than 0")
+        self.isp_curve = np.array([cea_pool.estimate_Ambient_Isp(oxName=oxidizer, fuelName=fuel, Pc=chamberPressure,
+                                                                 MR=mixtureRatio, eps=expansionRatio,
+                                                                 Pamb=ambientPressure, frozen=0, frozenAtThroat=1)[0]
+                                   for ambientPressure in self.ambient_pressures])
+
+    def _at_operating_point(self, input_state: dict, input_parameters: dict):
+        """! Checks if the engine runs at the operating point of the curve.
+        @return True if chamber pressure, mixture ratio, expansion ratio and propellants match the operating point.
+        """
+        if (input_parameters["oxidizer"], input_parameters["fuel"]) != self.propellants:
+            return False
+        values = (input_state["P_cc"], input_state["O/F"], input_parameters["expansion_ratio_nozzle"])
+        return all(abs(value - nominal) <= self.tolerance * abs(nominal)
+                   for value, nominal in zip(values, self.operating_point))
+
+    def apply_model(self, input_state: dict, input_parameters: dict):
+        """! Function to calculate the ISP of the engine.
+        Interpolates the ISP curve at the ambient pressure, ambient pressures outside of the grid are clamped to it.
+        @param input_state: The input state of the engine
+        @param input_parameters: The parameters of the engine
+        @return The ISP of the engine.
+        """
+        if input_state["P_cc"] <= 0:  # no chamber pressure, no thrust
+            return 0
+        if not self._at_operating_point(input_state, input_parameters):
+            return self.fallback_model.apply_model(input_state, input_parameters)
+        return self.engine_efficiency * float(np.interp(input_state["P_amb"], self.ambient_pressures, self.isp_curve))
+
+
 class ISP_CEA_Solid(Model):
     """! This class models the ISP of a solid rocket engine using the CEA library."""
 
     def __init__(self):
-        self.cea = None  # initialize CEA object
+        pass  # the CEA instance is shared by all models of the process
 
     def apply_model(self, input_state: dict):
         """! Function to calculate the ISP of the engine.
@@ -323,21 +539,19 @@ class ISP_CEA_Solid(Model):
         @param input_state: The input state of the engine
         @return The ISP of the engine.
         """
-        if self.cea == None:  # check if the CEA object is initialized
-            self.cea = CEA(  # initialize CEA object with the given propellants
-                PropName=input_state["Prop"], fac_CR=None, units="metric"
-            )
         if (
             input_state["P_cc"] > 0
         ):  # check if the chamber pressure is greater than 0
-            isp = self.cea.estimate_Ambient_Isp(
-                Pc=input_state["P_cc"],
-                MR=input_state["O/F"],
-                eps=input_state["expansion_ratio_nozzle"],
-                Pamb=input_state["P_amb"],
-                frozen=0,
-                frozenAtThroat=1,
-            )[0]
+            cea = cea_pool.get_cea(propName=input_state["Prop"])
+            with cea_pool.LOCK:
+                isp = cea.estimate_Ambient_Isp(
+                    Pc=input_state["P_cc"],
+                    MR=input_state["O/F"],
+                    eps=input_state["expansion_ratio_nozzle"],
+                    Pamb=input_state["P_amb"],
+                    frozen=0,
+                    frozenAtThroat=1,
+                )[0]
         else:  # if the chamber pressure is 0, the ISP is set to 0
             isp = 0
         return isp
@@ -0,0 +1,220 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import h5py
+import numpy as np
+
+from hytempo.core.surrogate import Surrogate
+from hytempo.core.swarm_table import SwarmTable
+from hytempo.core.trajectory_estimator import TrajectoryEstimator, run_swarm
+
+# fidelity levels of the evaluations recorded in the results file
+FIDELITY_SURROGATE = 0
+FIDELITY_COARSE = 1
+FIDELITY_FULL = 2
+
+# loose solver settings of the coarse simulations, see DEFAULT_PHASE_SETTINGS of the trajectory estimator
+COARSE_PHASE_SETTINGS = {
+    "rail": {"method": "RK45", "max_step": 0.1, "rtol": 1e-3, "atol": 1e-3},
+    "powered": {"method": "RK45", "max_step": np.inf, "rtol": 1e-3, "atol": 1e-2},
+    "coast": {"method": "RK23", "max_step": np.inf, "rtol": 1e-3, "atol": 1e-1},
+    "descent": {"method": "RK23", "max_step": np.inf, "rtol": 1e-3, "atol": 1e-1},
+}
+
+
+class MultiFidelityOptimiser:
+    """! Optimiser of a rocket metric over the design space of a rocket factory with three levels of fidelity.
+    Every iteration draws candidates from the Sobol sequence of the swarm and ranks them with a surrogate fitted to all
+    simulations so far (fidelity 0). The best candidates are sized and simulated up to the apogee with loose solver
+    tolerances and without output (fidelity 1), and only the best of those are simulated with the default settings and
+    written to the results file with the Observer (fidelity 2). The first iteration has no surrogate yet and simulates
+    a Sobol sample coarsely.
+    Every evaluation is recorded in the swarm table "evaluations" of the results file with the columns iteration,
+    fidelity and the metric, the rocket groups of the full simulations get the attribute fidelity.
+    """
+
+    def __init__(self,
+                 factory,
+                 hdf_file,
+                 metric: str = "apogee",
+                 maximise: bool = True,
+                 nCandidates: int = 4096,
+                 nCoarse: int = 32,
+                 nFull: int = 4,
+                 surrogateKind: str = "gp",
+                 workers: int = None,
+                 coarse_kwargs: dict = None,
+                 estimator_kwargs: dict = None):
+        """! Constructor of the optimiser.
+        @param factory: Rocket factory with sample_swarm, e.g. Liquid_CEA_TypeVTank_RegNitrous
+        @param hdf_file: Open HDF5 results file, the full simulations and the evaluations are written to it
+        @param metric: Name of the metric in the metrics dataset that is optimised
+        @param maximise: Maximise the metric if True, otherwise minimise it
+        @param nCandidates: Number of candidates ranked by the surrogate per iteration
+        @param nCoarse: Number of coarse simulations per iteration
+        @param nFull: Number of full simulations per iteration
+        @param surrogateKind: Kind of the surrogate, "rbf" or "gp"; a Gaussian process ranks by the upper confidence bound
+        @param workers: Number of worker processes, defaults to the number of CPUs
+        @param coarse_kwargs: Keyword arguments of the coarse trajectory estimators, defaults to COARSE_PHASE_SETTINGS
+        @param estimator_kwargs: Keyword arguments of the full trajectory estimators
+        """
+        self.factory = factory
+        self.file = hdf_file
+        self.metric = metric
+        self.sign = 1.0 if maximise else -1.0
+        self.n_candidates = nCandidates
+        self.n_coarse = nCoarse
+        self.n_full = nFull
+        self.surrogate_kind = surrogateKind
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.coarse_kwargs = coarse_kwargs if coarse_kwargs is not None else {"phase_settings": COARSE_PHASE_SETTINGS}
+        self.estimator_kwargs = estimator_kwargs
+        self.evaluations = None
+        self.surrogate = None
+
+    def run(self, iterations: int = 3, seed: int = -1, **swarmKwargs):
+        """! Runs the optimisation.
+        @param iterations: Number of iterations
+        @param seed: Seed of the Sobol sequence, a random seed is drawn if negative
+        @param swarmKwargs: Parameters of the swarm as for sample_swarm, e.g. the bounds and the component list
+        @return: Dict of the parameters and the metric of the best fully simulated design
+        """
+        table = self.factory.sample_swarm(hdf_file=self.file, nRockets=self.n_coarse, sampler="sobol", seed=seed,
+                                          **swarmKwargs)
+        parameterList = self.factory.get_parameter_list(table)
+        self.names = [name for name, param in zip(self.factory.PARAMETER_NAMES, parameterList)
+                      if isinstance(param, list)]
+
+        for iteration in range(iterations):
+            if iteration > 0:
+                # rank the next points of the sequence with the surrogate
+                start = int(table.settings["sequencePosition"])
+                candidates = self.factory.draw_samples("sobol", len(self.names), self.n_candidates,
+                                                       int(table.settings["seed"]), start)
+                table.settings["sequencePosition"] = start + self.n_candidates
+                candidateTable = SwarmTable({"sample": start + np.arange(self.n_candidates)}, table.settings)
+                for j, name in enumerate(self.names):
+                    bounds = parameterList[self.factory.PARAMETER_NAMES.index(name)]
+                    candidateTable.set_column(name, bounds[0] + candidates[:, j] * (bounds[1] - bounds[0]))
+                predicted = self.predict(candidateTable)
+                self.record(candidateTable, iteration, FIDELITY_SURROGATE, predicted)
+                best = np.argsort(-self.sign * self.score(candidateTable, predicted))[:self.n_coarse]
+                table = self.factory.size_table(parameterList, candidates[best], start, table.settings)
+                table.set_column("sample", start + best)
+
+            # coarse simulations of the promising designs
+            coarse = self.simulate_coarse(table)
+            self.record(table, iteration, FIDELITY_COARSE, coarse)
+            # full simulations of the best coarse designs
+            valid = np.flatnonzero(np.isfinite(coarse))
+            best = valid[np.argsort(-self.sign * coarse[valid])[:self.n_full]]
+            full = self.simulate_full(table.select(best))
+            self.record(table.select(best), iteration, FIDELITY_FULL, full)
+            self.surrogate = self.fit()
+            print(f"Optimisation iteration {iteration}: best {self.metric} {self.get_best()[self.metric]}")
+
+        return self.get_best()
+
+    def predict(self, table: SwarmTable):
+        """! Predicts the metric of designs with the surrogate (fidelity 0)."""
+        return self.surrogate.predict_table(table)[self.metric]
+
+    def score(self, table: SwarmTable, predicted: np.ndarray):
+        """! Returns the ranking score of candidates, the upper confidence bound for Gaussian process surrogates."""
+        if self.surrogate.kind != "gp":
+            return predicted
+        std = self.surrogate.predict_std(np.column_stack([table[name] for name in self.names]))[:, 0]
+        return predicted + self.sign * 2.0 * std
+
+    def simulate_coarse(self, table: SwarmTable):
+        """! Simulates designs up to the apogee with the coarse settings, without writing the trajectories (fidelity 1).
+        @param table: SwarmTable of the designs
+        @return: Array of the metric, NaN for failed simulations
+        """
+        rockets = list(self.factory.iter_table(table))
+        chunks = [chunk for chunk in np.array_split(np.arange(len(rockets)), self.workers) if len(chunk)]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(simulate_metrics, [rockets[i] for i in chunk], self.metric, self.coarse_kwargs)
+                       for chunk in chunks]
+            return np.concatenate([future.result() for future in futures])
+
+    def simulate_full(self, table: SwarmTable):
+        """! Simulates designs with the full estimator and writes them to the results file (fidelity 2).
+        @param table: SwarmTable of the designs
+        @return: Array of the metric, NaN for failed simulations
+        """
+        names = run_swarm(self.factory.iter_table(table), self.file, workers=self.workers,
+                          estimator_kwargs=self.estimator_kwargs)
+        values = np.full(len(names), np.nan)
+        for i, name in enumerate(names):
+            group = self.file[name]
+            group.attrs["fidelity"] = FIDELITY_FULL
+            if "metrics" in group:
+                values[i] = read_metric(group["metrics"], self.metric)
+        return values
+
+    def record(self, table: SwarmTable, iteration: int, fidelity: int, values: np.ndarray):
+        """! Appends evaluations to the evaluation table and writes it to the results file.
+        @param table: SwarmTable of the evaluated designs
+        @param iteration: Iteration of the evaluations
+        @param fidelity: Fidelity level of the evaluations
+        @param values: Evaluated metric of the designs
+        """
+        columns = {"sample": table["sample"],
+                   "iteration": np.full(len(table), iteration),
+                   "fidelity": np.full(len(table), fidelity)}
+        for name in self.names:
+            columns[name] = table[name]
+        columns[self.metric] = values
+        evaluations = SwarmTable(columns)
+        self.evaluations = evaluations if self.evaluations is None else self.evaluations.concatenate(evaluations)
+        self.evaluations.to_hdf5(self.file, "evaluations")
+
+    def fit(self):
+        """! Fits the surrogate to the simulated designs, full simulations replace the coarse ones of the same design.
+        @return: Fitted Surrogate
+        """
+        simulated = self.evaluations.filter((self.evaluations["fidelity"] > FIDELITY_SURROGATE)
+                                            & np.isfinite(self.evaluations[self.metric]))
+        # keep the evaluation of the highest fidelity per design
+        order = np.lexsort((-simulated["fidelity"], simulated["sample"]))
+        _, first = np.unique(simulated["sample"][order], return_index=True)
+        simulated = simulated.select(order[first])
+        return Surrogate(self.names, [self.metric], kind=self.surrogate_kind).fit(
+            np.column_stack([simulated[name] for name in self.names]), simulated[self.metric])
+
+    def get_best(self):
+        """! Returns the best fully simulated design.
+        @return: Dict of the parameters and the metric of the design
+        """
+        full = self.evaluations.filter((self.evaluations["fidelity"] == FIDELITY_FULL)
+                                       & np.isfinite(self.evaluations[self.metric]))
+        if len(full) == 0:
+            raise ValueError("Error: No full simulation finished successfully")
+        return full.row(int(np.argmax(self.sign * full[self.metric])))
+
+
+def read_metric(dataset: h5py.Dataset, metric: str):
+    """! Reads a single metric from a metrics dataset."""
+    columns = [col.decode() if isinstance(col, bytes) else col for col in dataset.attrs["columns"]]
+    return float(dataset[columns.index(metric)])
+
+
+def simulate_metrics(rockets: list, metric: str, estimator_kwargs: dict):
+    """! Simulates rockets up to the apogee into an in-memory file and returns a metric. This is the task executed by
+    the workers of the coarse simulations.
+    @param rockets: List of Rocket objects
+    @param metric: Name of the metric
+    @param estimator_kwargs: Keyword arguments of the trajectory estimators
+    @return: Array of the metric, NaN for failed simulations
+    """
+    values = np.full(len(rockets), np.nan)
+    with h5py.File(f"coarse_{os.getpid()}.h5", "w", driver="core", backing_store=False) as scratch:
+        for i, indRocket in enumerate(rockets):
+            sim = TrajectoryEstimator(indRocket, scratch, **estimator_kwargs)
+            try:
+                sim.integrate_trajectory("ascent")
+                values[i] = read_metric(scratch[sim.observer.rocket_group_name]["metrics"], metric)
+            except Exception as e:
+                print(f"Simulation failed for rocket {indRocket.name}: {e}. Skipping...")
+    return values
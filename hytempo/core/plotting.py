@@ -357,6 +357,78 @@ class PerformancePlotter(Plotter):
 
         # Return figure, in case the user wants to modify it
         return f
+
+    def plot_surrogate_2D(self,
+                          surrogate,
+                          x:str,
+                          y:str,
+                          z:str,
+                          fixed_params:dict=None,
+                          resolution:int=100,
+                          xlabel:str=None,
+                          ylabel:str=None,
+                          zlabel:str=None,
+                          export_path=None):
+        """Plot a smooth map of metric z over the parameters x and y predicted by a surrogate, with the simulated rockets on top.
+        @param surrogate: Fitted Surrogate with x and y among its parameters and z among its metrics
+        @param fixed_params: Values of the other parameters of the surrogate, defaults to the middle of their training range
+        @param resolution: Number of grid points per axis
+        """
+        # Grid over the training range of x and y
+        points = surrogate.points
+        xIndex = surrogate.parameters.index(x)
+        yIndex = surrogate.parameters.index(y)
+        xGrid, yGrid = np.meshgrid(np.linspace(points[:, xIndex].min(), points[:, xIndex].max(), resolution),
+                                   np.linspace(points[:, yIndex].min(), points[:, yIndex].max(), resolution))
+        grid = np.tile(0.5 * (points.min(axis=0) + points.max(axis=0)), (xGrid.size, 1))
+        if fixed_params is not None:
+            for key, value in fixed_params.items():
+                grid[:, surrogate.parameters.index(key)] = value
+        grid[:, xIndex] = xGrid.ravel()
+        grid[:, yIndex] = yGrid.ravel()
+        zGrid = surrogate.predict(grid)[:, surrogate.metrics.index(z)].reshape(xGrid.shape)
+
+        # Plot
+        # Set matplotlib parameters for latex, font size and line width
+        mpl.rcParams["text.usetex"] = True
+        mpl.rcParams["font.size"] = 22
+        #set figure size
+        mpl.rcParams["figure.figsize"] = (10, 8)
+
+        f = plt.figure()
+        ax = f.add_subplot(111)
+
+        tcf = ax.contourf(xGrid, yGrid, zGrid, levels=20)
+        ax.scatter(points[:, xIndex], points[:, yIndex], c="k", s=10)
+
+        cb = f.colorbar(tcf)
+
+        if xlabel is None:
+            ax.set_xlabel(f"{x}")
+        else:
+            ax.set_xlabel(xlabel)
+        if ylabel is None:
+            ax.set_ylabel(f"{y}")
+        else:
+            ax.set_ylabel(ylabel)
+        if zlabel is None:
+            cb.set_label(z)
+        else:
+            cb.set_label(zlabel)
+        # Use scientific notation for axis labels
+        ax.ticklabel_format(style='sci', axis='both', scilimits=(0,0))
+        # Adjust the offset text position for better appearance
+        ax.xaxis.get_offset_text().set_fontsize(18)
+        ax.yaxis.get_offset_text().set_fontsize(18)
+        f.tight_layout()
+        if export_path is None:
+            f.savefig("performance_plot_surrogate_2D.png",dpi=300)
+        else:
+            f.savefig(export_path,dpi=300)
+
+        # Return figure, in case the user wants to modify it
+        return f
+
     def plot_2D_Slice(self,
                 x:str,
                 y:str,
@@ -1,9 +1,10 @@
 from math import cos, radians, sin, tan
 
-import ambiance
 import numpy as np
 
 from hytempo.core import components, engine, models
+from hytempo.core.atmosphere import get_atmosphere
+from hytempo.core.state import State, StateStore
 
 
 class Rocket(components.Component):
@@ -49,7 +50,7 @@ class Rocket(components.Component):
         #add the provided parameters to the parameter dict
         self.parameters.update(parameters)
         #initialize the state of the rocket
-        self.state = {"time":0,
+        self.state = State({"time":0,
                     "O/F": parameters["of"],
                     "mass":self.get_mass(),
                     "thrust":0,
@@ -62,8 +63,14 @@ class Rocket(components.Component):
                     "a_x":0,
                     "a_y":0,
                     "Ma":0,
+                    "P_amb":0,
                     "onRail":True
-                    }
+                    })
+        # one vector holds the states of the rocket and all of its parts, the observer and the solver read views of it
+        self.state_store = StateStore([self] + component_list + tank_list + engine_list)
+        self.position_span = self.state.span("x", "v_y")
+        # v_x, v_y, a_x and a_y are adjacent as well, they are the derivatives of the position and velocity
+        self.derivative_span = self.state.span("v_x", "a_y")
     def get_length(self):
         """!Get the length of the rocket.
         @return: Length of the rocket in m."""
@@ -91,55 +98,76 @@ class Rocket(components.Component):
         @return: Pressure of the tanks of the rocket."""
         return self.tank_list[0].state["pressure"]
 
+    def get_state_vector(self):
+        """!Get the integrated state of the rocket.
+        @return: State vector in the format of [x,y,v_x,v_y,fluid masses of the tanks]."""
+        return np.array([self.state["x"], self.state["y"], self.state["v_x"], self.state["v_y"]]
+                        + [tank.get_fluid_mass() for tank in self.tank_list], dtype="float64")
+
     def compute_right_hand_side(
-        self, time: float, position_and_velocity: np.ndarray
+        self, time: float, state_vector: np.ndarray
     ):
         """! Computes the right hand side of the ODE using the current state of the rocket.
         @param time: Time of the state.
-        @param position_and_velocity: Position and velocity of the state.
-        @return: Right hand side of the ODE in the format of [v_x,v_y,a_x,a_y]."""
+        @param state_vector: Integrated state in the format of [x,y,v_x,v_y,fluid masses of the tanks].
+        The result only depends on the time, the state vector and the committed state of the rocket, so the
+        method can be evaluated by the solver as often as needed.
+        @return: State of the rocket, the derivatives of the fluid masses are the negative mass flows of the tanks."""
         "Update the state of the rocket."
-        self.state["time"] = time
-        self.state["x"] = position_and_velocity[0]
-        self.state["y"] = position_and_velocity[1]
-        self.state["v_x"] = position_and_velocity[2]
-        self.state["v_y"] = position_and_velocity[3]
-        try:
-            self.state["Ma"] = (np.sqrt(self.state["v_x"] ** 2 + self.state["v_y"] ** 2)/
-                                ambiance.Atmosphere(self.state["y"]).speed_of_sound[0])
-        except:
-            self.state["Ma"] = (np.sqrt(self.state["v_x"] ** 2 + self.state["v_y"] ** 2)/ 
-                                ambiance.Atmosphere(80000).speed_of_sound[0])
-        if self.state["onRail"] == False:
+        state = self.state
+        state["time"] = time
+        # x, y, v_x and v_y are adjacent in the state, they are written at once
+        state.array[self.position_span] = state_vector[:4]
+        v_x, v_y = state_vector[2], state_vector[3]
+        for tank, fluid_mass in zip(self.tank_list, state_vector[4:]):
+            tank.state["fluid_mass"] = fluid_mass
+        # one atmosphere lookup per evaluation, shared by the rocket, the drag model and the engines
+        density, state["P_amb"], speed_of_sound = get_atmosphere().evaluate(state_vector[1])
+        state["Ma"] = np.sqrt(v_x ** 2 + v_y ** 2) / speed_of_sound
+        on_rail = state["onRail"]
+        if not on_rail:
             # calculate the angle of the rocket from the speed components
-            self.state["angle"] = (np.arctan2(self.state["v_y"], self.state["v_x"]) * 180 / np.pi)
+            state["angle"] = np.arctan2(v_y, v_x) * 180 / np.pi
+        angle = state["angle"]
 
         for engine in self.engine_list:
-            engine.updateState(self.state)
-        self.state["mass"] = self.get_mass()
-        self.state["thrust"] = self.compute_thrust()
-        self.state["drag"] = self.compute_drag()
+            engine.updateState(state)
+        mass = self.get_mass()
+        thrust = self.compute_thrust()
+        drag = self.compute_drag(density)
+        state["mass"] = mass
+        state["thrust"] = thrust
+        state["drag"] = drag
         # Compute the normal acceleration of the rocket.
-        normal_accelaration = (
-            self.state["thrust"] - self.state["drag"]
-        ) / self.state["mass"]
+        normal_accelaration = (thrust - drag) / mass
         # Split normal acceleration into x and y components.
-        if self.state["onRail"] == False:
-            self.state["a_y"] = (
-                sin(radians(self.state["angle"])) * normal_accelaration - 9.81
-            )
-            self.state["a_x"] = (
-                cos(radians(self.state["angle"])) * normal_accelaration
-            )
-       
+        a_y = sin(radians(angle)) * normal_accelaration - 9.81
+        if not on_rail:
+            a_x = cos(radians(angle)) * normal_accelaration
         else:
-            self.state["a_y"] = (
-                sin(radians(self.state["angle"])) * normal_accelaration - 9.81
-            )
-            self.state["a_x"] = self.state["a_y"] / tan(
-                radians(self.state["angle"])
-            )
-        return self.state
+            a_x = a_y / tan(radians(angle))
+        state["a_x"] = a_x
+        state["a_y"] = a_y
+        return state
+
+    def commit_state(self, time: float, state_vector: np.ndarray):
+        """! Commits the state of the rocket for an accepted solver step.
+        The tanks commit their fluid masses first, then the right hand side is evaluated once at the accepted step, so the
+        state dicts describe the step. Finally the rocket is disconnected from the rail once it has left it.
+        @param time: Time of the accepted step.
+        @param state_vector: Integrated state of the accepted step."""
+        for tank, fluid_mass in zip(self.tank_list, state_vector[4:]):
+            tank.state["fluid_mass"] = fluid_mass
+            tank.commitState()
+        self.compute_right_hand_side(time, state_vector)
+        # Check if the rocket has left the rail in the last step
+        if self.state["onRail"] and self.state["y"] > self.rail_height:
+            # Disconnect the rocket from the rail
+            self.state["onRail"] = False
+
+    def leave_rail(self):
+        """! Disconnects the rocket from the rail, from now on the flight direction follows the velocity."""
+        self.state["onRail"] = False
 
     def get_mass(self):
         """!Get the mass of the rocket.
@@ -175,19 +203,15 @@ class Rocket(components.Component):
             thrust += engine.thrust()
         return thrust
 
-    def compute_drag(self):
+    def compute_drag(self, density: float = None):
         """! Computes the drag of the rocket
         This method computes the drag of the rocket based on the current state of the rocket and the drag model.
+        @param density: Density of the ambient air in kg/m^3, defaults to the density of the atmosphere at the current
+        altitude
         @return: Drag of the rocket in N
         """
-        try:
-            density = ambiance.Atmosphere(self.state["y"]).density[0]
-        except:
-            density = 10e-6
-            print(
-                "Warning: The altitude is out of the atmosphere model range. The density is set to 10e-6 kg/m^3."
-            )
-
+        if density is None:
+            density = get_atmosphere().evaluate(self.state["y"])[0]
         return (
             self.drag_model.apply_model(self.state, self.parameters)
             * self.parameters["Frontal_area"]
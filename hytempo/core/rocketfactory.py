@@ -1,20 +1,33 @@
+import copy
 import math
 import os
 import inspect
+import queue
+import threading
+from functools import partial
 import numpy as np
-from scipy.optimize import root_scalar
-from CoolProp.CoolProp import PropsSI
-from pycea import CEA
 from scipy.stats import qmc
-from hytempo.core import components, models,engine,rocket
+from hytempo.core import cea_pool, components, models,engine,rocket
+from hytempo.core.data_handling import HDF5Writer
+from hytempo.core.fluid_properties import get_fluid_properties
+from hytempo.core.swarm_table import SwarmTable
 import h5py
 
 
 class RocketFactory():
     """! This is the abstract base class for all rocket factories. It defines the interface for all factories."""
 
-    def __init__(self):
-        pass
+    def __init__(self, propertyBackend: str = "HEOS", pressurantGridResolution: float = None):
+        """! Constructor of the factory.
+        @param propertyBackend: CoolProp backend of the fluid properties used for sizing, e.g. "HEOS" or "BICUBIC&HEOS", defaults to HEOS
+        @param pressurantGridResolution: Relative pressure spacing of the grid the pressurant volume ratios are interpolated on, e.g. 0.02, defaults to None (only exactly repeated conditions are reused)
+        """
+        self.properties = get_fluid_properties(propertyBackend)
+        self.pressurant_grid_resolution = pressurantGridResolution
+        # pressurant volume per propellant tank volume, keyed by (pressurant, temperature, tank pressure, pressurant pressure)
+        self.pressurant_ratios = {}
+        # inverse of the ratio on the interpolation grid, keyed by (pressurant, temperature, grid indices)
+        self.pressurant_grid_ratios = {}
 
     def build_swarm(self):
         pass
@@ -22,6 +35,121 @@ class RocketFactory():
     def build_rocket(self):
         pass
 
+    def draw_samples(self, sampler: str, dimension: int, nSamples: int, seed: int, start: int = 0):
+        """! Draws samples of the design space in the unit hypercube.
+        The scrambled Sobol and Halton sequences are fully determined by the seed, so a sample can be continued by
+        skipping the points drawn before. A latin hypercube can not be extended and only starts at position 0.
+        @param sampler: "lhs", "sobol" or "halton"
+        @param dimension: Number of variable parameters
+        @param nSamples: Number of samples
+        @param seed: Seed of the sampler
+        @param start: Position in the sequence of the first sample, defaults to 0
+        @return: Array of shape (nSamples, dimension) with values in [0,1)
+        """
+        if dimension == 0:
+            return np.empty((nSamples, 0))
+        if sampler == "lhs":
+            if start != 0:
+                raise ValueError("Error: A latin hypercube sample can not be extended, use the sobol or halton sampler")
+            return qmc.LatinHypercube(d=dimension, seed=seed).random(n=nSamples)
+        if sampler == "sobol":
+            engine_qmc = qmc.Sobol(d=dimension, scramble=True, seed=seed)
+        elif sampler == "halton":
+            engine_qmc = qmc.Halton(d=dimension, scramble=True, seed=seed)
+        else:
+            raise ValueError(f"Error: Unknown sampler {sampler}, use lhs, sobol or halton")
+        if start > 0:
+            engine_qmc.fast_forward(start)
+        return engine_qmc.random(n=nSamples)
+
+    def get_pressurant_volume_ratio(self,
+                                    tank_pressure: float,
+                                    pressurant_pressure_init: float,
+                                    pressurant_temperature_init: float,
+                                    pressurant: str):
+        """! Calculates the pressurant volume needed per unit volume of a propellant tank.
+        The pressurant leaves its tank and fills the propellant tank without heat exchange, with the specific enthalpy
+        of both gas volumes staying at the initial value. The pressurant tank is exhausted once its pressure drops to
+        the end of life margin above the tank pressure, so the expelled mass is the density difference between the
+        initial and the end of life state, which fills the propellant tank at the tank pressure.
+        Compared to marching the tank down in 1000 mass increments, the result is larger by less than 1/(1000*f), with
+        f the expelled fraction of the pressurant mass, because the march overshoots the end of life pressure by up to
+        one increment.
+        @param tank_pressure: Pressure of the tank
+        @param pressurant_pressure_init: Initial pressure of the pressurant
+        @param pressurant_temperature_init: Initial temperature of the pressurant
+        @param pressurant: Name of the pressurant
+        @return: pressurant volume per propellant tank volume
+        """
+        "Pressure margin in pressurant tank at EOL"
+        pressure_margin = 1.2
+        p_p_eol = pressure_margin * tank_pressure
+
+        # initial state in the pressurant tank
+        rho_p_init = self.properties.PropsSI('DMASS',
+                                             'P', pressurant_pressure_init,
+                                             'T', pressurant_temperature_init,
+                                             pressurant)
+        h_p = self.properties.PropsSI('HMASS',
+                                      'P', pressurant_pressure_init,
+                                      'T', pressurant_temperature_init,
+                                      pressurant)
+        # pressurant tank at EOL and expelled pressurant in the propellant tank
+        rho_p_eol = self.properties.PropsSI('DMASS', 'P', p_p_eol, 'HMASS', h_p, pressurant)
+        rho_t = self.properties.PropsSI('DMASS', 'P', tank_pressure, 'HMASS', h_p, pressurant)
+        if rho_p_eol >= rho_p_init:
+            raise ValueError("Error: The initial pressurant pressure must exceed the end of life pressure "
+                             f"of {p_p_eol} Pa")
+        return rho_t / (rho_p_init - rho_p_eol)
+
+    def get_cached_pressurant_volume_ratio(self,
+                                           tank_pressure: float,
+                                           pressurant_pressure_init: float,
+                                           pressurant_temperature_init: float,
+                                           pressurant: str):
+        """! Returns the pressurant volume per unit tank volume, reusing the ratios computed for earlier tanks.
+        Without a grid resolution only identical conditions are reused. With a resolution, the inverse of the ratio,
+        which is close to linear in the pressures, is interpolated bilinearly on a grid in the logarithms of the tank
+        pressure and of the pressure ratio, and the grid points are computed on first use. Close to the end of life
+        margin, where the grid points are no valid conditions, the ratio is computed directly.
+        @param tank_pressure: Pressure of the tank
+        @param pressurant_pressure_init: Initial pressure of the pressurant
+        @param pressurant_temperature_init: Initial temperature of the pressurant
+        @param pressurant: Name of the pressurant
+        @return: pressurant volume per propellant tank volume
+        """
+        if self.pressurant_grid_resolution is None:
+            key = (pressurant, pressurant_temperature_init, tank_pressure, pressurant_pressure_init)
+            if key not in self.pressurant_ratios:
+                self.pressurant_ratios[key] = self.get_pressurant_volume_ratio(
+                    tank_pressure, pressurant_pressure_init, pressurant_temperature_init, pressurant)
+            return self.pressurant_ratios[key]
+
+        step = math.log1p(self.pressurant_grid_resolution)
+        position_tank = math.log(tank_pressure) / step
+        position_ratio = math.log(pressurant_pressure_init / tank_pressure) / step
+        index_tank = math.floor(position_tank)
+        index_ratio = math.floor(position_ratio)
+        weight_tank = position_tank - index_tank
+        weight_ratio = position_ratio - index_ratio
+        inverse_ratio = 0.0
+        try:
+            for offset_tank, offset_ratio in ((0, 0), (1, 0), (0, 1), (1, 1)):
+                key = (pressurant, pressurant_temperature_init, index_tank + offset_tank, index_ratio + offset_ratio)
+                if key not in self.pressurant_grid_ratios:
+                    grid_tank_pressure = math.exp((index_tank + offset_tank) * step)
+                    grid_pressurant_pressure = grid_tank_pressure * math.exp((index_ratio + offset_ratio) * step)
+                    self.pressurant_grid_ratios[key] = 1 / self.get_pressurant_volume_ratio(
+                        grid_tank_pressure, grid_pressurant_pressure, pressurant_temperature_init, pressurant)
+                inverse_ratio += (self.pressurant_grid_ratios[key]
+                                  * (weight_tank if offset_tank else 1 - weight_tank)
+                                  * (weight_ratio if offset_ratio else 1 - weight_ratio))
+        except ValueError:
+            # grid cell reaches beyond the end of life margin
+            return self.get_pressurant_volume_ratio(tank_pressure, pressurant_pressure_init,
+                                                    pressurant_temperature_init, pressurant)
+        return 1 / inverse_ratio
+
     def get_pressurant_volume(self,
                               tank_vol: float,
                               tank_pressure: float,
@@ -29,7 +157,8 @@ class RocketFactory():
                               pressurant_temperature_init: float,
                               pressurant: str):
         """! Calculates the pressurant and volume for a given tank volume, pressure and temperature.
-        Ideal gas is assumed for the pressurant.
+        See get_pressurant_volume_ratio for the model of the pressurant blowdown, the ratio is reused across tanks
+        with get_cached_pressurant_volume_ratio.
         @param tank_vol: Volume of the tank
         @param tank_pressure: Pressure of the tank
         @param pressurant_pressure_init: Initial pressure of the pressurant
@@ -37,66 +166,37 @@ class RocketFactory():
         @param pressurant: Name of the pressurant
         @return: pressurant volume
         """
+        return tank_vol * self.get_cached_pressurant_volume_ratio(tank_pressure=tank_pressure,
+                                                                  pressurant_pressure_init=pressurant_pressure_init,
+                                                                  pressurant_temperature_init=pressurant_temperature_init,
+                                                                  pressurant=pressurant)
 
-        "Pressure margin in pressurant tank at EOL"
-        pressure_margin = 1.2
-        p_p_eol = pressure_margin * tank_pressure
-
-        def pressurant_residual(V_p:float):
-            # Initialize thermodynamic state in pressurant tank
-            p_p = pressurant_pressure_init
-            rho_p = PropsSI('DMASS',
-                               'P', pressurant_pressure_init,
-                               'T', pressurant_temperature_init,
-                               pressurant)
-            m_p = rho_p * V_p
-            H_p = (PropsSI('HMASS',
-                               'P', pressurant_pressure_init,
-                               'T', pressurant_temperature_init,
-                               pressurant)
-                   * m_p)
-
-            # Initialize thermodynamic state in propellant tank
-            m_t = 0     # Assume no pressurant in propellant tank initially
-            H_t = 0     # Assume no pressurant in propellant tank initially
-            V_t = 0
-
-            # Set mass increment
-            dm = m_p / 1e3
-
-            # Loop, end pressure is reached
-            while p_p > p_p_eol:
-                # Substract mass increment from pressurant tank
-                H_p -= dm * H_p/m_p
-                m_p -= dm
-
-                # New pressurant pressure from new density and new enthalpy
-                rho_p = m_p / V_p
-                p_p = PropsSI('P',
-                              'DMASS', rho_p,
-                              'HMASS', H_p/m_p,
-                              pressurant)
-
-                # Add mass increment to propellant tank
-                m_t += dm
-                H_t += dm * H_p/m_p
-
-                # New pressurant volume in propellant tank
-                V_t = m_t / PropsSI('DMASS',
-                                    'P', tank_pressure,
-                                    'HMASS', H_t / m_t,
-                                    pressurant)
-            # Residual: tank volume - expelled volume
-            return tank_vol - V_t
-
-        # Optimization: find correct pressurant volume, such that residual vanishes
-        # Initial guesses are an overestimation, which fits the residual definition
-        # sol = root_scalar(pressurant_residual, method="brentq", bracket=[tank_vol/100, tank_vol])
-        sol = root_scalar(pressurant_residual, x0=tank_vol/10, x1=tank_vol/2)
-
-        pressurant_vol = sol.root
-
-        return pressurant_vol
+    def get_pressurant_volumes(self,
+                               tank_vols: np.ndarray,
+                               tank_pressures: np.ndarray,
+                               pressurant_pressures_init: np.ndarray,
+                               pressurant_temperatures_init: np.ndarray,
+                               pressurant: str):
+        """! Calculates the pressurant volumes for many tanks at once.
+        The arguments are broadcast against each other, the fluid states are only evaluated once per distinct
+        combination of pressures and temperature.
+        @param tank_vols: Volumes of the tanks
+        @param tank_pressures: Pressures of the tanks
+        @param pressurant_pressures_init: Initial pressures of the pressurant
+        @param pressurant_temperatures_init: Initial temperatures of the pressurant
+        @param pressurant: Name of the pressurant
+        @return: Array of pressurant volumes
+        """
+        tank_vols, tank_pressures, pressurant_pressures_init, pressurant_temperatures_init = np.broadcast_arrays(
+            *(np.asarray(value, dtype="float64") for value in
+              (tank_vols, tank_pressures, pressurant_pressures_init, pressurant_temperatures_init)))
+        conditions = np.stack((tank_pressures.ravel(),
+                               pressurant_pressures_init.ravel(),
+                               pressurant_temperatures_init.ravel()), axis=1)
+        unique_conditions, inverse = np.unique(conditions, axis=0, return_inverse=True)
+        ratios = np.array([self.get_cached_pressurant_volume_ratio(*condition, pressurant=pressurant)
+                           for condition in unique_conditions])
+        return tank_vols * ratios[inverse.ravel()].reshape(tank_vols.shape)
 
     def get_pressurant_vol(self,
                            tank_vol:float,
@@ -107,7 +207,7 @@ class RocketFactory():
             
         #pressurant_coefficent_exp= PropsSI("ISENTROPIC_EXPANSION_COEFFICIENT","T",pressurant_temp_init,"P",pressurant_pressure_init,pressurant_coolprop)
         pressurant_coefficent_exp= 1 # Isothermic expansion
-        pressurant_density_init = PropsSI("DMASS","T",pressurant_temp_init,"P",pressurant_pressure_init,pressurant_coolprop)
+        pressurant_density_init = self.properties.PropsSI("DMASS","T",pressurant_temp_init,"P",pressurant_pressure_init,pressurant_coolprop)
         pressurant_density_exp = (
             math.pow(
                 (tank_pressure / pressurant_pressure_init),
@@ -120,6 +220,18 @@ class RocketFactory():
         )
         return pressurant_vol
 
+    def get_densities(self, temperature: float, pressures: np.ndarray, fluid: str):
+        """! Calculates the densities of a fluid for an array of pressures, each distinct pressure is evaluated once.
+        @param temperature: Temperature of the fluid
+        @param pressures: Array of pressures
+        @param fluid: Coolprop name of the fluid
+        @return: Array of densities
+        """
+        pressures = np.asarray(pressures, dtype="float64")
+        unique_pressures, inverse = np.unique(pressures, return_inverse=True)
+        densities = np.array([self.properties.density(temperature, pressure, fluid) for pressure in unique_pressures])
+        return densities[inverse.ravel()].reshape(pressures.shape)
+
     def get_fluid_mass(
         self,
         fluid_vol: float,
@@ -127,30 +239,46 @@ class RocketFactory():
         fluid_pressure: float,
         fluid_coolprop: str,
     ):
-        fluid_density = PropsSI(
+        fluid_density = self.properties.PropsSI(
             "DMASS", "T", fluid_temp, "P", fluid_pressure, fluid_coolprop
         )
         fluid_mass = fluid_vol * fluid_density
         return fluid_mass
 
-    def create_hull_tube(
+    def get_hull_tube_mass(
         self,
-        component_list: list,
-        diameter: float,
+        hull_length,
+        diameter,
         wall_thickness: float = 0.002,
         density_material: float = 1600,
     ):
-        hull_length = 0
-        for component in component_list:
-            hull_length += component.get_hull_length()
+        """! Calculates the mass of the hull tube, works on floats and on numpy arrays.
+        @param hull_length: Length of the hull tube
+        @param diameter: Outer diameter of the hull tube
+        @param wall_thickness: Wall thickness of the hull tube, defaults to 0.002m
+        @param density_material: Density of the hull tube material, defaults to 1600kg/m^3
+        @return: mass of the hull tube
+        """
         outer_rad = diameter / 2
         inner_rad = outer_rad - wall_thickness
-        hull_mass = (
+        return (
             hull_length
             * math.pi
-            * (math.pow(outer_rad, 2) - math.pow(inner_rad, 2))
+            * (outer_rad ** 2 - inner_rad ** 2)
             * density_material
         )
+
+    def create_hull_tube(
+        self,
+        component_list: list,
+        diameter: float,
+        wall_thickness: float = 0.002,
+        density_material: float = 1600,
+    ):
+        hull_length = 0
+        for component in component_list:
+            hull_length += component.get_hull_length()
+        hull_mass = self.get_hull_tube_mass(hull_length, diameter, wall_thickness, density_material)
         hull_tube = components.Component(
             name="Hull Tube",
             mass=hull_mass,
@@ -158,83 +286,111 @@ class RocketFactory():
             hulltube=False,
         )
         return hull_tube
-    
-    def createTank(self,
-                    fluid:str,
-                    fluidCoolprop:str,
-                    rocketDiameter:float,
-                    safety:float,
-                    volumeTank:float,
-                    pressure:float,
-                    temperature:float,
-                    massflow:float,
-                    fluidMass:float,
-                    thicknessEndCap:float,
-                    tensileStrength:float,
-                    layerThicknessCfk:float,
-                    ulage:float,
-                    Input:components.Component):
+
+    def size_tanks(self,
+                   rocketDiameter,
+                   safety,
+                   volumeTank,
+                   pressure,
+                   thicknessEndCap,
+                   tensileStrength,
+                   layerThicknessCfk,
+                   ulage):
+        """! Calculates the geometry and mass of Type V tanks, works on floats and on numpy arrays of tanks.
+        The CFK thickness follows from Barlow's formula for cylindrical vessels, rounded up to full layers. Tanks that
+        fit into the sphere of the inner diameter are spherical, otherwise a cylindrical section is added.
+        @param rocketDiameter: Outer diameter of the rocket
+        @param safety: Safety factor of the tank
+        @param volumeTank: Volume of the tank without ullage
+        @param pressure: Pressure of the tank
+        @param thicknessEndCap: Thickness of the aluminium end cap
+        @param tensileStrength: Tensile strength of the CFK
+        @param layerThicknessCfk: Thickness of one CFK layer
+        @param ulage: Ullage of the tank
+        @return: dict with the volume including the ullage, the mass, the length and the outer diameter of the tanks
+        """
         #Calculate the volume including the ullage
-        volumeTank = volumeTank * (1 + ulage)                                   
+        volumeTank = volumeTank * (1 + ulage)
         #Calculate cfk thickness by using Barlow's formula for cylindrical pressure vessels.
         thicknessCfk = pressure * rocketDiameter*safety / (2*tensileStrength)
         # Round up thicknessCfk to the next multiple of layerThicknessCfk
-        thicknessCfk = math.ceil(thicknessCfk / layerThicknessCfk) * layerThicknessCfk
+        thicknessCfk = np.ceil(thicknessCfk / layerThicknessCfk) * layerThicknessCfk
         # Calculate the inner diameters of the tank
         innerDiameterCylinder = rocketDiameter - (2 * thicknessCfk)
         innerDiameterSphere = innerDiameterCylinder - (2 * thicknessEndCap)
         #Calculate the max. volume of a spherical tank
-        innerVolumeSphere = (4 / 3 * math.pi * math.pow(innerDiameterSphere / 2, 3))
-        #Checking if the tank is a cylinder or a sphere"
-        if (volumeTank - innerVolumeSphere) <= 0:
-            "Spherical tank is sufficient for the given volume. The barlows formula for spherical vessels is not used even if the tank is spherical because the thickness would be unrealisticly small."
-            #Calculate the required inner diameter of the sphere
-            innerDiameterSphere = math.pow(6 * volumeTank / math.pi, 1 / 3)
-            # update inner volume of the sphere
-            innerVolumeSphere = volumeTank
-            innerDiameterCylinder = (innerDiameterSphere + 2 * thicknessEndCap)
-            diameter = innerDiameterCylinder + 2 * thicknessCfk
-            innerVolumeCylinder = 0
-        else:
-            "spherical tank is not sufficient for the given volume, a cylinder is needed"
-            # outer diameter is the rocket diameter
-            diameter = rocketDiameter
-            #get the volume of the cylindrical section
-            innerVolumeCylinder = volumeTank - innerVolumeSphere
+        innerVolumeSphere = (4 / 3 * math.pi * (innerDiameterSphere / 2) ** 3)
+        #Checking if the tank is a cylinder or a sphere
+        # The barlows formula for spherical vessels is not used even if the tank is spherical because the thickness would be unrealisticly small.
+        spherical = (volumeTank - innerVolumeSphere) <= 0
+        # spherical tanks: the inner diameter of the sphere follows from the volume
+        innerDiameterCylinder = np.where(spherical,
+                                         np.cbrt(6 * volumeTank / math.pi) + 2 * thicknessEndCap,
+                                         innerDiameterCylinder)
+        diameter = np.where(spherical, innerDiameterCylinder + 2 * thicknessCfk, rocketDiameter)
+        innerVolumeSphere = np.where(spherical, volumeTank, innerVolumeSphere)
+        # cylindrical tanks: the outer diameter is the rocket diameter, the rest of the volume is the cylindrical section
+        innerVolumeCylinder = np.where(spherical, 0, volumeTank - innerVolumeSphere)
         "Calculating the cylinder section"
-        innerAreaCylinder = math.pi * math.pow(innerDiameterCylinder / 2, 2)
+        innerAreaCylinder = math.pi * (innerDiameterCylinder / 2) ** 2
         heightCylinder = innerVolumeCylinder / innerAreaCylinder
-        
+
         "Calculating the component volumes"
         # Volume Alucap is the difference between the inner spherical tank and the cylindrical tank section diamter
-        volumeAluCap = 4 / 3 * math.pi * math.pow(innerDiameterCylinder / 2, 3)- innerVolumeSphere
+        volumeAluCap = 4 / 3 * math.pi * (innerDiameterCylinder / 2) ** 3 - innerVolumeSphere
         # Volume CFK cap is the difference between the outer spherical tank and cylindrical tank section diamter
-        volumeCfkCap = 4 / 3 * math.pi * (math.pow(diameter/2, 3)- math.pow(innerDiameterCylinder/2, 3))
+        volumeCfkCap = 4 / 3 * math.pi * ((diameter / 2) ** 3 - (innerDiameterCylinder / 2) ** 3)
         # Volume CFK cylinder is the difference between the outer cylindrical tank and the inner cylindrical tank section diamter * the cylindrical height
         volumeCfkCylinder = heightCylinder * (
-                                (math.pi * math.pow(diameter / 2, 2))
-                                -(math.pi * math.pow(innerDiameterCylinder / 2, 2))
+                                (math.pi * (diameter / 2) ** 2)
+                                -(math.pi * (innerDiameterCylinder / 2) ** 2)
                                 )
 
         "Calculating the masses of the components"
         massAluCap = volumeAluCap * 2700
         massCfkCap = volumeCfkCap * 1600
         massCfkCylinder = volumeCfkCylinder * 1600
-        tank_mass = massAluCap + massCfkCap + massCfkCylinder
+        return {"volume": volumeTank,
+                "mass": massAluCap + massCfkCap + massCfkCylinder,
+                "length": diameter + heightCylinder,
+                "diameter": diameter}
 
+    def createTank(self,
+                    fluid:str,
+                    fluidCoolprop:str,
+                    rocketDiameter:float,
+                    safety:float,
+                    volumeTank:float,
+                    pressure:float,
+                    temperature:float,
+                    massflow:float,
+                    fluidMass:float,
+                    thicknessEndCap:float,
+                    tensileStrength:float,
+                    layerThicknessCfk:float,
+                    ulage:float,
+                    Input:components.Component):
+        geometry = self.size_tanks(rocketDiameter=rocketDiameter,
+                                   safety=safety,
+                                   volumeTank=volumeTank,
+                                   pressure=pressure,
+                                   thicknessEndCap=thicknessEndCap,
+                                   tensileStrength=tensileStrength,
+                                   layerThicknessCfk=layerThicknessCfk,
+                                   ulage=ulage)
         "Creating the tank"
         tank_model = models.Fluid_Constant(m_p=massflow,
                                            temperature=temperature,
                                            pressure=pressure)
         tank = components.Tank(name = fluid+"tank",
-                               mass=tank_mass,
-                               volume= volumeTank,
+                               mass=float(geometry["mass"]),
+                               volume=float(geometry["volume"]),
                                fluid=fluid,
                                fluid_mass= fluidMass,
                                pressure=pressure,
                                temperature=temperature,
                                tank_model=tank_model,
-                               length=diameter+heightCylinder,
+                               length=float(geometry["length"]),
                                input=Input
                                )
         return tank
@@ -242,7 +398,59 @@ class RocketFactory():
 # Implementations of the rocket factories
 ############################################################################################################
 
-def check_for_default_none(func):
+def prefetch_iterator(iterator, size: int):
+    """! Consumes an iterator in a background thread, keeping at most size items ready in a queue.
+    The items are produced while the consumer works on the previous ones. Exceptions of the producer are raised by the
+    consumer, and the producer stops once the consumer abandons the iterator.
+    @param iterator: Iterator to consume
+    @param size: Maximum number of items waiting in the queue
+    @return: generator over the items of the iterator
+    """
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    end = object()
+
+    def put(item):
+        # block until there is space in the queue or the consumer has stopped
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(end)
+        except BaseException as error:
+            put(error)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is end:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def check_for_default_none(func=None, optional: tuple = ()):
+    """! Decorator that rejects calls leaving an argument at its default value None.
+    @param func: Decorated function, when the decorator is used without arguments
+    @param optional: Names of the arguments for which None is a valid value
+    """
+    if func is None:
+        return partial(check_for_default_none, optional=optional)
+
     def wrapper(*args, **kwargs):
         sig = inspect.signature(func)
         bound = sig.bind(*args, **kwargs)
@@ -250,7 +458,7 @@ def check_for_default_none(func):
 
         for name, param in sig.parameters.items():
             # Check: Default is None AND argument takes that default
-            if param.default is None and bound.arguments[name] is None:
+            if param.default is None and bound.arguments[name] is None and name not in optional:
                 raise ValueError(f"Argument '{name}' uses default value None")
 
         return func(*args, **kwargs)
@@ -265,15 +473,49 @@ class Liquid_CEA_TypeVTank_RegNitrous(RocketFactory):
     - Regenerative Cooling of the engine with Nitrous oxide and a 10% Pressure loss
     - Variable Values for: diameter, burntime, thrust, oxidizer to fuel ratio, chamber pressure, expansion ratio, pressurant pressure factor and launch angle
     """
-    def __init__(self):
-        super().__init__()
+    # mass and length of each propellant line
+    LINE_MASS = 0.4
+    LINE_LENGTH = 0.2
+    # names of the sampled parameters, in the order of the parameter array of the designs
+    PARAMETER_NAMES = ("diameter", "burnTime", "thrust", "of", "chamberPressure",
+                       "expansionRatio", "pressurantPressureFactor", "launchAngle")
+
+    def __init__(self, propertyBackend: str = "HEOS", pressurantGridResolution: float = None):
+        super().__init__(propertyBackend, pressurantGridResolution)
         print("Setting up factory for rockets with:")
         print(" - Single liquid engine with CEA isp model")
         print(" - Type V CFK tanks for fuel, oxidizer and pressurant")
         print(" - Regenerative cooling with Nitrous oxide")
 
-    @check_for_default_none
-    def build_swarm(self,
+    def build_swarm(self, *args, **kwargs):
+        """! Builds a swarm of rockets into a list, see sample_swarm for the parameters.
+        @return: list of rockets
+        """
+        return list(self.iter_swarm(*args, **kwargs))
+
+    def iter_swarm(self, *args, prefetch: int = 0, **kwargs):
+        """! Samples and sizes a swarm of rockets and returns an iterator that builds the rocket objects one at a time,
+        see sample_swarm for the parameters.
+        @param prefetch: Number of rockets built ahead in a background thread while the consumer works, defaults to 0 (built on request)
+        @return: iterator over the rockets
+        """
+        return self.iter_table(self.sample_swarm(*args, **kwargs), prefetch=prefetch)
+
+    def iter_table(self, table: SwarmTable, prefetch: int = 0):
+        """! Returns an iterator that builds the rockets of a swarm table one at a time.
+        Only the table is kept in memory, each rocket is built when it is requested, so the iterator can be fed
+        straight into a trajectory loop or run_swarm.
+        @param table: SwarmTable returned by sample_swarm, or a selection of it
+        @param prefetch: Number of rockets built ahead in a background thread while the consumer works, defaults to 0 (built on request)
+        @return: iterator over the rockets
+        """
+        rockets = map(partial(self.build_from_table, table), range(len(table)))
+        if prefetch > 0:
+            rockets = prefetch_iterator(rockets, prefetch)
+        return rockets
+
+    @check_for_default_none(optional=("ispTable",))
+    def sample_swarm(self,
                     hdf_file=None,
                     diameters=None,
                     burnTimes=None,
@@ -311,9 +553,16 @@ class Liquid_CEA_TypeVTank_RegNitrous(RocketFactory):
                     fuelCoolpropName="",
                     oxCoolpropName="",
                     pressurantCoolpropName="",
+                    ispCurve: bool = False,
+                    sampler: str = "lhs",
+                    seed: int = -1,
+                    ispTable: models.ISP_Table_Biprop = None,
                     ):
         """
-        Constructor of the factory
+        Samples and sizes a swarm of rockets into a SwarmTable, without building the rocket objects.
+        The table holds one column per sampled and sized parameter and the static parameters as settings. It is written
+        to the results file and the rockets are built from it with build_from_table or iter_table.
+        @param hdf_file: Open results file or HDF5Writer the table is written to
         @param diameters: Lower and upper bounds of the diameters
         @param burnTimes: Lower and upper bounds of the burntimes
         @param thrusts: Lower and upper bounds of the thrusts
@@ -343,9 +592,13 @@ class Liquid_CEA_TypeVTank_RegNitrous(RocketFactory):
         @param fuelCoolpropName: Coolprop name of the fuel,only specify if the coolprop name is different from the fuel name in CEA, defaults to an empty string
         @param oxCoolpropName: Coolprop name of the oxidizer,only specify if the coolprop name is different from the oxidizer name in CEA, defaults to an empty string
         @param pressurantCoolpropName: Coolprop name of the pressurant,only specify if the coolprop name is different from the pressurant name in CEA, defaults to an empty string
+        @param ispCurve: Precompute the ISP over the ambient pressure for every engine instead of calling CEA during the simulation, defaults to False
+        @param sampler: Sampler of the design space, "lhs" for a latin hypercube or "sobol" and "halton" for scrambled low-discrepancy sequences that can be continued with extend_swarm, defaults to lhs
+        @param seed: Seed of the sampler, a random seed is drawn if negative, defaults to -1
+        @param ispTable: Tabulated ISP model the sea level ISP of the sizing is interpolated from instead of calling CEA per design, defaults to None (CEA)
+        @return: SwarmTable of the swarm
         """
 
-        # Perform the LHS to get samples of the parameters
         # Create an array of the parameters
         parameterList = [diameters,
                          burnTimes,
@@ -357,10 +610,7 @@ class Liquid_CEA_TypeVTank_RegNitrous(RocketFactory):
                          launchAngles
                          ]
         # Determine the dimension the sample space
-        VarParamIndex = [
-            i for i, param in enumerate(parameterList) if isinstance(param, list)
-        ]
-        dimSampleSpace = len(VarParamIndex)
+        dimSampleSpace = sum(1 for param in parameterList if isinstance(param, list))
 
         # Determine the number of rockets to build
         if nRockets == 0: #if nRockets is not explicitly set, use a default value 
@@ -369,216 +619,383 @@ class Liquid_CEA_TypeVTank_RegNitrous(RocketFactory):
         elif  dimSampleSpace == 0 and nRockets == 0: 
             nRockets = 1 # if no variable parameters are given, only one rocket is built
 
-        # Check if the sample space has any variable parameters
-        if dimSampleSpace > 0:
-            # Create the LHS sampler
-            sampler = qmc.LatinHypercube(d=dimSampleSpace)
-            # Create the sample
-            sample = sampler.random(n=nRockets)
-            # scale the sample to the bounds
-            # Create  bounds from all lists in parameterList
-            l_bounds = [parameterList[i][0] for i in VarParamIndex]
-            u_bounds = [parameterList[i][1] for i in VarParamIndex]
-            rocketsParametersDynamic = qmc.scale(sample, l_bounds, u_bounds)
-        # create the full parameter list for the rockets
-        rocketsParameters = []
-        for i in range(nRockets):
-            rocketParameter = []
-            for j, param in enumerate(parameterList):
-                if j in VarParamIndex:
-                    # varaible parameter, get the parameter from the sample
-                    rocketParameter.append(rocketsParametersDynamic[i][VarParamIndex.index(j)])
-                else:
-                    # static paramter get the parameter from the list
-                    rocketParameter.append(param)
-            rocketsParameters.append(rocketParameter)
-        # write the variable and constant parameters to the hdf5 file
-        # Create an attribute set describing variable and static parameters
-        attribute_set = {}
-        for idx, param in enumerate(parameterList):
-            param_name = [
-                "diameter", "burnTime", "thrust", "of", "chamberPressure",
-                "expansionRatio", "pressurantPressureFactor", "launchAngle"
-            ][idx]
+        # draw a seed if none is given, it is stored with the table so the sample can be reproduced
+        if seed < 0:
+            seed = int(np.random.default_rng().integers(2**31))
+
+        #coolprop names of propellant and pressurant
+        if not fuelCoolpropName:
+            fuelCoolpropName = fuel
+        if not oxCoolpropName:
+            oxCoolpropName = ox
+        if not pressurantCoolpropName:
+            pressurantCoolpropName = pressurant
+
+        # static parameters shared by all rockets
+        settings = {"componentList": componentList,
+                    "dragCoefficient": np.asarray(dragCoefficient, dtype="float64"),
+                    "fuel": fuel,
+                    "ox": ox,
+                    "pressurant": pressurant,
+                    "fuelCoolpropName": fuelCoolpropName,
+                    "oxCoolpropName": oxCoolpropName,
+                    "pressurantCoolpropName": pressurantCoolpropName,
+                    "engineMass": engineMass,
+                    "engineLength": engineLength,
+                    "fuelTankSafetyFactor": fuelTankSafetyFactor,
+                    "FuelTankUllage": FuelTankUllage,
+                    "oxTankSafetyFactor": oxTankSafetyFactor,
+                    "OxTankUllage": OxTankUllage,
+                    "pressurantTankSafetyFactor": pressurantTankSafetyFactor,
+                    "thicknessEndCap": thicknessEndCap,
+                    "cfrpTensileStrength": cfrpTensileStrength,
+                    "engineEfficiency": engineEfficiency,
+                    "fuelTemp": fuelTemp,
+                    "oxTemp": oxTemp,
+                    "pressurantTemp": pressurantTemp,
+                    "deltaPRegen": deltaPRegen,
+                    "deltaPLines": deltaPLines,
+                    "deltaPInjector": deltaPInjector,
+                    "layerThicknessCfk": layerThicknessCfk,
+                    "rail_height": rail_height,
+                    "railTipOffAngle": railTipOffAngle,
+                    "ispCurve": ispCurve,
+                    "sampler": sampler,
+                    "seed": seed,
+                    "sequencePosition": nRockets,
+                    }
+        if ispTable is not None:
+            settings["ispTable"] = ispTable
+        # write the bounds of the variable parameters to the settings, static parameters are constant columns
+        for name, param in zip(self.PARAMETER_NAMES, parameterList):
             if isinstance(param, list):
-                attribute_set[param_name] = {
-                    "variable": True,
-                    "range": (param[0], param[1])
-                }
-            else:
-                attribute_set[param_name] = {
-                    "variable": False,
-                    "value": param
-                }
+                settings["range_" + name] = (param[0], param[1])
 
+        table = self.size_table(parameterList,
+                                self.draw_samples(sampler, dimSampleSpace, nRockets, seed),
+                                0,
+                                settings)
+        if isinstance(hdf_file, (h5py.File, h5py.Group)):
+            table.to_hdf5(hdf_file)
+        elif isinstance(hdf_file, HDF5Writer):
+            hdf_file.call(table.to_hdf5)
+        return table
+
+    def extend_swarm(self, hdf_file, nRockets: int, componentList: list, name: str = "swarm_table",
+                     ispTable: models.ISP_Table_Biprop = None):
+        """! Continues the quasi-random sequence of a swarm stored in a results file with further rockets.
+        The sampler, seed, bounds and sequence position are read from the stored table, so the new designs are the next
+        points of the same low-discrepancy sequence. The stored table is replaced by the extended one.
+        @param hdf_file: Open results file holding the table written by sample_swarm
+        @param nRockets: Number of rockets to add
+        @param componentList: List of components, as given to sample_swarm
+        @param name: Name of the table in the file, defaults to swarm_table
+        @param ispTable: Tabulated ISP model of the sizing, as given to sample_swarm, defaults to None (CEA)
+        @return: SwarmTable of the new designs only, so only those have to be simulated
+        """
+        settings = {"componentList": componentList}
+        if ispTable is not None:
+            settings["ispTable"] = ispTable
+        table = SwarmTable.from_hdf5(hdf_file, name, settings=settings)
+        settings = table.settings
+        if settings.get("sampler") not in ("sobol", "halton"):
+            raise ValueError("Error: Only swarms sampled with the sobol or halton sampler can be extended")
+        parameterList = self.get_parameter_list(table)
+        dimSampleSpace = sum(1 for param in parameterList if isinstance(param, list))
+        start = int(settings["sequencePosition"])
+        settings["sequencePosition"] = start + nRockets
+        newTable = self.size_table(parameterList,
+                                   self.draw_samples(settings["sampler"], dimSampleSpace, nRockets,
+                                                     int(settings["seed"]), start),
+                                   start,
+                                   settings)
+        table.concatenate(newTable).to_hdf5(hdf_file, name)
+        return newTable
 
-        # set static parameters
-        # Cd Coefficient LUT 
+    def get_parameter_list(self, table: SwarmTable):
+        """! Reconstructs the parameter bounds a swarm table was sampled with.
+        @param table: SwarmTable returned by sample_swarm
+        @return: List with a [lower, upper] list per variable parameter and the value of each static parameter, in the order of PARAMETER_NAMES
+        """
+        # the static parameters are constant columns of the table
+        return [list(table.settings["range_" + param]) if "range_" + param in table.settings else float(table[param][0])
+                for param in self.PARAMETER_NAMES]
+
+    def size_table(self, parameterList: list, unitSamples: np.ndarray, start: int, settings: dict):
+        """! Scales unit samples to the parameter bounds and sizes the designs into a swarm table.
+        @param parameterList: Bounds as [lower, upper] list for variable parameters or value for static parameters, in the order of PARAMETER_NAMES
+        @param unitSamples: Samples in the unit hypercube, one column per variable parameter
+        @param start: Sequence position of the first sample, the samples are numbered from it
+        @param settings: Static parameters of the swarm, see sample_swarm
+        @return: SwarmTable of the designs
+        """
+        nRockets = len(unitSamples)
+        varParamIndex = [i for i, param in enumerate(parameterList) if isinstance(param, list)]
+        # create the full parameter array of the rockets
+        rocketsParameters = np.empty((nRockets, len(parameterList)), dtype="float64")
+        for j, param in enumerate(parameterList):
+            if j in varParamIndex:
+                # variable parameter, scale the sample to the bounds
+                rocketsParameters[:, j] = param[0] + unitSamples[:, varParamIndex.index(j)] * (param[1] - param[0])
+            else:
+                # static parameter
+                rocketsParameters[:, j] = param
+        # size all rockets at once
+        sizing = self.size_swarm(rocketsParameters=rocketsParameters,
+                                 componentList=settings["componentList"],
+                                 fuel=settings["fuel"],
+                                 ox=settings["ox"],
+                                 pressurant=settings["pressurant"],
+                                 engineMass=settings["engineMass"],
+                                 fuelTankSafetyFactor=settings["fuelTankSafetyFactor"],
+                                 FuelTankUllage=settings["FuelTankUllage"],
+                                 oxTankSafetyFactor=settings["oxTankSafetyFactor"],
+                                 OxTankUllage=settings["OxTankUllage"],
+                                 pressurantTankSafetyFactor=settings["pressurantTankSafetyFactor"],
+                                 thicknessEndCap=settings["thicknessEndCap"],
+                                 cfrpTensileStrength=settings["cfrpTensileStrength"],
+                                 engineEfficiency=settings["engineEfficiency"],
+                                 fuelTemp=settings["fuelTemp"],
+                                 oxTemp=settings["oxTemp"],
+                                 pressurantTemp=settings["pressurantTemp"],
+                                 deltaPRegen=settings["deltaPRegen"],
+                                 deltaPLines=settings["deltaPLines"],
+                                 deltaPInjector=settings["deltaPInjector"],
+                                 layerThicknessCfk=settings["layerThicknessCfk"],
+                                 fuelCoolpropName=settings["fuelCoolpropName"],
+                                 oxCoolpropName=settings["oxCoolpropName"],
+                                 pressurantCoolpropName=settings["pressurantCoolpropName"],
+                                 ispTable=settings.get("ispTable"))
+        # collect the samples and the sizing into the swarm table
+        columns = {"sample": np.arange(start, start + nRockets)}
+        for j, name in enumerate(self.PARAMETER_NAMES):
+            columns[name] = rocketsParameters[:, j]
+        columns.update(sizing)
+        return SwarmTable(columns, settings)
+
+    def build_from_table(self, table: SwarmTable, index: int):
+        """! Builds the rocket of a single design of a swarm table.
+        @param table: SwarmTable returned by sample_swarm, the settings must hold the component list
+        @param index: Index of the design in the table
+        @return: Rocket object
+        """
+        settings = table.settings
+        design = table.row(index)
+        # Cd Coefficient LUT
+        dragCoefficient = settings["dragCoefficient"]
         LUTdragCoefficient = {"x":dragCoefficient[1:,0],
                             "y":dragCoefficient[0,1:],
                             "Lut":dragCoefficient[1:, 1:]
                             }
-        # create PyCea object for calculating of massflow
-        cea = CEA(oxName= ox,fuelName= fuel, fac_CR=None, units="metric")
-        #coolprop names of propellant and pressurant
+        print("Buildung rocket: ",index+1," of ",len(table))
+        #create the metadata set for the rocket
+        rocketParameters = {"diameter": design["diameter"],
+                            "burnTime": design["burnTime"],
+                            "thrust": design["thrust"],
+                            "of": design["of"],
+                            "chamberPressure": design["chamberPressure"],
+                            "expansionRatio": design["expansionRatio"],
+                            "pressurantTankPressure": design["pressurantTankPressure"],
+                            "launchAngle": design["launchAngle"]-settings["railTipOffAngle"], # reduce the launch angle by the rail tip off angle
+                            }
+        # build the rocket
+        return self.build_rocket(name = "Rocket_"+str(int(design["sample"])),
+                                 burnTime=design["burnTime"],
+                                 componentList=settings["componentList"],
+                                 cfrpTensileStrength=settings["cfrpTensileStrength"],
+                                 deltaPLines=settings["deltaPLines"],
+                                 deltaPRegen=settings["deltaPRegen"],
+                                 deltaPInjector=settings["deltaPInjector"],
+                                 diameter=design["diameter"],
+                                 dragCoefficient=LUTdragCoefficient,
+                                 engineEfficiency=settings["engineEfficiency"],
+                                 engineLength=settings["engineLength"],
+                                 engineMass=settings["engineMass"],
+                                 expansionRatio=design["expansionRatio"],
+                                 fuel=settings["fuel"],
+                                 fuelCoolpropName=settings["fuelCoolpropName"],
+                                 fuelMass=design["fuelMass"],
+                                 fuelMassFlow=design["fuelMassFlow"],
+                                 fuelTankPressure=design["fuelTankPressure"],
+                                 fuelTankSafetyFactor=settings["fuelTankSafetyFactor"],
+                                 fuelTankVolume=design["fuelTankVolume"],
+                                 fuelTemp=settings["fuelTemp"],
+                                 ox=settings["ox"],
+                                 oxCoolpropName=settings["oxCoolpropName"],
+                                 oxMass=design["oxMass"],
+                                 oxMassFlow=design["oxMassFlow"],
+                                 oxTankPressure=design["oxTankPressure"],
+                                 oxTankSafetyFactor=settings["oxTankSafetyFactor"],
+                                 oxTankVolume=design["oxTankVolume"],
+                                 oxTemp=settings["oxTemp"],
+                                 pressurant=settings["pressurant"],
+                                 pressurantCoolpropName=settings["pressurantCoolpropName"],
+                                 pressurantMass=design["pressurantMass"],
+                                 pressurantMassFlow=design["pressurantMassFlow"],
+                                 pressurantTankPressure=design["pressurantTankPressure"],
+                                 pressurantTankSafetyFactor=settings["pressurantTankSafetyFactor"],
+                                 pressurantTankVolume=design["pressurantTankVolume"],
+                                 pressurantTemp=settings["pressurantTemp"],
+                                 rail_height=settings["rail_height"],
+                                 rocketParameters=rocketParameters,
+                                 thicknessEndCap=settings["thicknessEndCap"],
+                                 layerThicknessCfk=settings["layerThicknessCfk"],
+                                 ispCurve=bool(settings["ispCurve"]),
+                                 )
+              
+    def size_swarm(self,
+                   rocketsParameters: np.ndarray,
+                   componentList: list,
+                   fuel: str,
+                   ox: str,
+                   pressurant: str,
+                   engineMass: float,
+                   fuelTankSafetyFactor: float = 3.0,
+                   FuelTankUllage: float = 0.0,
+                   oxTankSafetyFactor: float = 3.0,
+                   OxTankUllage: float = 0.7,
+                   pressurantTankSafetyFactor: float = 3.0,
+                   thicknessEndCap: float = 0.0015,
+                   cfrpTensileStrength: float = 600.0,
+                   engineEfficiency: float = 0.90,
+                   fuelTemp: float = 300.0,
+                   oxTemp: float = 300.0,
+                   pressurantTemp: float = 300.0,
+                   deltaPRegen: float = 0.1,
+                   deltaPLines: float = 0.01,
+                   deltaPInjector: float = 0.2,
+                   layerThicknessCfk: float = 0.001,
+                   fuelCoolpropName: str = "",
+                   oxCoolpropName: str = "",
+                   pressurantCoolpropName: str = "",
+                   ispTable: models.ISP_Table_Biprop = None,
+                   ):
+        """! Sizes a swarm of rockets without building the rocket objects.
+        All derived quantities are computed as numpy arrays over the designs. Fluid properties and the sea level ISP
+        are evaluated once per distinct state, so the cost is dominated by the number of distinct chamber pressures,
+        mixture ratios and expansion ratios in the swarm. The masses and lengths follow the component layout of
+        build_rocket.
+        @param rocketsParameters: Array with one row per design and the columns diameter, burn time, thrust, O/F, chamber pressure, expansion ratio, pressurant pressure factor and launch angle
+        @param ispTable: Tabulated ISP model used for the sea level ISP instead of CEA, defaults to None
+        @return: dict of arrays with one value per design
+        @note The remaining parameters are the ones of build_swarm.
+        """
         if not fuelCoolpropName:
             fuelCoolpropName = fuel
         if not oxCoolpropName:
             oxCoolpropName = ox
         if not pressurantCoolpropName:
             pressurantCoolpropName = pressurant
-    
-        #create the rocket list
-        rockets = []
-        print("Start building rockets!")
-        for i , rocketParameters in enumerate(rocketsParameters):
-            print("Buildung rocket: ",i+1," of ",nRockets)
-            #set the dynamic parameters of the rocket
-            diameter = rocketParameters[0]
-            burnTime = rocketParameters[1]
-            thrust = rocketParameters[2]
-            of = rocketParameters[3]
-            chamberPressure = rocketParameters[4]
-            expansionRatio = rocketParameters[5]
-            pressurantPressureFactor = rocketParameters[6]
-            launchAngle = rocketParameters[7]
-
-            ##calculate the tanks sizes and pressures
-            #get the isp for the given parameters
-            isp = engineEfficiency * cea.estimate_Ambient_Isp(Pc=chamberPressure,
-                                    MR=of,
-                                    eps=expansionRatio,
-                                    Pamb= 101325,
-                                    frozen=0, 
-                                    frozenAtThroat=1)[0]
-            #calculate the mass flow from the thrust and isp
-            massflow = thrust / (isp *9.81)
-
-            # calculate individual mass flows
-            fuelMassFlow = massflow/(of+1)
-            oxMassFlow = massflow/(1/of+1)
-
-            # calculate the propellant masses
-            fuelMass = fuelMassFlow * burnTime
-            oxMass = oxMassFlow * burnTime
-
-            # calculate the propellant tank pressures
-            fuelTankPressure = (chamberPressure * 
-                                (1 + deltaPLines) * 
-                                (1 + deltaPInjector))
-            oxTankPressure = (chamberPressure *
-                              (1 + deltaPLines) *
-                              (1 + deltaPRegen) *
-                              (1 + deltaPInjector))
-
-            # calculate the propellant tank volumes
-            fuelDensity = PropsSI("DMASS",
-                                                   "T",fuelTemp,
-                                                   "P",fuelTankPressure,
-                                                   fuelCoolpropName)
-            fuelTankVolume = fuelMass / fuelDensity * (1 + FuelTankUllage) 
-
-            oxDensity = PropsSI("DMASS",
-                                                "T",oxTemp,
-                                                "P",oxTankPressure,
-                                                oxCoolpropName)
-            oxTankVolume = oxMass / oxDensity * (1 + OxTankUllage) 
-            # calculate the propellant tank pressures
-            pressurantTankPressure = max(fuelTankPressure, oxTankPressure) * pressurantPressureFactor
-            pressurantTankVolumeOX = self.get_pressurant_volume(
-                tank_vol=oxTankVolume,
-                tank_pressure=oxTankPressure,
-                pressurant_pressure_init=pressurantTankPressure,
-                pressurant_temperature_init=pressurantTemp,
-                pressurant=pressurantCoolpropName
-            )
-            pressurantTankVolumeFuel = self.get_pressurant_volume(
-                tank_vol=fuelTankVolume,
-                tank_pressure=fuelTankPressure,
-                pressurant_pressure_init=pressurantTankPressure,
-                pressurant_temperature_init=pressurantTemp,
-                pressurant=pressurantCoolpropName
-            )
-            pressurantTankVolume = pressurantTankVolumeOX + pressurantTankVolumeFuel
-            # calculate the pressurant mass
-            pressurantMass = pressurantTankVolume * PropsSI("DMASS",
-                                                            "T",pressurantTemp,
-                                                            "P",pressurantTankPressure,
-                                                            pressurantCoolpropName)
-            
-            ##calculate the pressurant massflow
-            # get the volume flow rates of the propellants
-            VolFlowFuel = fuelMassFlow / PropsSI("DMASS",
-                                                        "T",fuelTemp,
-                                                        "P",fuelTankPressure,
-                                                        fuelCoolpropName)
-            VolFlowOx = oxMassFlow / PropsSI("DMASS",
-                                                        "T",oxTemp,
-                                                        "P",oxTankPressure,
-                                                        oxCoolpropName)
-            VolFlowPressurant = VolFlowFuel + VolFlowOx 
-
-            # calculate the pressurant mass flow rate
-            pressurantMassFlow = VolFlowPressurant * PropsSI("DMASS",
-                                                                "T",pressurantTemp,
-                                                                "P",pressurantTankPressure,
-                                                                pressurantCoolpropName)
-            #create the metadata set for the rocket
-            rocketParameters = {"diameter": diameter,
-                                "burnTime": burnTime,
-                                "thrust": thrust,
-                                "of": of,
-                                "chamberPressure": chamberPressure,
-                                "expansionRatio": expansionRatio,
-                                "pressurantTankPressure": pressurantTankPressure,
-                                "launchAngle": launchAngle-railTipOffAngle, # reduce the launch angle by the rail tip off angle
-                                }
-            # build the rocket
-            rocketSample = self.build_rocket(name = "Rocket_"+str(i), 
-                                             burnTime=burnTime,
-                                       componentList=componentList,
-                                       cfrpTensileStrength=cfrpTensileStrength,
-                                       deltaPLines=deltaPLines,
-                                       deltaPRegen=deltaPRegen,
-                                       deltaPInjector=deltaPInjector,
-                                       diameter=diameter,
-                                       dragCoefficient=LUTdragCoefficient,
-                                       engineEfficiency=engineEfficiency,
-                                       engineLength=engineLength,
-                                       engineMass=engineMass,
-                                       expansionRatio=expansionRatio,
-                                       fuel=fuel,
-                                       fuelCoolpropName=fuelCoolpropName,
-                                       fuelMass=fuelMass,
-                                       fuelMassFlow=fuelMassFlow,
-                                       fuelTankPressure=fuelTankPressure,
-                                       fuelTankSafetyFactor=fuelTankSafetyFactor,
-                                       fuelTankVolume=fuelTankVolume,
-                                       fuelTemp=fuelTemp,
-                                       ox=ox,
-                                       oxCoolpropName=oxCoolpropName,
-                                       oxMass=oxMass,
-                                       oxMassFlow=oxMassFlow,
-                                       oxTankPressure=oxTankPressure,
-                                       oxTankSafetyFactor=oxTankSafetyFactor,
-                                       oxTankVolume=oxTankVolume,
-                                       oxTemp=oxTemp,
-                                       pressurant=pressurant,
-                                       pressurantCoolpropName=pressurantCoolpropName,
-                                       pressurantMass=pressurantMass,
-                                       pressurantMassFlow=pressurantMassFlow,
-                                       pressurantTankPressure=pressurantTankPressure,
-                                       pressurantTankSafetyFactor=pressurantTankSafetyFactor,
-                                       pressurantTankVolume=pressurantTankVolume,
-                                       pressurantTemp=pressurantTemp,
-                                       rail_height=rail_height,
-                                       rocketParameters=rocketParameters,
-                                       thicknessEndCap=thicknessEndCap,
-                                       layerThicknessCfk=layerThicknessCfk,
-                                       )
-            rockets.append(rocketSample)
-        return rockets
-              
+        rocketsParameters = np.atleast_2d(rocketsParameters)
+        diameter, burnTime, thrust, of, chamberPressure, expansionRatio, pressurantPressureFactor = rocketsParameters[:, :7].T
+
+        ##calculate the tanks sizes and pressures
+        #get the isp for the given parameters
+        if ispTable is None:
+            # CEA is called once per distinct operating point of the swarm
+            operatingPoints, inverse = np.unique(np.stack((chamberPressure, of, expansionRatio), axis=1), axis=0,
+                                                 return_inverse=True)
+            uniqueIsp = np.array([cea_pool.estimate_Ambient_Isp(oxName=ox,
+                                                                fuelName=fuel,
+                                                                Pc=Pc,
+                                                                MR=MR,
+                                                                eps=eps,
+                                                                Pamb=101325,
+                                                                frozen=0,
+                                                                frozenAtThroat=1)[0]
+                                  for Pc, MR, eps in operatingPoints])
+            isp = engineEfficiency * uniqueIsp[inverse.ravel()]
+        else:
+            # all designs are interpolated from the table at once
+            isp = engineEfficiency * ispTable.interpolate_array(chamberPressure, of, expansionRatio, 101325)
+        #calculate the mass flow from the thrust and isp
+        massflow = thrust / (isp *9.81)
+
+        # calculate individual mass flows
+        fuelMassFlow = massflow/(of+1)
+        oxMassFlow = massflow/(1/of+1)
+
+        # calculate the propellant masses
+        fuelMass = fuelMassFlow * burnTime
+        oxMass = oxMassFlow * burnTime
+
+        # calculate the propellant tank pressures
+        fuelTankPressure = (chamberPressure *
+                            (1 + deltaPLines) *
+                            (1 + deltaPInjector))
+        oxTankPressure = (chamberPressure *
+                          (1 + deltaPLines) *
+                          (1 + deltaPRegen) *
+                          (1 + deltaPInjector))
+
+        # calculate the propellant tank volumes
+        fuelDensity = self.get_densities(fuelTemp, fuelTankPressure, fuelCoolpropName)
+        fuelTankVolume = fuelMass / fuelDensity * (1 + FuelTankUllage)
+        oxDensity = self.get_densities(oxTemp, oxTankPressure, oxCoolpropName)
+        oxTankVolume = oxMass / oxDensity * (1 + OxTankUllage)
+        # calculate the pressurant tank pressures and volumes
+        pressurantTankPressure = np.maximum(fuelTankPressure, oxTankPressure) * pressurantPressureFactor
+        pressurantTankVolume = (self.get_pressurant_volumes(oxTankVolume, oxTankPressure, pressurantTankPressure,
+                                                            pressurantTemp, pressurantCoolpropName)
+                                + self.get_pressurant_volumes(fuelTankVolume, fuelTankPressure, pressurantTankPressure,
+                                                              pressurantTemp, pressurantCoolpropName))
+        # calculate the pressurant mass
+        pressurantDensity = self.get_densities(pressurantTemp, pressurantTankPressure, pressurantCoolpropName)
+        pressurantMass = pressurantTankVolume * pressurantDensity
+
+        # calculate the pressurant mass flow rate from the volume flow rates of the propellants
+        pressurantMassFlow = (fuelMassFlow / fuelDensity + oxMassFlow / oxDensity) * pressurantDensity
+
+        # tank geometries with the ullages of build_rocket
+        tanks = {}
+        for name, safety, volume, pressure, ulage in (
+                ("fuel", fuelTankSafetyFactor, fuelTankVolume, fuelTankPressure, 0.01),
+                ("ox", oxTankSafetyFactor, oxTankVolume, oxTankPressure, 0.1),
+                ("pressurant", pressurantTankSafetyFactor, pressurantTankVolume, pressurantTankPressure, 0.0)):
+            tanks[name] = self.size_tanks(rocketDiameter=diameter,
+                                          safety=safety,
+                                          volumeTank=volume,
+                                          pressure=pressure,
+                                          thicknessEndCap=thicknessEndCap,
+                                          tensileStrength=cfrpTensileStrength,
+                                          layerThicknessCfk=layerThicknessCfk,
+                                          ulage=ulage)
+
+        # rocket layout: given components, propellant lines, engine and tanks inside of the hull tube
+        hullLength = (sum(component.get_hull_length() for component in componentList)
+                      + 2 * self.LINE_LENGTH
+                      + sum(tank["length"] for tank in tanks.values()))
+        hullMass = self.get_hull_tube_mass(hullLength, diameter)
+        length = sum(component.get_length() for component in componentList) + hullLength
+        dryMass = (sum(component.get_mass() for component in componentList)
+                   + 2 * self.LINE_MASS
+                   + engineMass
+                   + sum(tank["mass"] for tank in tanks.values())
+                   + hullMass)
+        return {"isp": isp,
+                "massflow": massflow,
+                "fuelMassFlow": fuelMassFlow,
+                "oxMassFlow": oxMassFlow,
+                "fuelMass": fuelMass,
+                "oxMass": oxMass,
+                "fuelTankPressure": fuelTankPressure,
+                "oxTankPressure": oxTankPressure,
+                "fuelTankVolume": fuelTankVolume,
+                "oxTankVolume": oxTankVolume,
+                "pressurantTankPressure": pressurantTankPressure,
+                "pressurantTankVolume": pressurantTankVolume,
+                "pressurantMass": pressurantMass,
+                "pressurantMassFlow": pressurantMassFlow,
+                "fuelTankMass": tanks["fuel"]["mass"],
+                "oxTankMass": tanks["ox"]["mass"],
+                "pressurantTankMass": tanks["pressurant"]["mass"],
+                "hullLength": hullLength,
+                "hullMass": hullMass,
+                "length": length,
+                "L/D": length / diameter,
+                "dryMass": dryMass,
+                "wetMass": dryMass + fuelMass + oxMass + pressurantMass}
+
     def build_rocket(self,
                      name:str,
                     burnTime: float,
@@ -621,10 +1038,10 @@ class Liquid_CEA_TypeVTank_RegNitrous(RocketFactory):
                     rocketParameters: dict,
                     thicknessEndCap: float,
                     layerThicknessCfk: float,
+                    ispCurve: bool = False,
                     ):
-        parts = []
-        for part in componentList:
-            parts.append(part)
+        # every rocket gets its own copies of the components, their states are bound to the state store of the rocket
+        parts = copy.deepcopy(list(componentList))
         pressurant_tank = self.createTank(fluid=pressurant,
                                         fluidCoolprop = pressurantCoolpropName,
                                         rocketDiameter=diameter,
@@ -679,14 +1096,14 @@ class Liquid_CEA_TypeVTank_RegNitrous(RocketFactory):
                                             T_m=1,T_c=0,
                                             P_m=1-deltaPLines,P_c=0)
         fuelLine = components.Wetted_part(name="Fuel Line",
-                                             mass=0.4,
-                                             length=0.2,
+                                             mass=self.LINE_MASS,
+                                             length=self.LINE_LENGTH,
                                              input=fuel_tank,
                                              model=LineModel,
                                              hulltube=True)
         oxLine = components.Wetted_part(name="Oxidizer Line",
-                                             mass=0.4,  
-                                             length=0.2,  
+                                             mass=self.LINE_MASS,
+                                             length=self.LINE_LENGTH,
                                              input=ox_tank,
                                              model=LineModel,
                                              hulltube=True)
@@ -735,6 +1152,16 @@ class Liquid_CEA_TypeVTank_RegNitrous(RocketFactory):
                                              input_oxidizer=injectorOx,
                                              input_fuel=injectorFuel,
                                              isp_model=isp_model)
+        if ispCurve:
+            # the constant flow tank models fix the operating point of the engine, only the ambient pressure varies
+            rocket_engine.updateState({"time": 0, "y": 0, "P_amb": 101325})
+            rocket_engine.isp_model = models.ISP_Curve_Biprop(engineEfficiency=engineEfficiency,
+                                                              oxidizer=ox,
+                                                              fuel=fuel,
+                                                              chamberPressure=rocket_engine.state["P_cc"],
+                                                              mixtureRatio=rocket_engine.state["O/F"],
+                                                              expansionRatio=expansionRatio,
+                                                              fallbackModel=isp_model)
         
         "add engine to engine list"
         engines = [rocket_engine]
@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class State:
+    """! Named float64 state of a rocket or component.
+    The values live in a float64 array and are accessed by name like a dict, state["v_x"]. The set of names is fixed
+    when the state is created, boolean flags are stored as 0.0 and 1.0. A new state owns its own array until it is
+    bound to a slice of the vector of a StateStore, from then on it reads and writes that slice without allocating. A
+    state can only be bound once, so an object can not be part of two rockets.
+    """
+    __slots__ = ("names", "index", "array", "vector", "offset", "bound")
+
+    def __init__(self, initial: dict):
+        """! Constructor of a state.
+        @param initial: Dict of the names and initial values of the state.
+        """
+        self.names = tuple(initial.keys())
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.vector = np.array([float(value) for value in initial.values()], dtype="float64")
+        self.array = self.vector
+        self.offset = 0
+        self.bound = False
+
+    def bind(self, vector: np.ndarray, offset: int):
+        """! Moves the state into a slice of a vector, the current values are copied.
+        @param vector: Vector the state is stored in.
+        @param offset: Position of the first value of the state in the vector.
+        """
+        if self.bound and self.vector is not vector:
+            raise ValueError("Error: The state is already bound to the state store of another rocket, every rocket "
+                             "needs its own components")
+        vector[offset:offset + len(self.names)] = self.array
+        self.vector = vector
+        self.offset = offset
+        self.array = vector[offset:offset + len(self.names)]
+        self.bound = True
+
+    def span(self, first: str, last: str):
+        """! Returns the slice of the array from the value first up to and including the value last."""
+        return slice(self.index[first], self.index[last] + 1)
+
+    def __getitem__(self, name: str):
+        return self.array.item(self.index[name])
+
+    def __setitem__(self, name: str, value: float):
+        self.array[self.index[name]] = value
+
+    def __contains__(self, name: str):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def keys(self):
+        """! Returns the names of the state."""
+        return self.names
+
+    def values(self):
+        """! Returns the values of the state as a view of the array."""
+        return self.array
+
+    def items(self):
+        """! Returns the names and values of the state as pairs."""
+        return zip(self.names, self.array.tolist())
+
+    def to_dict(self):
+        """! Returns a copy of the state as a dict."""
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"State({self.to_dict()})"
+
+    def __getstate__(self):
+        # the vector is pickled once for all states bound to it, so the copies share one vector again
+        return self.names, self.vector, self.offset, self.bound
+
+    def __setstate__(self, state):
+        self.names, self.vector, self.offset, self.bound = state
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.array = self.vector[self.offset:self.offset + len(self.names)]
+
+
+class StateStore:
+    """! Preallocated float64 vector holding the states of a rocket and all of its components.
+    Every object registered at build time gets a slice of the vector named after the object, its State is bound to that
+    slice. The slices are laid out in the order of registration, each state in the order of its names.
+    """
+    __slots__ = ("vector", "slices")
+
+    def __init__(self, owners: list):
+        """! Constructor of the store, binds the states of the owners to the vector.
+        @param owners: Objects with a State in the attribute state, e.g. the rocket and its components. Objects listed
+        more than once are registered once.
+        """
+        unique = list({id(owner): owner for owner in owners}.values())
+        self.vector = np.zeros(sum(len(owner.state) for owner in unique), dtype="float64")
+        # list of the names of the owners and their slices
+        self.slices = []
+        offset = 0
+        for owner in unique:
+            owner.state.bind(self.vector, offset)
+            name = owner.name if hasattr(owner, "name") else owner.parameters["name"]
+            self.slices.append((name, slice(offset, offset + len(owner.state))))
+            offset += len(owner.state)
+
+    def __len__(self):
+        return self.vector.size
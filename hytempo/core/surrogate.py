@@ -0,0 +1,285 @@
+import h5py
+import numpy as np
+from scipy.interpolate import RBFInterpolator
+from scipy.linalg import cho_factor, cho_solve
+from scipy.optimize import minimize
+
+
+def read_training_data(*file_paths, parameters: list, metrics: list):
+    """! Reads the parameters and metrics of all simulated rockets from results files.
+    The parameters are read from the attributes of the rocket groups, the metrics from their metrics datasets. Rockets
+    without metrics, e.g. unfinished simulations, are skipped.
+    @param file_paths: Paths of the HDF5 results files
+    @param parameters: Names of the rocket attributes, e.g. ["burnTime", "thrust"]
+    @param metrics: Names of the metrics, e.g. ["apogee", "max_velocity"]
+    @return: Array of the parameters with shape (number of rockets, number of parameters) and array of the metrics with
+    shape (number of rockets, number of metrics)
+    """
+    points = []
+    values = []
+    for path in file_paths:
+        with h5py.File(path, "r") as hdf:
+            for name, group in hdf.items():
+                if not isinstance(group, h5py.Group) or "metrics" not in group:
+                    continue
+                dataset = group["metrics"]
+                columns = [col.decode() if isinstance(col, bytes) else col for col in dataset.attrs["columns"]]
+                metricValues = dataset[...]
+                points.append([float(group.attrs[parameter]) for parameter in parameters])
+                values.append([float(metricValues[columns.index(metric)]) for metric in metrics])
+    return np.array(points, dtype="float64").reshape(-1, len(parameters)), \
+        np.array(values, dtype="float64").reshape(-1, len(metrics))
+
+
+class GaussianProcess:
+    """! Gaussian process regression of a single output with a squared exponential kernel.
+    Every input dimension has its own length scale, the signal variance is one, as the outputs are normalised by the
+    surrogate. The length scales and the noise variance maximise the log marginal likelihood unless they are given.
+    """
+
+    def __init__(self, points: np.ndarray, values: np.ndarray, lengthScales: np.ndarray = None, noise: float = None):
+        """! Constructor, fits the process to the training data.
+        @param points: Training inputs of shape (number of points, number of dimensions)
+        @param values: Training outputs of shape (number of points,)
+        @param lengthScales: Length scales of the kernel, fitted if not given
+        @param noise: Noise variance, fitted together with the length scales if not given
+        """
+        self.points = points
+        self.values = values
+        if lengthScales is None or noise is None:
+            lengthScales, noise = self.optimise_hyperparameters()
+        self.length_scales = np.asarray(lengthScales, dtype="float64")
+        self.noise = float(noise)
+        self.factor = cho_factor(self.kernel(points, points) + (self.noise + 1e-10) * np.eye(len(points)))
+        self.alpha = cho_solve(self.factor, values)
+
+    def kernel(self, a: np.ndarray, b: np.ndarray, lengthScales: np.ndarray = None):
+        """! Evaluates the squared exponential kernel between two sets of points.
+        @param a: Points of shape (n, number of dimensions)
+        @param b: Points of shape (k, number of dimensions)
+        @param lengthScales: Length scales, defaults to the fitted ones
+        @return: Kernel matrix of shape (n, k)
+        """
+        if lengthScales is None:
+            lengthScales = self.length_scales
+        difference = (a[:, None, :] - b[None, :, :]) / lengthScales
+        return np.exp(-0.5 * np.sum(difference ** 2, axis=2))
+
+    def negative_log_likelihood(self, logParameters: np.ndarray):
+        """! Negative log marginal likelihood of the training data.
+        @param logParameters: Logarithms of the length scales followed by the logarithm of the noise variance
+        @return: Negative log marginal likelihood
+        """
+        lengthScales = np.exp(logParameters[:-1])
+        noise = np.exp(logParameters[-1])
+        matrix = self.kernel(self.points, self.points, lengthScales) + (noise + 1e-10) * np.eye(len(self.points))
+        try:
+            factor = cho_factor(matrix)
+        except np.linalg.LinAlgError:
+            return 1e10
+        alpha = cho_solve(factor, self.values)
+        return 0.5 * self.values @ alpha + np.sum(np.log(np.diag(factor[0])))
+
+    def optimise_hyperparameters(self):
+        """! Fits the length scales and the noise variance by maximising the log marginal likelihood.
+        @return: Length scales and noise variance
+        """
+        dimension = self.points.shape[1]
+        best = None
+        for start in (0.2, 0.5, 1.0):
+            result = minimize(self.negative_log_likelihood, np.log(np.r_[np.full(dimension, start), 1e-4]),
+                              method="L-BFGS-B", bounds=[(np.log(1e-2), np.log(1e2))] * dimension
+                              + [(np.log(1e-8), np.log(1.0))])
+            if best is None or result.fun < best.fun:
+                best = result
+        return np.exp(best.x[:-1]), float(np.exp(best.x[-1]))
+
+    def __call__(self, points: np.ndarray):
+        """! Returns the predicted mean at the given points."""
+        return self.kernel(points, self.points) @ self.alpha
+
+    def predict_std(self, points: np.ndarray):
+        """! Returns the predicted standard deviation at the given points."""
+        crossKernel = self.kernel(points, self.points)
+        variance = 1.0 - np.sum(crossKernel * cho_solve(self.factor, crossKernel.T).T, axis=1)
+        return np.sqrt(np.maximum(variance, 0.0))
+
+
+class Surrogate:
+    """! Surrogate model of rocket metrics over design parameters.
+    The inputs are scaled to the unit hypercube of the training data and the metrics to zero mean and unit standard
+    deviation. Either one RBF interpolator is fitted to all metrics, or one Gaussian process per metric, which also
+    predicts its own uncertainty. The error of the surrogate is estimated by k-fold cross validation when it is fitted.
+    """
+
+    def __init__(self,
+                 parameters: list,
+                 metrics: list,
+                 kind: str = "rbf",
+                 kernel: str = "thin_plate_spline",
+                 smoothing: float = 0.0,
+                 folds: int = 5):
+        """! Constructor of the surrogate.
+        @param parameters: Names of the input parameters
+        @param metrics: Names of the metrics
+        @param kind: "rbf" for radial basis function interpolation or "gp" for Gaussian process regression
+        @param kernel: Kernel of the RBF interpolator, see scipy.interpolate.RBFInterpolator
+        @param smoothing: Smoothing of the RBF interpolator, defaults to 0 (interpolating)
+        @param folds: Number of folds of the cross validation
+        """
+        if kind not in ("rbf", "gp"):
+            raise ValueError(f"Error: Unknown surrogate kind '{kind}', use 'rbf' or 'gp'")
+        self.parameters = list(parameters)
+        self.metrics = list(metrics)
+        self.kind = kind
+        self.kernel = kernel
+        self.smoothing = smoothing
+        self.folds = folds
+        self.models = None
+        self.cv_residuals = None
+        self.cv_error = None
+
+    def fit(self, points: np.ndarray, values: np.ndarray, crossValidate: bool = True, hyperparameters: list = None):
+        """! Fits the surrogate to training data.
+        @param points: Parameters of the training designs, shape (number of designs, number of parameters)
+        @param values: Metrics of the training designs, shape (number of designs, number of metrics)
+        @param crossValidate: Estimate the error by cross validation, defaults to True
+        @param hyperparameters: Length scales and noise variance per metric of a Gaussian process, fitted if not given
+        @return: The surrogate itself
+        """
+        self.points = np.asarray(points, dtype="float64").reshape(len(points), len(self.parameters))
+        self.values = np.asarray(values, dtype="float64").reshape(len(values), len(self.metrics))
+        self.lower = self.points.min(axis=0)
+        self.span = self.points.max(axis=0) - self.lower
+        self.span[self.span == 0] = 1.0
+        self.mean = self.values.mean(axis=0)
+        self.std = self.values.std(axis=0)
+        self.std[self.std == 0] = 1.0
+        self.models = self._fit_models(self.scale_points(self.points), (self.values - self.mean) / self.std,
+                                       hyperparameters)
+        if crossValidate:
+            self.cross_validate()
+        return self
+
+    def _fit_models(self, points: np.ndarray, values: np.ndarray, hyperparameters: list = None):
+        """! Fits the models to scaled training data.
+        @return: List with one RBF interpolator, or one Gaussian process per metric
+        """
+        if self.kind == "rbf":
+            return [RBFInterpolator(points, values, kernel=self.kernel, smoothing=self.smoothing)]
+        if hyperparameters is None:
+            hyperparameters = [(None, None)] * values.shape[1]
+        return [GaussianProcess(points, values[:, i], *hyperparameters[i]) for i in range(values.shape[1])]
+
+    def _predict_scaled(self, models: list, points: np.ndarray):
+        """! Predicts the normalised metrics at scaled points."""
+        if self.kind == "rbf":
+            return models[0](points)
+        return np.column_stack([model(points) for model in models])
+
+    def scale_points(self, points: np.ndarray):
+        """! Scales parameters to the unit hypercube of the training data."""
+        return (np.asarray(points, dtype="float64").reshape(-1, len(self.parameters)) - self.lower) / self.span
+
+    def predict(self, points: np.ndarray):
+        """! Predicts the metrics of designs.
+        @param points: Parameters of the designs, shape (number of designs, number of parameters)
+        @return: Predicted metrics, shape (number of designs, number of metrics)
+        """
+        if self.models is None:
+            raise ValueError("Error: The surrogate has to be fitted before it can predict")
+        return self._predict_scaled(self.models, self.scale_points(points)) * self.std + self.mean
+
+    def predict_std(self, points: np.ndarray):
+        """! Predicts the standard deviation of the metrics of designs, only available for Gaussian processes.
+        @param points: Parameters of the designs, shape (number of designs, number of parameters)
+        @return: Predicted standard deviations, shape (number of designs, number of metrics)
+        """
+        if self.kind != "gp":
+            raise ValueError("Error: Only Gaussian process surrogates predict their uncertainty")
+        scaled = self.scale_points(points)
+        return np.column_stack([model.predict_std(scaled) for model in self.models]) * self.std
+
+    def predict_table(self, table):
+        """! Predicts the metrics of the designs of a swarm table, the parameters are read from its columns.
+        @param table: SwarmTable with a column for every parameter of the surrogate
+        @return: Dict of metric name and array of predictions
+        """
+        prediction = self.predict(np.column_stack([table[parameter] for parameter in self.parameters]))
+        return {metric: prediction[:, i] for i, metric in enumerate(self.metrics)}
+
+    def get_hyperparameters(self):
+        """! Returns the length scales and noise variance per metric of a Gaussian process surrogate."""
+        if self.kind != "gp":
+            return None
+        return [(model.length_scales, model.noise) for model in self.models]
+
+    def cross_validate(self):
+        """! Estimates the error of the surrogate by k-fold cross validation.
+        Every fold is predicted by a model fitted to the other folds, Gaussian processes keep their fitted
+        hyperparameters. The residuals are stored in cv_residuals, the root mean square residuals relative to the
+        standard deviation of the metrics in cv_error.
+        @return: Dict of metric name and relative cross validation error
+        """
+        points = self.scale_points(self.points)
+        values = (self.values - self.mean) / self.std
+        folds = np.array_split(np.random.default_rng(0).permutation(len(points)), min(self.folds, len(points)))
+        residuals = np.zeros_like(values)
+        for fold in folds:
+            train = np.setdiff1d(np.arange(len(points)), fold)
+            models = self._fit_models(points[train], values[train], self.get_hyperparameters())
+            residuals[fold] = self._predict_scaled(models, points[fold]) - values[fold]
+        self.cv_residuals = residuals * self.std
+        self.cv_error = dict(zip(self.metrics, np.sqrt(np.mean(residuals ** 2, axis=0)).tolist()))
+        return self.cv_error
+
+    def save(self, path: str):
+        """! Saves the training data and settings of the surrogate to a npz file.
+        The models are refitted from the training data on loading, the hyperparameters of Gaussian processes are kept.
+        @param path: Path of the file
+        """
+        data = {"parameters": np.array(self.parameters),
+                "metrics": np.array(self.metrics),
+                "kind": self.kind,
+                "kernel": self.kernel,
+                "smoothing": self.smoothing,
+                "folds": self.folds,
+                "points": self.points,
+                "values": self.values}
+        if self.cv_error is not None:
+            data["cv_error"] = np.array([self.cv_error[metric] for metric in self.metrics])
+            data["cv_residuals"] = self.cv_residuals
+        if self.kind == "gp":
+            data["length_scales"] = np.array([model.length_scales for model in self.models])
+            data["noise"] = np.array([model.noise for model in self.models])
+        np.savez(path, **data)
+
+    @classmethod
+    def load(cls, path: str):
+        """! Loads a surrogate saved with save.
+        @param path: Path of the file
+        @return: Fitted Surrogate
+        """
+        with np.load(path) as data:
+            surrogate = cls(data["parameters"].tolist(), data["metrics"].tolist(), str(data["kind"]),
+                            str(data["kernel"]), float(data["smoothing"]), int(data["folds"]))
+            hyperparameters = None
+            if surrogate.kind == "gp":
+                hyperparameters = list(zip(data["length_scales"], data["noise"]))
+            surrogate.fit(data["points"], data["values"], crossValidate=False, hyperparameters=hyperparameters)
+            if "cv_error" in data:
+                surrogate.cv_error = dict(zip(surrogate.metrics, data["cv_error"].tolist()))
+                surrogate.cv_residuals = data["cv_residuals"]
+        return surrogate
+
+    @classmethod
+    def from_hdf5(cls, *file_paths, parameters: list, metrics: list, **kwargs):
+        """! Fits a surrogate to the simulated rockets of results files, see read_training_data.
+        @param file_paths: Paths of the HDF5 results files
+        @param parameters: Names of the rocket attributes used as inputs
+        @param metrics: Names of the metrics
+        @param kwargs: Further arguments of the constructor, e.g. kind
+        @return: Fitted Surrogate
+        """
+        points, values = read_training_data(*file_paths, parameters=parameters, metrics=metrics)
+        return cls(parameters, metrics, **kwargs).fit(points, values)
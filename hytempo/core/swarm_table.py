@@ -0,0 +1,147 @@
+import numpy as np
+
+
+class SwarmTable:
+    """! Struct of arrays holding the designs of a swarm.
+    Every sampled and derived parameter of the designs is a column, a numpy array with one value per design. Tables
+    are sliced and filtered without copying rocket objects, written to the results file as a single dataset and
+    rockets are only built for single designs on request. The settings hold the values shared by all designs, e.g.
+    the propellants and the component list the factory builds the rockets with.
+    """
+
+    def __init__(self, columns: dict, settings: dict = None):
+        """! Constructor of the swarm table.
+        @param columns: Dict of column name and array of values, all columns must have the same length
+        @param settings: Dict of values shared by all designs, defaults to an empty dict
+        """
+        self.columns = {name: np.atleast_1d(np.asarray(values)) for name, values in columns.items()}
+        lengths = {len(values) for values in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("Error: All columns of a swarm table must have the same length")
+        self.settings = dict(settings) if settings is not None else {}
+
+    def __len__(self):
+        """! Returns the number of designs in the table."""
+        if not self.columns:
+            return 0
+        return len(next(iter(self.columns.values())))
+
+    def __contains__(self, name: str):
+        """! Checks if the table has a column of the given name."""
+        return name in self.columns
+
+    def __getitem__(self, key):
+        """! Returns a column for a column name, otherwise the designs selected by the key, see select.
+        @param key: Column name, index, slice, array of indices or boolean mask
+        @return: Column array or SwarmTable
+        """
+        if isinstance(key, str):
+            return self.columns[key]
+        return self.select(key)
+
+    def get_column_names(self):
+        """! Returns the names of the columns.
+        @return: List of column names
+        """
+        return list(self.columns.keys())
+
+    def set_column(self, name: str, values):
+        """! Adds or replaces a column.
+        @param name: Name of the column
+        @param values: Array of values, one per design
+        """
+        values = np.atleast_1d(np.asarray(values))
+        if self.columns and len(values) != len(self):
+            raise ValueError(f"Error: The column {name} has {len(values)} values, the table has {len(self)} designs")
+        self.columns[name] = values
+
+    def select(self, index):
+        """! Returns the designs selected by an index, slice, array of indices or boolean mask as a new table.
+        Slices are views of the columns, the settings are shared with this table.
+        @param index: Index, slice, array of indices or boolean mask
+        @return: SwarmTable with the selected designs
+        """
+        if isinstance(index, (int, np.integer)):
+            index = [index]
+        return SwarmTable({name: values[index] for name, values in self.columns.items()}, self.settings)
+
+    def filter(self, mask):
+        """! Returns the designs for which the mask is True as a new table.
+        @param mask: Boolean array with one value per design, or a function of the table returning such an array
+        @return: SwarmTable with the selected designs
+        """
+        if callable(mask):
+            mask = mask(self)
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (len(self),):
+            raise ValueError("Error: The mask must have one value per design")
+        return self.select(mask)
+
+    def concatenate(self, other: "SwarmTable"):
+        """! Returns a new table with the designs of this table followed by the designs of another table.
+        @param other: SwarmTable with the same columns
+        @return: SwarmTable with the designs of both tables
+        """
+        if set(other.columns) != set(self.columns):
+            raise ValueError("Error: Only swarm tables with the same columns can be concatenated")
+        return SwarmTable({name: np.concatenate((values, other.columns[name]))
+                           for name, values in self.columns.items()}, self.settings)
+
+    def row(self, index: int):
+        """! Returns the parameters of a single design.
+        @param index: Index of the design
+        @return: Dict of column name and value
+        """
+        return {name: values[index].item() for name, values in self.columns.items()}
+
+    def to_array(self, names: list = None):
+        """! Returns columns as a 2D array with one row per design.
+        @param names: Names of the columns, defaults to all columns
+        @return: Array of shape (number of designs, number of columns)
+        """
+        if names is None:
+            names = self.get_column_names()
+        return np.column_stack([self.columns[name] for name in names]).astype("float64")
+
+    def to_hdf5(self, hdf_file, name: str = "swarm_table"):
+        """! Writes the table as a dataset with a columns attribute, like the state datasets of the Observer.
+        Settings of type bool, int, float or str and numeric arrays or tuples are written as attributes of the dataset,
+        others, e.g. component objects, are skipped.
+        The dataset is placed at the top level of the file and does not count as a rocket group.
+        @param hdf_file: Open HDF5 file or group
+        @param name: Name of the dataset, an existing dataset of that name is replaced
+        """
+        if name in hdf_file:
+            del hdf_file[name]
+        dataset = hdf_file.create_dataset(name, data=self.to_array(), maxshape=(None, len(self.columns)))
+        dataset.attrs["columns"] = self.get_column_names()
+        for key, value in self.settings.items():
+            if isinstance(value, (bool, int, float, str, np.number, np.bool_)):
+                dataset.attrs[key] = value
+            elif isinstance(value, (tuple, np.ndarray)) and np.issubdtype(np.asarray(value).dtype, np.number):
+                dataset.attrs[key] = np.asarray(value)
+
+    @classmethod
+    def from_hdf5(cls, hdf_file, name: str = "swarm_table", settings: dict = None):
+        """! Reads a table written with to_hdf5.
+        @param hdf_file: Open HDF5 file or group
+        @param name: Name of the dataset
+        @param settings: Settings that could not be written to the file, e.g. the component list, defaults to None
+        @return: SwarmTable
+        """
+        dataset = hdf_file[name]
+        values = dataset[...]
+        columns = [c.decode("utf-8") if isinstance(c, bytes) else str(c) for c in dataset.attrs["columns"]]
+        stored_settings = {key: (value.decode("utf-8") if isinstance(value, bytes) else value)
+                           for key, value in dataset.attrs.items() if key != "columns"}
+        if settings is not None:
+            stored_settings.update(settings)
+        return cls({column: values[:, i] for i, column in enumerate(columns)}, stored_settings)
+
+    def materialise(self, index: int, factory):
+        """! Builds the rocket of a single design.
+        @param index: Index of the design
+        @param factory: Rocket factory that sized the table
+        @return: Rocket object
+        """
+        return factory.build_from_table(self, index)
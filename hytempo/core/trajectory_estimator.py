@@ -1,79 +1,233 @@
 # from math import cos, radians, sin
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import h5py
 import numpy as np
 import pandas as pd
-from scipy.integrate import solve_ivp, LSODA
-from hytempo.core.data_handling import count_top_level_groups,Observer
-from hytempo.core import rocket
+from scipy.integrate import BDF, DOP853, LSODA, RK23, RK45, Radau, solve_ivp
+from scipy.optimize import brentq
+from hytempo.core.data_handling import count_top_level_groups,GroupBlock,HDF5Writer,Observer,OutputPolicy
+from hytempo.core import batch_estimator, rocket
+
+
+# Solvers that can be chosen for the flight phases
+SOLVERS = {"RK23": RK23, "RK45": RK45, "DOP853": DOP853, "LSODA": LSODA, "Radau": Radau, "BDF": BDF}
+
+# Default solver settings of the flight phases
+DEFAULT_PHASE_SETTINGS = {
+    # short phase with the rocket constrained to the rail, small steps resolve the rail exit velocity
+    "rail": {"method": "RK45", "max_step": 0.05, "rtol": 1e-6, "atol": 1e-6},
+    # burn with changing mass and thrust, tight step size control
+    "powered": {"method": "LSODA", "max_step": np.inf, "rtol": 1e-6, "atol": 1e-6},
+    # unpowered flight up to the apogee, smooth enough for a cheap explicit scheme with large steps
+    "coast": {"method": "RK23", "max_step": np.inf, "rtol": 1e-5, "atol": 1e-3},
+    # unpowered flight from the apogee to the ground
+    "descent": {"method": "RK23", "max_step": np.inf, "rtol": 1e-5, "atol": 1e-3},
+}
 
 
 class TrajectoryEstimator:
-    def __init__(self, rocket: rocket.Rocket, hdf_file,rail_tip_off_angle=20.0):
+    def __init__(self, rocket: rocket.Rocket, hdf_file,rail_tip_off_angle=20.0,
+                 phase_settings: dict = None, t_bound=400, output_policy: OutputPolicy = None,
+                 metric_reducers: list = None):
         """!Constructor for the trajectory estimator.
         @param rocket: Rocket object.
-        @param fullreadout: Boolean to determine whether the full readout of
-        the trajectory should be saved.
+        @param hdf_file: Open HDF5 file the trajectory is written to, or an HDF5Writer. With a writer the trajectory is
+        recorded into an in-memory file and handed to the writer as one block at the end of the integration, also if it
+        fails.
+        @param rail_tip_off_angle: Rail tip off angle in degrees.
+        @param phase_settings: Dict of solver settings per flight phase ("rail", "powered", "coast", "descent"), each a dict
+        with the keys "method", "max_step", "rtol" and "atol". Given keys override DEFAULT_PHASE_SETTINGS.
+        @param t_bound: Maximum flight time in s.
+        @param output_policy: Output policy of the Observer, e.g. OutputInterval, defaults to every accepted step. The
+        metrics are computed from every accepted step with every policy.
+        @param metric_reducers: Additional MetricReducers of the Observer, their metrics are written with the default ones.
         """
         self.rocket = rocket
-        self.observer = Observer(hdf_file,rocket)
         self.filename = hdf_file.filename
+        self.writer = None
+        if isinstance(hdf_file, HDF5Writer):
+            self.writer = hdf_file
+            hdf_file = h5py.File(f"trajectory_{id(self)}.h5", "w", driver="core", backing_store=False)
+        self.observer = Observer(hdf_file,rocket,outputPolicy=output_policy,
+                                 metricReducers=metric_reducers)
+        # name of the rocket group in the results file, assigned by the writer when the block is submitted
+        self.group_name = None if self.writer else self.observer.rocket_group_name
         self.rail_tip_off_angle = rail_tip_off_angle
+        self.t_bound = t_bound
+        self.phase_settings = {phase: dict(settings) for phase, settings in DEFAULT_PHASE_SETTINGS.items()}
+        if phase_settings is not None:
+            for phase, settings in phase_settings.items():
+                if phase not in self.phase_settings:
+                    raise ValueError(f"Error: Unknown flight phase '{phase}'")
+                self.phase_settings[phase].update(settings)
+        self.phase_times = {}
+        self.nfev = 0
 
-    def integrate_trajectory(self):
+    def integrate_trajectory(self, mode: str = "full"):
         """! Integrate the trajectory of the rocket.
-        @return: Trajectory of the rocket in the format of [x,y,v_x,v_y]."""
-        "Define event function to stop integration when rocket hits the ground"
-
-        def hit_ground(t, y):
-            return y[1]
-
-        hit_ground.terminal = True
-        hit_ground.direction = -1
-
-        # Solve trajectory using Scipy's LSODA funtion for manual timestepping
-        solver = LSODA(fun=self.compute_right_hand_side,
-                       t0=0,
-                       t_bound=400,
-                       y0=np.array([0,0,0,0]),
-                       max_step=0.1
-                       )
+        The flight is split into the phases rail, powered ascent, coast and descent, which are separated by the events rail
+        exit, burnout and apogee. Every phase is integrated by its own solver with its own settings, events are located
+        as zero crossings on the dense output of the step and the next solver is started at the event.
+        The right hand side is free of side effects, the state of the rocket is only committed for accepted steps.
+        @param mode: "full" integrates the flight down to the ground, "ascent" stops at the apogee, which is located as the
+        zero crossing of v_y. The metrics are written in both modes, apogee, max. velocity and max. Mach number are
+        reached during the ascent.
+        If the integration raises, the rocket group is kept without metrics, in the file as well as with a writer.
+        @return: Trajectory of the rocket in the format of [x,y,v_x,v_y,fluid masses of the tanks]."""
+        if mode not in ("full", "ascent"):
+            raise ValueError(f"Error: Unknown integration mode '{mode}', use 'full' or 'ascent'")
+        if self.writer is None:
+            return self._integrate_trajectory(mode)
+        scratch = self.observer.file
+        try:
+            return self._integrate_trajectory(mode)
+        finally:
+            # hand the rocket group to the writer, a failed rocket is submitted without metrics like in a file
+            self.group_name = self.writer.submit(GroupBlock.from_group(scratch[self.observer.rocket_group_name]))
+            scratch.close()
 
+    def _integrate_trajectory(self, mode: str):
+        """! Integrates the trajectory as described in integrate_trajectory and writes the metrics."""
         # Initialize solution lists
         t = []
         y = []
 
+        t_step = 0
+        y_step = self.rocket.get_state_vector()
+        self.rocket.commit_state(t_step, y_step)
+        phase = self._get_phase()
+        self.phase_times = {phase: t_step}
+        solver = self._create_solver(phase, t_step, y_step)
+        events = self._get_events(phase, mode)
+
         while solver.status == "running":
-            # Check if the rocket has left the rail in the last step
-            if self.rocket.state["onRail"] and self.rocket.state["y"] > self.rocket.rail_height:
-                # Disconnect the rocket from the rail
-                self.rocket.state["onRail"] = False
-                
-                # apply the rail tip off angle to the rocket
-                #new_angle = self.rocket.state["angle"] - self.rail_tip_off_angle
-                #rocket_speed = np.sqrt(solver.y[2] ** 2 + solver.y[3] ** 2)
-                #solver._lsoda_solver._y[2] = rocket_speed * np.cos(np.radians(new_angle))
-                #solver._lsoda_solver._y[3] = rocket_speed * np.sin(np.radians(new_angle))
             # perform the next step of the solver
+            t_old = solver.t
+            y_old = solver.y.copy()
             solver.step()
-
-            # Check, if rocket hit the ground
-            if solver.y[1] < 0:
+            if solver.status == "failed":
+                print(f"Warning: The solver failed in the {phase} phase: {solver.message}")
                 break
 
+            # Check, if an event occured in the last step
+            event, t_step, y_step = self._locate_event(events, solver, t_old, y_old)
+
             # Append current solution to solution list
-            t.append(solver.t)
-            y.append(solver.y)
+            t.append(t_step)
+            y.append(y_step)
+
+            # Record the states the output policy samples from the dense output of the step
+            sample_times = self.observer.policy.sample_times(t_old, t_step)
+            if len(sample_times):
+                dense_output = solver.dense_output()
+                for t_sample in sample_times:
+                    self.rocket.compute_right_hand_side(t_sample, dense_output(t_sample))
+                    self.observer.record()
 
-            # Update the observer with the current state
+            # Commit the accepted step and update the observer with the current state
+            self.rocket.commit_state(t_step, y_step)
+            if event == "rail_exit":
+                # the located event is the first state off the rail, whichever side of the rail height y ends on
+                self.rocket.leave_rail()
             self.observer.pull_updates()
 
+            if event is not None:
+                # Stop the integration when the rocket hits the ground or at the apogee in ascent mode
+                if event == "ground" or (event == "apogee" and mode == "ascent"):
+                    break
+                # continue with the solver of the next phase, the descent starts at the apogee
+                phase = "descent" if event == "apogee" else self._get_phase()
+                self.phase_times.setdefault(phase, t_step)
+                self.nfev += solver.nfev
+                solver = self._create_solver(phase, t_step, y_step)
+                events = self._get_events(phase, mode)
+        self.nfev += solver.nfev
+
         # Assemble solution data into trajectory
         trajectory = (np.array(t), np.array(y))
 
         # Export metrics from the hdf
         self.observer.calculateMetrics()
-
         return trajectory
 
+    def _get_phase(self):
+        """! Determine the flight phase from the committed state of the rocket.
+        @return: Name of the flight phase."""
+        if self.rocket.state["onRail"]:
+            return "rail"
+        if self.rocket.state["thrust"] > 0:
+            return "powered"
+        if self.rocket.state["v_y"] > 0:
+            return "coast"
+        return "descent"
+
+    def _get_events(self, phase: str, mode: str = "full"):
+        """! Assemble the events that end a flight phase.
+        @param phase: Name of the flight phase.
+        @param mode: Integration mode, in ascent mode the apogee is also watched during the powered phase.
+        @return: List of events as (name, event function, direction, index of an emptied fluid mass in the state vector)."""
+        events = [("ground", lambda t, y: y[1], -1, None)]
+        if phase == "rail":
+            rail_height = self.rocket.rail_height
+            events.append(("rail_exit", lambda t, y: y[1] - rail_height, 1, None))
+        # a tank can still hold fluid after the engine stopped, e.g. the other propellant or the pressurant
+        for k, tank in enumerate(self.rocket.tank_list):
+            if not tank.empty:
+                events.append(("burnout", lambda t, y, k=k: y[4 + k], -1, 4 + k))
+        if phase == "coast" or (phase == "powered" and mode == "ascent"):
+            events.append(("apogee", lambda t, y: y[3], -1, None))
+        return events
+
+    def _create_solver(self, phase: str, t0: float, y0: np.ndarray):
+        """! Create the solver for a flight phase, starting from the given state.
+        @param phase: Name of the flight phase.
+        @param t0: Initial time.
+        @param y0: Initial state vector.
+        @return: Solver object."""
+        settings = self.phase_settings[phase]
+        return SOLVERS[settings["method"]](fun=self.compute_right_hand_side,
+                                           t0=t0,
+                                           t_bound=self.t_bound,
+                                           y0=y0,
+                                           max_step=settings["max_step"],
+                                           rtol=settings["rtol"],
+                                           atol=settings["atol"]
+                                           )
+
+    def _locate_event(self, events: list, solver, t_old: float, y_old: np.ndarray):
+        """! Locate the first event within the last step of the solver.
+        @param events: List of events as returned by _get_events.
+        @param solver: Solver that has just performed the step.
+        @param t_old: Time at the start of the step.
+        @param y_old: State vector at the start of the step.
+        @return: Name, time and state vector of the first event, or None and the end of the step if no event occured."""
+        dense_output = None
+        event_times = {}
+        for i, (name, function, direction, _) in enumerate(events):
+            g_old = direction * function(t_old, y_old)
+            g_new = direction * function(solver.t, solver.y)
+            # the event function crosses zero in the given direction
+            if g_old <= 0 < g_new:
+                if dense_output is None:
+                    dense_output = solver.dense_output()
+                event_times[i] = locate_root(lambda time: function(time, dense_output(time)), t_old, solver.t)
+        if not event_times:
+            return None, solver.t, solver.y
+
+        first = min(event_times, key=event_times.get)
+        t_event = event_times[first]
+        y_event = dense_output(t_event)
+        for i, event_time in event_times.items():
+            # tanks with the same burn time are emptied together
+            if events[i][3] is not None and event_time - t_event <= 1e-9 * max(1, t_event):
+                y_event[events[i][3]] = 0
+        return events[first][0], t_event, y_event
+
     def get_apogee(self, trajectory) -> float:
         """!Get the apogee of the rocket.
         @param trajectory: trajectory of the rocket.
@@ -93,23 +247,21 @@ class TrajectoryEstimator:
     ):
         """!Compute the right hand side of the ODE.
         @param time: Time of the simulation.
-        @param position_and_velocity: Position and velocity of the rocket.
-        @return: Right hand side of the ODE in the format of [v_x,v_y,a_x,a_y].
+        @param position_and_velocity: State vector of the rocket in the format of [x,y,v_x,v_y,fluid masses of the tanks].
+        @return: Right hand side of the ODE in the format of [v_x,v_y,a_x,a_y,fluid mass derivatives of the tanks].
         """
         "Compute the right hand side of the ODE using the rocket object."
         current_state = self.rocket.compute_right_hand_side(
             time, position_and_velocity
         )
 
-        "Return the right hand side of the ODE."
-        return np.array(
-            [
-                current_state["v_x"],
-                current_state["v_y"],
-                current_state["a_x"],
-                current_state["a_y"],
-            ]
-        )
+        "Return the right hand side of the ODE, v_x, v_y, a_x and a_y are adjacent in the state of the rocket."
+        # the solvers keep the returned arrays, so every evaluation needs its own
+        derivative = np.empty(position_and_velocity.size)
+        derivative[:4] = current_state.array[self.rocket.derivative_span]
+        for k, tank in enumerate(self.rocket.tank_list):
+            derivative[4 + k] = -tank.get_massflow()
+        return derivative
 
 
     def export_readout(self, path, name="export"):
@@ -153,3 +305,167 @@ class TrajectoryEstimator:
         for column in readout_df.columns:
             readout_group.create_dataset(column, data=readout_df[column].values)
     
+
+
+def run_swarm(rockets,
+              hdf_file: h5py.File,
+              workers: int = None,
+              chunk_size: int = None,
+              link_shards: bool = False,
+              batch: bool = False,
+              estimator_kwargs: dict = None,
+              mode: str = "full",
+              max_pending: int = None):
+    """! Simulates a swarm of rockets on a pool of worker processes.
+    The rockets are split into chunks, every chunk is simulated by one worker into its own shard file with the Observer layout.
+    The shards are merged into the given results file in the order of the rockets as soon as they are finished, either by
+    copying the rocket groups or by linking them as HDF5 external links. The rockets are consumed chunk by chunk with at
+    most max_pending chunks in the pool, so an iterator like the one of iter_swarm is simulated in bounded memory.
+    @param rockets: List or iterable of Rocket objects, e.g. the list returned by build_swarm or the iterator of iter_swarm.
+    @param hdf_file: Open HDF5 results file, readable by the plotters afterwards, or an HDF5Writer. With a writer the
+    workers simulate into memory and return the rocket groups as blocks, which the writer thread writes into its file,
+    so no shard files are written.
+    @param workers: Number of worker processes, defaults to the number of CPUs.
+    @param chunk_size: Number of rockets per shard, defaults to four chunks per worker for lists and 16 for iterators.
+    @param link_shards: If True, the shards are kept next to the results file and linked instead of copied.
+    @param batch: If True, every chunk is integrated at once with the BatchTrajectoryEstimator.
+    @param estimator_kwargs: Keyword arguments passed on to the estimator of each rocket or chunk.
+    @param mode: Integration mode, "full" or "ascent".
+    @param max_pending: Maximum number of chunks submitted to the pool at a time, defaults to two per worker.
+    @return: Names of the rocket groups in the results file.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    if chunk_size is None:
+        if hasattr(rockets, "__len__"):
+            chunk_size = max(1, int(np.ceil(len(rockets) / (4 * workers))))
+        else:
+            chunk_size = 16
+    if max_pending is None:
+        max_pending = 2 * workers
+    if estimator_kwargs is None:
+        estimator_kwargs = {}
+
+    use_writer = isinstance(hdf_file, HDF5Writer)
+    # shards are written into a directory next to the results file
+    shard_dir = os.path.splitext(hdf_file.filename)[0] + "_shards"
+    if not use_writer:
+        os.makedirs(shard_dir, exist_ok=True)
+
+    print(f"Simulating rockets in shards of {chunk_size} on {workers} workers...")
+    rocket_iterator = iter(rockets)
+    pending = deque()
+    group_names = []
+    n_shards = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            chunk = list(islice(rocket_iterator, chunk_size))
+            if chunk:
+                shard_path = os.path.join(shard_dir, f"shard_{n_shards}.h5")
+                n_shards += 1
+                if use_writer:
+                    pending.append((None, executor.submit(simulate_blocks, chunk, batch, estimator_kwargs, mode)))
+                else:
+                    pending.append((shard_path, executor.submit(simulate_shard, chunk, shard_path, batch,
+                                                                estimator_kwargs, mode)))
+            # the oldest shard is merged first, so the rockets are merged in the order of the rocket list
+            while pending and (len(pending) >= max_pending or not chunk):
+                shard_path, future = pending.popleft()
+                if use_writer:
+                    group_names += [hdf_file.submit(block) for block in future.result()]
+                else:
+                    group_names += merge_shard(hdf_file, shard_path, future.result(), link_shards)
+            if not chunk:
+                break
+    if not link_shards and not use_writer:
+        shutil.rmtree(shard_dir)
+    return group_names
+
+
+def merge_shard(hdf_file: h5py.File, shard_path: str, shard_size: int, link_shards: bool = False):
+    """! Merges the rocket groups of a shard into the results file, numbering them after the groups already in the file.
+    Copied shards are deleted afterwards.
+    @param hdf_file: Open HDF5 results file.
+    @param shard_path: Path of the shard file.
+    @param shard_size: Number of rocket groups in the shard.
+    @param link_shards: If True, the groups are linked as HDF5 external links instead of copied.
+    @return: Names of the merged rocket groups in the results file.
+    """
+    group_names = []
+    with h5py.File(shard_path, "r") as shard:
+        for i in range(shard_size):
+            group_name = f"rocket {str(count_top_level_groups(hdf_file))}"
+            if link_shards:
+                hdf_file[group_name] = h5py.ExternalLink(os.path.abspath(shard_path), f"rocket {i}")
+            else:
+                shard.copy(shard[f"rocket {i}"], hdf_file, name=group_name)
+            group_names.append(group_name)
+    if not link_shards:
+        os.remove(shard_path)
+    return group_names
+
+
+def simulate_shard(rockets: list, shard_path: str, batch: bool = False, estimator_kwargs: dict = None,
+                   mode: str = "full"):
+    """! Simulates a chunk of rockets into its own shard file. This is the task executed by the workers of run_swarm.
+    @param rockets: List of Rocket objects.
+    @param shard_path: Path of the shard file.
+    @param batch: If True, the chunk is integrated at once with the BatchTrajectoryEstimator.
+    @param estimator_kwargs: Keyword arguments passed on to the estimator.
+    @param mode: Integration mode, "full" or "ascent".
+    @return: Number of rocket groups written to the shard.
+    """
+    with h5py.File(shard_path, "w") as shard:
+        simulate_rockets(rockets, shard, batch, estimator_kwargs, mode)
+        return count_top_level_groups(shard)
+
+
+def simulate_rockets(rockets: list, hdf_file: h5py.File, batch: bool = False, estimator_kwargs: dict = None,
+                     mode: str = "full"):
+    """! Simulates a chunk of rockets into an open HDF5 file.
+    A failed simulation is reported and keeps its rocket group without metrics, so the groups are numbered like the
+    rockets and readers of the metrics find the failures by the missing metrics dataset.
+    @param rockets: List of Rocket objects.
+    @param hdf_file: Open HDF5 file.
+    @param batch: If True, the chunk is integrated at once with the BatchTrajectoryEstimator.
+    @param estimator_kwargs: Keyword arguments passed on to the estimator.
+    @param mode: Integration mode, "full" or "ascent".
+    """
+    if estimator_kwargs is None:
+        estimator_kwargs = {}
+    if batch:
+        batch_estimator.BatchTrajectoryEstimator(rockets, hdf_file, **estimator_kwargs).integrate_trajectories(mode)
+    else:
+        for indRocket in rockets:
+            sim = TrajectoryEstimator(indRocket, hdf_file, **estimator_kwargs)
+            try:
+                sim.integrate_trajectory(mode)
+            except Exception as e:
+                print(f"Simulation failed for rocket {indRocket.name}: {e}. Skipping...")
+
+
+def simulate_blocks(rockets: list, batch: bool = False, estimator_kwargs: dict = None, mode: str = "full"):
+    """! Simulates a chunk of rockets into memory. This is the task executed by the workers of run_swarm with a writer.
+    @param rockets: List of Rocket objects.
+    @param batch: If True, the chunk is integrated at once with the BatchTrajectoryEstimator.
+    @param estimator_kwargs: Keyword arguments passed on to the estimator.
+    @param mode: Integration mode, "full" or "ascent".
+    @return: List of GroupBlocks of the rocket groups.
+    """
+    with h5py.File(f"blocks_{os.getpid()}.h5", "w", driver="core", backing_store=False) as scratch:
+        simulate_rockets(rockets, scratch, batch, estimator_kwargs, mode)
+        return [GroupBlock.from_group(scratch[f"rocket {i}"]) for i in range(count_top_level_groups(scratch))]
+
+
+def locate_root(function, t_start: float, t_end: float):
+    """! Locate the zero crossing of a function of time within an interval.
+    @param function: Scalar function of time, e.g. an event function evaluated on the dense output of a step.
+    @param t_start: Start of the interval.
+    @param t_end: End of the interval.
+    @return: Time of the zero crossing. If the interpolated function does not change its sign, e.g. because the crossing
+    lies exactly on a boundary, the boundary closer to zero is returned."""
+    f_start = function(t_start)
+    f_end = function(t_end)
+    if f_start * f_end > 0 or f_start == 0 or f_end == 0:
+        return t_start if abs(f_start) <= abs(f_end) else t_end
+    return brentq(function, t_start, t_end)